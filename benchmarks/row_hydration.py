@@ -0,0 +1,56 @@
+import sys, os, time, tracemalloc
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from applications.airline.models import Route
+from orm import model, query as qr
+
+
+# Compares read path of dictionary cursor rows (dict per row with repeated keys copied
+# into ModelInstance kwargs) with tuple cursor rows hydrated by compiled query plan.
+# Cursor rows are generated locally, so no database connection is required.
+ROWS = 100000
+
+
+def make_query() -> dict:  # Route.select_related('departure_point') query parameters
+    return {
+        'args': (), 'kwargs': {}, 'order_by': [],
+        'annotate': {'args': (), 'kwargs': {}},
+        'select_related': ['departure_point'], 'prefetch_related': [],
+        'values': None, 'only': None, 'defer': []
+    }
+
+
+def measure(name: str, fetch, build) -> None:  # Allocated memory and time of fetched rows and instances
+    tracemalloc.start()
+    start = time.perf_counter()
+    rows = fetch()
+    fetched = tracemalloc.get_traced_memory()[0]
+    instances = build(rows)
+    elapsed = time.perf_counter() - start
+    total, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f'{name:<12} rows: {fetched / 2 ** 20:7.1f} MiB   rows + instances: {total / 2 ** 20:7.1f} MiB'
+        f'   peak: {peak / 2 ** 20:7.1f} MiB   time: {elapsed:6.2f} s'
+    )
+    del rows, instances
+
+
+if __name__ == '__main__':
+    plan = qr.compile_query(Route, make_query()).plan
+    names = [f'{path}__{name}' if path else name for path, name in plan.columns]
+
+    def row(i: int) -> tuple:  # Column values in plan order
+        return tuple(
+            i if name in ('id', 'departure_point', 'departure_point__id') else f'{name}-{i}'
+            for name in names
+        )
+    measure(
+        'dictionary',
+        lambda: [dict(zip(names, row(i))) for i in range(ROWS)],
+        lambda rows: [model.ModelInstance(Route, ['departure_point'], **r) for r in rows]
+    )
+    measure(
+        'tuple',
+        lambda: [row(i) for i in range(ROWS)],
+        lambda rows: [model.ModelInstance.hydrate(plan, r) for r in rows]
+    )
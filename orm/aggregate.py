@@ -14,6 +14,10 @@ class BaseBinaryOperableAggregate(ABC):
     ) -> tuple[list, str, str, int]:
         pass
 
+    @abstractmethod  # Hashable structure used as a part of compiled query key
+    def shape(self) -> tuple:
+        pass
+
     # Binary operations overload.
     def __add__(self, other):
         return AggregateOperationWrapper('+', 'add', self, other)
@@ -88,6 +92,12 @@ class AggregateOperationWrapper(BaseBinaryOperableAggregate):
         alias = f'___{self.__operation_alias}___'.join(alias)
         return joins, fields, alias, primary_join_index
 
+    def shape(self) -> tuple:
+        return (self.__operation,) + tuple(
+            aggregate.shape() if isinstance(aggregate, BaseBinaryOperableAggregate)
+            else aggregate for aggregate in self.__subset
+        )
+
 
 class BaseAggregate(BaseBinaryOperableAggregate):  # Base wrapper for SQL aggregate functions
     functions = ('MAX', 'MIN', 'AVG', 'COUNT', 'SUM')  # MySQL aggregate functions list
@@ -112,11 +122,15 @@ class BaseAggregate(BaseBinaryOperableAggregate):  # Base wrapper for SQL aggreg
         return (
             joins,
             f'''{self._function}({joins[-1]["alias"] if joins
-            else f"{model.table_name}00"}.{fnames[-1]})''',
+            else f"{model.table_name}0{annotate_join_index}"}.{fnames[-1]})''',
             f'{self._field_name}__{self._function.lower()}',
             primary_join_index
         )
 
+    def shape(self) -> tuple:
+        return type(self).__name__, self._field_name, self._function
+
+
 class Max(BaseAggregate):
     def __init__(self, field_name: str):
         super().__init__(field_name, 'MAX')
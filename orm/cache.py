@@ -0,0 +1,218 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+import functools
+import hashlib
+import math
+import pickle
+import sys
+import threading
+import time
+import re
+from . import connection as cn
+
+
+# Interface of query results cache. Results are stored by (SQL, parameters)
+# along with the tables query reads, writes to any of them invalidate results.
+# Snapshot of tables versions is taken before the read, so result read before
+# concurrent write but stored after its invalidation is refused.
+class BaseCache(ABC):
+    @abstractmethod  # Cached result or None if missing or expired
+    def get(self, key: tuple):
+        pass
+
+    @abstractmethod  # Versions of the tables given, taken before reading result
+    def snapshot(self, tables: frozenset):
+        pass
+
+    @abstractmethod  # Storing result for ttl seconds (until invalidated if ttl is None) unless tables changed
+    def set(self, key: tuple, value, ttl: float | None, tables: frozenset, snapshot) -> None:
+        pass
+
+    @abstractmethod  # Dropping results read from the tables given
+    def invalidate(self, *tables: str) -> None:
+        pass
+
+    @abstractmethod
+    def clear(self) -> None:
+        pass
+
+
+def sizeof(value) -> int:  # Approximate memory taken by fetched rows
+    size = sys.getsizeof(value)
+    if isinstance(value, (tuple, list)):
+        size += sum(sizeof(item) for item in value)
+    return size
+
+
+# In-process LRU cache bounded by number of results and their approximate memory.
+class LocalCache(BaseCache):
+    def __init__(self, maxsize: int=1024, max_bytes: int=64 * 2 ** 20):
+        self.__maxsize = maxsize
+        self.__max_bytes = max_bytes
+        self.__results = OrderedDict()  # key -> (value, expiration time, tables, size)
+        self.__tables = {}  # table -> keys of results reading it
+        self.__versions = {}  # table -> number of its invalidations
+        self.__epoch = 0  # Number of clear() calls
+        self.__bytes = 0
+        self.__lock = threading.Lock()
+        self.__hits = self.__misses = 0
+
+    def __drop(self, key: tuple) -> None:
+        _, _, tables, size = self.__results.pop(key)
+        self.__bytes -= size
+        for table in tables:
+            keys = self.__tables.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.__tables[table]
+
+    def get(self, key: tuple):
+        with self.__lock:
+            entry = self.__results.get(key)
+            if entry is None or (entry[1] is not None and entry[1] <= time.monotonic()):
+                if entry is not None:  # Expired
+                    self.__drop(key)
+                self.__misses += 1
+                return None
+            self.__results.move_to_end(key)
+            self.__hits += 1
+            return entry[0]
+
+    def snapshot(self, tables: frozenset) -> tuple:
+        with self.__lock:
+            return self.__epoch, tuple(self.__versions.get(table, 0) for table in sorted(tables))
+
+    def set(self, key: tuple, value, ttl: float | None, tables: frozenset, snapshot: tuple) -> None:
+        size = sizeof(value)
+        if size > self.__max_bytes:  # Result would evict everything else
+            return
+        with self.__lock:
+            if snapshot != (self.__epoch, tuple(self.__versions.get(table, 0) for table in sorted(tables))):
+                return  # Tables were written while result was read
+            if key in self.__results:
+                self.__drop(key)
+            self.__results[key] = (
+                value, time.monotonic() + ttl if ttl is not None else None, tables, size
+            )
+            self.__bytes += size
+            for table in tables:
+                self.__tables.setdefault(table, set()).add(key)
+            while len(self.__results) > self.__maxsize or self.__bytes > self.__max_bytes:
+                self.__drop(next(iter(self.__results)))  # Least recently used
+
+    def invalidate(self, *tables: str) -> None:
+        with self.__lock:
+            for table in tables:
+                self.__versions[table] = self.__versions.get(table, 0) + 1
+                for key in tuple(self.__tables.get(table, ())):
+                    self.__drop(key)
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__epoch += 1
+            self.__results.clear()
+            self.__tables.clear()
+            self.__bytes = 0
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'size': len(self.__results),
+            'bytes': self.__bytes,
+            'hits': self.__hits,
+            'misses': self.__misses
+        }
+
+
+# Results kept in external key-value store shared by processes (e.g. redis.Redis client).
+# Store must provide Redis-like get(key: str) -> bytes | None, set(key: str, value: bytes, ex: int | None=None)
+# taking expiration in whole seconds and atomic incr(key: str) -> int counting from 0 for missing keys
+# (other clients such as Memcached ones need an adapter). Tables are invalidated by incrementing their
+# generation which is a part of result keys, so stale results are never read again and expire by themselves.
+class StoreCache(BaseCache):
+    def __init__(self, store, prefix: str='orm'):
+        self.__store = store
+        self.__prefix = prefix
+
+    def __generation(self, table: str) -> int:
+        value = self.__store.get(f'{self.__prefix}:generation:{table}')
+        return int(value) if value is not None else 0
+
+    def __key(self, key: tuple, generations: tuple) -> str:
+        return f'{self.__prefix}:result:' + hashlib.sha1(pickle.dumps((key, generations))).hexdigest()
+
+    def get(self, key: tuple):
+        tables = self.__store.get(f'{self.__prefix}:tables:' + hashlib.sha1(pickle.dumps(key)).hexdigest())
+        if tables is None:
+            return None
+        value = self.__store.get(self.__key(key, self.snapshot(pickle.loads(tables))))
+        return pickle.loads(value) if value is not None else None
+
+    def snapshot(self, tables: frozenset) -> tuple:  # '*' generation is bumped by clear()
+        return tuple((table, self.__generation(table)) for table in ('*', *sorted(tables)))
+
+    def set(self, key: tuple, value, ttl: float | None, tables: frozenset, snapshot: tuple) -> None:
+        # Result is stored under generations it was read at, so it is never
+        # found if any of the tables was invalidated in the meantime
+        ex = max(1, math.ceil(ttl)) if ttl is not None else None  # Store expiration is set in whole seconds
+        self.__store.set(
+            f'{self.__prefix}:tables:' + hashlib.sha1(pickle.dumps(key)).hexdigest(), pickle.dumps(tables), ex=ex
+        )
+        self.__store.set(self.__key(key, snapshot), pickle.dumps(value), ex=ex)
+
+    def invalidate(self, *tables: str) -> None:
+        for table in tables:  # Atomic increment, concurrent writers never end up at the same generation
+            self.__store.incr(f'{self.__prefix}:generation:{table}')
+
+    def clear(self) -> None:  # Store entries are left to expire
+        self.invalidate('*')
+
+
+# Local stand-in for external key-value store (single process only).
+class MemoryStore:
+    def __init__(self):
+        self.__values = {}  # key -> (value, expiration time)
+        self.__lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self.__lock:
+            value, expires = self.__values.get(key, (None, None))
+            if expires is not None and expires <= time.monotonic():
+                del self.__values[key]
+                return None
+            return value
+
+    def set(self, key: str, value: bytes, ex: int | None=None) -> None:
+        with self.__lock:
+            self.__values[key] = (value, time.monotonic() + ex if ex is not None else None)
+
+    def incr(self, key: str) -> int:
+        with self.__lock:
+            value, expires = self.__values.get(key, (None, None))
+            if value is None or expires is not None and expires <= time.monotonic():
+                value, expires = b'0', None
+            value = int(value) + 1
+            self.__values[key] = (str(value).encode(), expires)
+            return value
+
+
+backend = LocalCache()  # Process-wide results cache used by QuerySet.cache()
+
+
+def configure(cache: BaseCache) -> None:  # Replacing results cache (e.g. StoreCache(redis_client))
+    global backend
+    if not isinstance(cache, BaseCache):
+        raise TypeError('Results cache must be BaseCache subclass instance.')
+    backend = cache
+
+
+@functools.lru_cache(maxsize=1024)
+def read_tables(sql: str) -> frozenset:  # Tables statement reads (derived tables are skipped)
+    return frozenset(re.findall(r'(?:FROM|JOIN) (\w+)', sql))
+
+
+def invalidate(*tables: str) -> None:  # Called by every write to the tables
+    backend.invalidate(*tables)
+    if cn.in_atomic():  # Results read by other threads before commit are dropped once transaction ends
+        cn.on_end(lambda: backend.invalidate(*tables))
@@ -0,0 +1,445 @@
+from mysql.connector import connect, Error
+from mysql.connector.errors import PoolError
+from contextlib import contextmanager, ContextDecorator
+from collections import deque, OrderedDict
+from .exceptions import TransactionError
+from . import session as ses
+import settings
+import threading
+import weakref
+import time
+import os
+
+
+# Per-connection LRU storage of server-side prepared statements.
+# Each statement is kept prepared on its own cursor, so executing
+# the same SQL again sends only parameters instead of query text.
+class StatementCache:
+    def __init__(self, connection, maxsize: int):
+        self.__connection = weakref.proxy(connection)  # Cache must not keep connection alive
+        self.__maxsize = maxsize
+        self.__cursors = OrderedDict()  # (sql, dictionary) -> (prepared cursor, sql)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def __close(cursor):  # Closing cursor deallocates its statement on server
+        try:
+            cursor.close()
+        except Error:
+            pass
+
+    def cursor(self, sql: str, dictionary: bool=False) -> tuple:  # Prepared cursor and SQL it was prepared for
+        key = (sql, dictionary)
+        statement = self.__cursors.get(key)
+        if statement is not None:
+            self.__cursors.move_to_end(key)
+            self.hits += 1
+            return statement
+        self.misses += 1
+        # Cursor re-prepares statement if SQL given is not the very same
+        # string object it executed last time, so SQL object is stored too
+        statement = self.__cursors[key] = (
+            self.__connection.cursor(prepared=True, dictionary=dictionary), sql
+        )
+        while len(self.__cursors) > max(self.__maxsize, 1):
+            self.__close(self.__cursors.popitem(last=False)[1][0])
+        return statement
+
+    def discard(self, sql: str, dictionary: bool=False) -> None:  # Dropping broken statement
+        statement = self.__cursors.pop((sql, dictionary), None)
+        if statement is not None:
+            self.__close(statement[0])
+
+    def __len__(self):
+        return len(self.__cursors)
+
+
+# Process-wide pool of MySQL connections.
+# Connections are reused between ORM operations instead of
+# being opened and torn down for every single statement.
+class ConnectionPool:
+    def __init__(
+            self,
+            db_data: dict,  # mysql.connector.connect() keyword arguments
+            size: int=5,  # Number of connections kept open while idle
+            max_overflow: int=10,  # Extra connections allowed above size under load
+            timeout: float=30.,  # Seconds to wait for a free connection on checkout
+            recycle: float=3600.,  # Seconds an idle connection may rest before being reopened
+            pre_ping: bool=True,  # Check connection health on checkout
+            prepared: bool=False,  # Execute ORM statements via server-side prepared statements
+            statement_cache_size: int=128  # Prepared statements kept per connection
+    ):
+        if size < 1 or max_overflow < 0:
+            raise ValueError(
+                'ConnectionPool size must be positive '
+                'and max_overflow must not be negative.'
+            )
+        self.__db_data = db_data
+        self.__size = size
+        self.__max_overflow = max_overflow
+        self.__timeout = timeout
+        self.__recycle = recycle
+        self.__pre_ping = pre_ping
+        self.__prepared = prepared
+        self.__statement_cache_size = statement_cache_size
+        self.__disposed = False  # Replaced pool closes connections given back instead of keeping them
+        self.__reset()
+
+    def __reset(self):  # (Re)initializing pool state (also used after fork)
+        self.__pid = os.getpid()  # Owner process id for fork detection
+        self.__lock = threading.Condition()
+        self.__idle = deque()  # (connection, idle since) pairs, most recently used last
+        self.__checked_out = 0  # Connections currently given away
+        self.__statements = weakref.WeakKeyDictionary()  # Connection -> StatementCache
+        self.__stats = {
+            'checkouts': 0,  # Successful checkouts
+            'waits': 0,  # Checkouts that had to wait for a free connection
+            'timeouts': 0,  # Checkouts failed due to timeout
+            'connects': 0,  # New connections opened
+            'recycled': 0,  # Idle connections closed due to recycle time
+            'invalidated': 0  # Connections failed health check
+        }
+
+    def __check_fork(self):  # Connections must not be shared with the parent process
+        if self.__pid != os.getpid():
+            # Sockets belong to the parent, so dropping them without
+            # closing not to send QUIT command over the parent's session
+            self.__reset()
+
+    def __close(self, connection):  # Closing connection ignoring network errors
+        with self.__lock:  # Prepared statements die together with connection
+            self.__statements.pop(connection, None)
+        try:
+            connection.close()
+        except Error:
+            pass
+
+    def checkout(self):  # Takes connection from the pool (opening a new one if possible)
+        self.__check_fork()
+        connection, idle_since = None, None
+        with self.__lock:
+            deadline, waited = time.monotonic() + self.__timeout, False
+            while True:
+                if self.__idle:  # Reusing idle connection
+                    connection, idle_since = self.__idle.pop()
+                    break
+                elif self.__checked_out < self.__size + self.__max_overflow:
+                    break  # Opening new connection
+                if not waited:
+                    self.__stats['waits'] += 1
+                    waited = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.__stats['timeouts'] += 1
+                    raise PoolError(
+                        f'Connection pool exhausted: no connection became '
+                        f'available within {self.__timeout} seconds.'
+                    )
+                self.__lock.wait(remaining)
+            self.__checked_out += 1
+            self.__stats['checkouts'] += 1
+        try:
+            if connection is not None:
+                if time.monotonic() - idle_since > self.__recycle:
+                    self.__close(connection)
+                    connection = None
+                    self.__count('recycled')
+                elif self.__pre_ping and not connection.is_connected():
+                    self.__close(connection)
+                    connection = None
+                    self.__count('invalidated')
+            if connection is None:
+                connection = connect(**self.__db_data)
+                self.__count('connects')
+        except BaseException:
+            with self.__lock:  # Giving the slot back if connection failed
+                self.__checked_out -= 1
+                self.__lock.notify()
+            raise
+        return connection
+
+    def checkin(self, connection):  # Returns connection given by checkout() to the pool
+        if self.__pid != os.getpid():  # Connection was checked out by parent process
+            return
+        reusable = True
+        try:  # Discarding uncommitted changes left behind
+            if connection.in_transaction:
+                connection.rollback()
+        except Error:
+            reusable = False
+        with self.__lock:
+            self.__checked_out -= 1
+            if reusable and not self.__disposed and len(self.__idle) < self.__size:
+                self.__idle.append((connection, time.monotonic()))
+                connection = None
+            self.__lock.notify()
+        if connection is not None:  # Overflow or broken connection
+            self.__close(connection)
+
+    def invalidate(self, connection):  # Closes connection given by checkout() instead of reusing it
+        if self.__pid != os.getpid():  # Parent process connection is dropped without closing its socket
+            return
+        with self.__lock:
+            self.__checked_out -= 1
+            self.__stats['invalidated'] += 1
+            self.__lock.notify()
+        self.__close(connection)
+
+    def statements(self, connection) -> StatementCache | None:  # Prepared statements of connection given
+        if not self.__prepared:
+            return None
+        with self.__lock:
+            cache = self.__statements.get(connection)
+            if cache is None:
+                cache = self.__statements[connection] = StatementCache(
+                    connection, self.__statement_cache_size
+                )
+            return cache
+
+    def __count(self, stat: str):
+        with self.__lock:
+            self.__stats[stat] += 1
+
+    def dispose(self, final: bool=False):  # Closes all idle connections (and ones checked in later if final)
+        self.__check_fork()
+        with self.__lock:
+            self.__disposed = self.__disposed or final
+            idle, self.__idle = self.__idle, deque()
+        for connection, _ in idle:
+            self.__close(connection)
+
+    @property
+    def stats(self) -> dict:  # Pool usage statistics
+        with self.__lock:
+            return {
+                **self.__stats,
+                'size': self.__size,
+                'max_overflow': self.__max_overflow,
+                'idle': len(self.__idle),
+                'checked_out': self.__checked_out,
+                'prepared': sum(len(c) for c in self.__statements.values()),
+                'statement_hits': sum(c.hits for c in self.__statements.values()),
+                'statement_misses': sum(c.misses for c in self.__statements.values())
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:  # Returns process-wide pool configured from settings
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:  # Pool options may be given via settings.db_pool dict
+                _pool = ConnectionPool(
+                    settings.db_data,
+                    **getattr(settings, 'db_pool', {})
+                )
+    return _pool
+
+
+def configure_pool(**kwargs) -> ConnectionPool:  # Replaces process-wide pool with a new one
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.dispose(final=True)  # Connections still in use are closed once given back
+        _pool = ConnectionPool(settings.db_data, **kwargs)
+    return _pool
+
+
+_local = threading.local()  # Per-thread transaction state
+
+
+def _frames() -> list:  # Stack of atomic blocks entered by current thread
+    try:
+        return _local.frames
+    except AttributeError:
+        _local.frames = []
+        return _local.frames
+
+
+@contextmanager
+def connection():  # Connection checkout wrapper: with connection() as c: ...
+    frames = _frames()
+    if frames:  # Inside atomic block all the statements share pinned connection
+        try:
+            yield _local.connection
+        except Error:  # Failed statement spoils the whole block
+            frames[-1]['failed'] = True
+            raise
+        return
+    pool = get_pool()
+    conn = pool.checkout()
+    try:
+        yield conn
+    finally:
+        pool.checkin(conn)
+
+
+@contextmanager
+def dedicated_connection():  # Pool connection never shared with atomic block (used for streaming reads)
+    pool = get_pool()
+    conn = pool.checkout()
+    try:
+        yield conn
+    except BaseException:  # Connection may hold unread result (e.g. abandoned stream)
+        pool.invalidate(conn)
+        raise
+    else:
+        pool.checkin(conn)
+
+
+TEMP_TABLE_BATCH_SIZE = 1000  # Ids inserted into temporary table by a single statement
+
+
+@contextmanager
+def temporary_tables(connection, params: tuple):  # Filling temporary tables query parameters refer to
+    tables = getattr(params, 'temp_tables', None)
+    if not tables:
+        yield
+        return
+    try:
+        with connection.cursor() as cursor:
+            for name, ids in tables.items():
+                cursor.execute(
+                    f'CREATE TEMPORARY TABLE {name} (id BIGINT NOT NULL PRIMARY KEY)'
+                )
+                for start in range(0, len(ids), TEMP_TABLE_BATCH_SIZE):
+                    batch = ids[start:start + TEMP_TABLE_BATCH_SIZE]
+                    cursor.execute(
+                        f"INSERT IGNORE INTO {name} (id) VALUES {', '.join('(%s)' for _ in batch)}",
+                        batch
+                    )
+        yield
+    finally:  # Tables must not stay in pooled session
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS {', '.join(tables)}")
+        except Error:  # Connection is left with unread result (abandoned stream) or broken
+            pass
+
+
+@contextmanager
+def execute(connection, sql: str, params: tuple=(), dictionary: bool=False):  # Runs statement, yields cursor to fetch from
+    # Statements joining temporary tables differ every time, so they are not prepared
+    statements = None if getattr(params, 'temp_tables', None) else get_pool().statements(connection)
+    with temporary_tables(connection, params):
+        if statements is None:  # Plain text protocol statement
+            with connection.cursor(dictionary=dictionary) as cursor:
+                cursor.execute(sql, tuple(params))
+                yield cursor
+            return
+        cursor, prepared_sql = statements.cursor(sql, dictionary)
+        try:
+            cursor.execute(prepared_sql, tuple(params))
+            yield cursor
+        except BaseException:  # Statement may be left with unread result or deallocated
+            statements.discard(sql, dictionary)
+            raise
+
+
+def info(connection) -> str:  # Info of the last statement OK packet, e.g. "Records: 3  Duplicates: 1  Warnings: 0"
+    return getattr(connection, 'info_msg', None) or getattr(connection, '_info_msg', None) or ''
+
+
+def in_atomic() -> bool:  # Check if current thread is inside atomic block
+    return bool(_frames())
+
+
+def on_end(callback) -> None:  # Calls callback once outermost atomic block ends (committed or rolled back)
+    frames = _frames()
+    if not frames:
+        callback()
+    else:
+        frames[0]['callbacks'].append(callback)
+
+
+def commit(connection) -> None:  # Commits changes unless deferred by atomic block
+    if not _frames():
+        connection.commit()
+
+
+# Transaction (unit of work) wrapper usable both as context manager and decorator.
+# Outermost block pins single connection and commits at the end,
+# nested blocks are implemented via savepoints.
+# Block is rolled back if exception raised or any statement inside it failed.
+class Atomic(ContextDecorator):
+    def __init__(self, identity_map: bool=False):
+        self.__identity_map = identity_map  # Block is run inside of identity map session
+
+    def __enter__(self):
+        if self.__identity_map:
+            ses.Session().__enter__()
+        try:
+            self.__begin()
+        except BaseException:
+            if self.__identity_map:
+                ses.Session().__exit__(None, None, None)
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            return self.__end(exc_type)
+        finally:
+            if self.__identity_map:
+                ses.Session().__exit__(exc_type, exc_val, exc_tb)
+
+    def __begin(self):
+        frames = _frames()
+        if not frames:  # Outermost block begins transaction
+            pool = get_pool()
+            conn = pool.checkout()
+            try:
+                conn.start_transaction()
+            except BaseException:
+                pool.checkin(conn)
+                raise
+            _local.connection = conn
+            frames.append({'savepoint': None, 'failed': False, 'callbacks': []})
+        else:  # Nested block sets savepoint
+            savepoint = f'atomic_savepoint_{len(frames)}'
+            with _local.connection.cursor() as cursor:
+                cursor.execute(f'SAVEPOINT {savepoint}')
+            frames.append({'savepoint': savepoint, 'failed': False})
+
+    def __end(self, exc_type) -> bool:
+        frames = _frames()
+        frame, conn = frames.pop(), _local.connection
+        rollback = exc_type is not None or frame['failed']
+        try:
+            if frame['savepoint'] is None:  # Outermost block
+                try:
+                    if rollback:
+                        conn.rollback()
+                    else:
+                        conn.commit()
+                except Error:
+                    conn.rollback()
+                    raise
+            else:
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        f"ROLLBACK TO SAVEPOINT {frame['savepoint']}" if rollback
+                        else f"RELEASE SAVEPOINT {frame['savepoint']}"
+                    )
+        finally:
+            if not frames:  # Giving connection back to the pool
+                del _local.connection
+                get_pool().checkin(conn)
+                for callback in frame['callbacks']:
+                    callback()
+        if frame['failed'] and exc_type is None:
+            raise TransactionError(
+                'Atomic block was rolled back because '
+                'one of its statements failed.'
+            )
+        return False
+
+
+def atomic(func=None, identity_map: bool=False):  # Usage: @atomic, @atomic() or with atomic(): ...
+    if callable(func):
+        return Atomic(identity_map)(func)
+    return Atomic(identity_map)
@@ -1,10 +1,16 @@
-import mysql.connector.cursor
-from mysql.connector import connect, Error
-from settings import db_data
-from . import fields as fld, model as mdl, query as qr, aggregate as aggr
+from mysql.connector import Error
+from . import fields as fld, model as mdl, query as qr, aggregate as aggr, connection as cn, expressions as expr
+from . import session as ses, cache as cch
+from collections import namedtuple
+from functools import lru_cache
 import re
 
 
+@lru_cache(maxsize=256)
+def row_class(names: tuple[str]) -> type:  # Named tuple class for values_list(named=True) rows
+    return namedtuple('Row', names, rename=True)
+
+
 # Container for queries and Model instances selected. Core of ORM API.
 # Wraps query parameters and model to perform further lazy select.
 # Select only occurs after direct data access attempt.
@@ -50,13 +56,23 @@ class QuerySet:
         def __len__(self):
             return self.__query_set.__len__()
 
+        @property
+        def model(self):
+            return self.__query_set.model
+
+        def as_subquery(self) -> tuple:  # Sliced query is compiled with its LIMIT and OFFSET
+            return self.__query_set.as_subquery()
+
+        def iterator(self, chunk_size: int=2000):  # Streams sliced elements
+            return self.__query_set.iterator(chunk_size)
+
         def update(self, **kwargs) -> None:  # Updates elements matching query
             self.__query_set.update(**kwargs)
 
         def delete(self) -> None:  # Deletes elements matching query
             self.__query_set.delete()
 
-    def __init__(self, model, container: tuple = (), *args, **kwargs):
+    def __init__(self, model, *args, container: tuple=None, **kwargs):
         self.__model = model  # Inner model class allowing to gain access to fields list, table name, etc.
         self.__query = {
             'args': args,  # Q class query aka Q, Q.Not, Q.And, Q.Or
@@ -68,35 +84,175 @@ class QuerySet:
             },
             'select_related': [],  # ForeignKey fields list for early select
             'prefetch_related': [],  # ManyToMany fields list for early select
+            'values': None,  # Fields list for values()/values_list() projection
+            'only': None,  # Fields list to select only, others are loaded on first access
+            'defer': [],  # Fields list to skip, loaded on first access
         }
+        self.__values_mode = None  # Projection rows type ('dict', 'tuple', 'flat', 'named') or model instances
         self.__union = []  # Storage for QuerySets to be united aka UNION command
-        self.__executed = False  # Inner query execution indicator
-        self.__container = container  # Query selected data storage
+        self.__cached = False  # Results are read from results cache (see cache())
+        self.__cache_ttl = None  # Cached results lifetime in seconds (None until invalidated)
+        self.__executed = container is not None  # Inner query execution indicator
+        self.__container = container if container is not None else ()  # Query selected data storage
+
+    @property
+    def model(self):
+        return self.__model
+
+    def as_subquery(self) -> tuple:  # Model and query parameters to compile QuerySet as a subquery
+        if self.__union:
+            raise ValueError('United QuerySet can not be used as a subquery.')
+        return self.__model, self.__query
+
+    # Custom query assembly (SQL, its parameters and rows hydration plan)
+    def __sql(self, query: dict=None) -> tuple[str, tuple, qr.HydrationPlan]:
+        compiled = [qr.prepare_query(self.__model, q) for q in [query or self.__query] + [
+            dict(q, values=self.__query['values']) for q in self.__union  # United queries share projection
+        ]]
+        queries = [c.bind(values) for c, values in compiled]
+        return (
+            ' UNION '.join(sql for sql, _ in queries),
+            sum((params for _, params in queries), qr.Params()),
+            compiled[0][0].plan  # United queries select same columns
+        )
 
     def __exec(self) -> None:  # Lazy query execution
         self.__model.check_table()  # Check if necessary table exists
+        # Very long "in" list is split into several queries if their results can be simply merged
+        queries = qr.chunk_query(self.__query) if not self.__union else [self.__query]
         try:  # SELECT command
-            with connect(**db_data) as connection:
-                with connection.cursor(dictionary=True) as cursor:
-                    cursor.execute(
-                        ' UNION '.join(  # Custom query assembly and execution
-                            qr.assemble_query(self.__model, q)
-                            for q in [self.__query] + self.__union
-                        )  # Fetching results first not to lose if
-                    )      # another query executes inside __prefetch() method
-                    results = cursor.fetchall()
-                    self.__container = tuple(  # Filling inner container with model instances
-                        mdl.ModelInstance(
-                            self.__model,  # Model template
-                            self.__query['select_related'],  # select_related() fields (ForeignKey)
-                            self.__prefetch(cursor),  # prefetch_related() fields (ManyToManyField)
-                            **res  # Rows fetched
-                        ) for res in results
-                    )  # Toggling execution indicator
-                    self.__executed = True
+            results, make_row = [], None
+            with cn.connection() as connection:
+                for query in queries:
+                    sql, params, plan = self.__sql(query)
+                    rows, names = self.__fetch(connection, sql, params)
+                    if self.__values_mode is not None and make_row is None:
+                        make_row = self.__row_maker(names)
+                    results.extend(rows)
+            if self.__values_mode is not None:  # Plain rows are stored as they are
+                self.__container = tuple(map(make_row, results))
+                self.__executed = True
+                return
+            deferred, hydrate, identity = self.__deferred_batches(), mdl.ModelInstance.hydrate, ses.current()
+            self.__container = tuple(  # Filling inner container with model instances
+                # Skipped fields loaders (only() and defer()), session rows are reused
+                hydrate(plan, row, deferred, identity) for row in results
+            )
+            self.__prefetch(self.__container)  # prefetch_related() fields
+            self.__share_loaders(self.__container)
+            self.__executed = True  # Toggling execution indicator
+        except Error as err:
+            print(err)
+
+    def __fetch(self, connection, sql: str, params: tuple) -> tuple[tuple, tuple]:  # Rows and column names
+        # Statements joining temporary tables differ every time and
+        # rows read inside atomic block may be not committed yet
+        cached = self.__cached and not getattr(params, 'temp_tables', None) and not cn.in_atomic()
+        key = (sql, tuple(params))
+        if cached:
+            tables = cch.read_tables(sql)
+            if (result := cch.backend.get(key)) is not None:
+                return result
+            snapshot = cch.backend.snapshot(tables)  # Taken before the read to detect concurrent writes
+        with cn.execute(connection, sql, params) as cursor:
+            result = tuple(cursor.fetchall()), tuple(column[0] for column in cursor.description or ())
+        if cached:
+            cch.backend.set(key, result, self.__cache_ttl, tables, snapshot)
+        return result
+
+    def cache(self, ttl: float=None):  # Results are kept in results cache for ttl seconds (until invalidated if None)
+        if ttl is not None and (not isinstance(ttl, (int, float)) or ttl <= 0):
+            raise ValueError(
+                'cache() method ttl must be a positive number.'
+            )
+        self.__cached, self.__cache_ttl = True, ttl
+        return self
+
+    def iterator(self, chunk_size: int=2000):  # Streams model instances keeping memory flat
+        if not isinstance(chunk_size, int) or chunk_size < 1:
+            raise ValueError(
+                'iterator() method chunk_size must be a positive integer.'
+            )
+        return self.__stream(chunk_size)  # Argument is checked at call site, not on first next()
+
+    def __stream(self, chunk_size: int):
+        if self.__executed:  # Nothing to stream if data was already fetched
+            yield from self.__container
+            return
+        self.__model.check_table()
+        # Inside atomic block rows are read by pinned connection to see uncommitted writes of the block.
+        # Its result is buffered then, since other statements of the block may run before the stream ends
+        atomic = cn.in_atomic()
+        try:  # SELECT command using unbuffered cursor, so rows are read from server chunk by chunk
+            with cn.connection() if atomic else cn.dedicated_connection() as connection:
+                # Cursor is not closed if iteration stops early, connection
+                # is discarded instead of reading the rest of the result
+                sql, params, plan = self.__sql()
+                with cn.temporary_tables(connection, params):
+                    cursor = connection.cursor(buffered=atomic)
+                    cursor.execute(sql, tuple(params))
+                    if self.__values_mode is not None:  # Plain rows are streamed without model instances
+                        make_row = self.__row_maker(tuple(column[0] for column in cursor.description))
+                        while rows := cursor.fetchmany(chunk_size):
+                            yield from map(make_row, rows)
+                        cursor.close()
+                        return
+                    while rows := cursor.fetchmany(chunk_size):
+                        deferred = self.__deferred_batches()  # Skipped fields are loaded once per chunk
+                        chunk = tuple(
+                            mdl.ModelInstance.hydrate(plan, row, deferred, ses.current()) for row in rows
+                        )
+                        self.__prefetch(chunk)  # Relations are loaded once per chunk
+                        self.__share_loaders(chunk)
+                        yield from chunk
+                    cursor.close()
         except Error as err:
             print(err)
 
+    def __row_maker(self, names: tuple):  # Function turning projection rows into requested type
+        names = tuple(self.__query['values'] or names)
+        size, converters = len(names), tuple(  # Columns converted from database types
+            (index, field.from_sql) for index, name in enumerate(names)
+            if (field := qr.values_field(self.__model, name)) is not None
+        )
+
+        def convert(row) -> list:  # Trailing annotated columns kept for HAVING are cut off
+            row = list(row[:size])
+            for index, from_sql in converters:
+                if row[index] is not None:
+                    row[index] = from_sql(row[index])
+            return row
+        match self.__values_mode:
+            case 'dict':
+                return lambda row: dict(zip(names, convert(row)))
+            case 'tuple':
+                return lambda row: tuple(convert(row))
+            case 'flat':
+                return lambda row: convert(row)[0]
+            case 'named':
+                make = row_class(names)._make
+                return lambda row: make(convert(row))
+
+    def __deferred_batches(self) -> dict:  # Skipped fields loaders shared by the rows selected together
+        batches = {}
+        for path in [''] + self.__query['select_related']:
+            fields = qr.deferred_fields(self.__model, self.__query, path)
+            if fields:
+                current_model = self.__model
+                for fname in path.split('__') if path else ():
+                    current_model = current_model.fields[fname].ref
+                batches[path] = mdl.DeferredBatch(current_model, fields)
+        return batches
+
+    def __share_loaders(self, instances: tuple) -> None:  # Batching lazy relation selects of the rows
+        batches = {  # Single select per relation on first access
+            name: fld.LinkBatch(field) for name, field in self.__model.fields.items()
+            if isinstance(field, (fld.ForeignKey, fld.ManyToManyField))
+        }
+        if batches:
+            for instance in instances:  # Prefetched, select_related and skipped ones are not registered
+                instance.share_links(batches)
+
     def __iter__(self) -> __QuerySetIterator:
         if not self.__executed:  # Iterating requires direct data access
             self.__exec()
@@ -104,7 +260,9 @@ class QuerySet:
 
     def __getitem__(self, key: int | slice):  # Slice and int index selection
         if isinstance(key, int):  # ModelInstance select
-            if key < 0:  # Reverse order and ordinary select
+            if self.__executed:  # Direct access if already executed
+                return self.__container[key]
+            elif key < 0:  # Reverse order and ordinary select
                 self.__query['order_by'].insert(0, '-id')
                 return self.__getitem__(-key)
             else:  # Ordinary select
@@ -117,7 +275,9 @@ class QuerySet:
                 if not key.start and not key.stop and key.step == -1:  # Simply reversing order
                     self.__query['order_by'].insert(0, '-id')
                     return self
-                elif key.start and key.stop and 0 <= key.start < key.stop:
+                elif (key.start or key.stop) and key.step is None and 0 <= (key.start or 0) and (
+                        key.stop is None or (key.start or 0) < key.stop
+                ):
                     match key.start, key.stop:
                         case start, None:  # Start only specified -> OFFSET <start>
                             self.__query['offset'] = start
@@ -139,7 +299,11 @@ class QuerySet:
             )
 
     def __contains__(self, item) -> bool:  # Check if ModelInstance in QuerySet
-        if not issubclass(type(item), mdl.ModelInstance):
+        if self.__values_mode is not None:  # Plain rows are compared by value
+            if not self.__executed:
+                self.__exec()
+            return item in self.__container
+        elif not issubclass(type(item), mdl.ModelInstance):
             raise TypeError(
                 'QuerySet object can only store model instances.'
             )
@@ -163,20 +327,16 @@ class QuerySet:
         if not self.__executed:
             self.__model.check_table()
             try:  # SELECT COUNT command
-                with connect(**db_data) as connection:
-                    with connection.cursor() as cursor:
-                        cursor.execute(
-                            qr.assemble_query(
-                                model=self.__model,
-                                query=self.__query,
-                                aggregate_fields={
-                                    'args': (aggr.Count('id'),),
-                                    'kwargs': {}
-                                }
-                            )
-                        )
-                        results = cursor.fetchall()
-                        return results[0][0]
+                with cn.connection() as connection:
+                    rows, _ = self.__fetch(connection, *qr.assemble_query(
+                        model=self.__model,
+                        query=self.__query,
+                        aggregate_fields={
+                            'args': (aggr.Count('id'),),
+                            'kwargs': {}
+                        }
+                    ))
+                    return rows[0][0]
             except Error as err:
                 print(err)
         else:
@@ -232,29 +392,100 @@ class QuerySet:
     def aggregate(self, *args, **kwargs):  # SELECT Aggr(...) as alias, ... command
         QuerySet.__validate_aggregate(*args, **kwargs)
         try:  # SELECT command
-            with connect(**db_data) as connection:
-                with connection.cursor(dictionary=True) as cursor:
-                    cursor.execute(
-                        qr.assemble_query(
-                            model=self.__model,
-                            query=self.__query,
-                            aggregate_fields={
-                                'args': args,  # Auto alias expressions
-                                'kwargs': kwargs  # Alias-specified expressions
-                            }
-                        )
-                    )
-                    result = cursor.fetchall()
-                    return result
+            with cn.connection() as connection:
+                rows, names = self.__fetch(connection, *qr.assemble_query(
+                    model=self.__model,
+                    query=self.__query,
+                    aggregate_fields={
+                        'args': args,  # Auto alias expressions
+                        'kwargs': kwargs  # Alias-specified expressions
+                    }
+                ))
+                return [dict(zip(names, row)) for row in rows]
         except Error as err:
             print(err)
 
     def annotate(self, *args, **kwargs):  # SELECT ..., (SELECT Aggr(...) ...) as alias, ... command
-        QuerySet.__validate_aggregate(*args, **kwargs)
+        expressions = {  # Database side row expressions (F) are allowed as keyword arguments
+            alias: e for alias, e in kwargs.items() if isinstance(e, expr.BaseExpression)
+        }
+        if any(isinstance(arg, expr.BaseExpression) for arg in args):
+            raise TypeError('Expression given to annotate() method requires an alias.')
+        if args or len(kwargs) > len(expressions):
+            QuerySet.__validate_aggregate(*args, **{
+                alias: a for alias, a in kwargs.items() if alias not in expressions
+            })
+        elif not expressions:
+            QuerySet.__validate_aggregate()
         self.__query['annotate']['args'] += args
         self.__query['annotate']['kwargs'].update(kwargs)
         return self
 
+    def __validate_deferred(self, method_name: str, *fields):  # Used by only() and defer() methods
+        if not fields:
+            raise ValueError(
+                f'At least one argument required by {method_name}() method.'
+            )
+        for path in fields:
+            if not isinstance(path, str):
+                raise TypeError(
+                    f'Got wrong argument type for {method_name}() method.'
+                )
+            current_model, fnames = self.__model, path.split('__')
+            for fname in fnames[:-1]:  # Related model fields are given via ForeignKey path
+                field = current_model.fields.get(fname)
+                if not isinstance(field, fld.ForeignKey):
+                    raise ValueError(
+                        f'Wrong field specified for {method_name}() method: "{path}".'
+                    )
+                current_model = field.ref
+            field = current_model.fields.get(fnames[-1])
+            if field is None or isinstance(field, fld.ManyToManyField):
+                raise ValueError(
+                    f'Wrong field specified for {method_name}() method: "{path}".'
+                )
+            elif method_name == 'defer' and fnames[-1] == 'id':
+                raise ValueError('Primary key can not be deferred.')
+
+    def only(self, *fields):  # SELECT <fields> ..., other fields are loaded on first access
+        self.__validate_deferred('only', *fields)
+        self.__executed = False
+        self.__container = ()
+        self.__query['only'] = list(fields)
+        return self
+
+    def defer(self, *fields):  # SELECT without <fields>, they are loaded on first access
+        self.__validate_deferred('defer', *fields)
+        self.__executed = False
+        self.__container = ()
+        self.__query['defer'].extend(fields)
+        return self
+
+    def __project(self, mode: str, *fields):  # Used by values() and values_list() methods
+        if not all(map(lambda field: isinstance(field, str), fields)):
+            raise TypeError(
+                f'Got wrong argument type for {"values" if mode == "dict" else "values_list"}() method.'
+            )
+        self.__executed = False
+        self.__container = ()
+        self.__query['values'] = list(fields)
+        self.__values_mode = mode
+        return self
+
+    def values(self, *fields):  # SELECT <fields> ... returning dicts instead of model instances
+        return self.__project('dict', *fields)
+
+    def values_list(self, *fields, flat: bool=False, named: bool=False):  # ... returning tuples
+        if flat and named:
+            raise ValueError(
+                'values_list() method flat and named arguments are mutually exclusive.'
+            )
+        elif flat and len(fields) != 1:
+            raise ValueError(
+                'values_list() method flat argument requires exactly one field.'
+            )
+        return self.__project('flat' if flat else 'named' if named else 'tuple', *fields)
+
     def __validate_related(
             self,
             method_name: str,
@@ -292,47 +523,33 @@ class QuerySet:
 
     def select_related(self, *args):  # SELECT with ForeignKey fields
         self.__validate_related('select', (fld.ForeignKey,), *args)
-        self.__query['select_related'].extend(args)
+        for arg in args:  # Intermediate rows are selected too to keep nested ones
+            fnames = arg.split('__')
+            for path in ('__'.join(fnames[:i]) for i in range(1, len(fnames) + 1)):
+                if path not in self.__query['select_related']:
+                    self.__query['select_related'].append(path)
         return self
 
-    def __prefetch(
-            self,
-            cursor: mysql.connector.cursor.MySQLCursorBufferedDict
-    ) -> tuple[list[dict], dict]:  # Separating ManyToMany fields from others
-        prefetched = {}
-        if self.__query['prefetch_related']:
-            joins, fields, _ = qr.Q.make_related_fields(
-                self.__model, 0, 0, *self.__query['prefetch_related']
-            )
-            cursor.execute(
-                f"""SELECT {', '.join(fields)} FROM {self.__model.table_name} AS {
-                self.__model.table_name}00{''.join(
-                    f" {j['type']} JOIN {j['table']} AS {j['alias']} ON {j['on']}"
-                    for j in joins
-                )}"""
-            )
-            rows = cursor.fetchall()
-            # Separating M2M data for each row fetched
-            for pfield in self.__query['prefetch_related']:
-                fnames = pfield.split('__')  # Splitting to get subfields sequence
-                current_model = self.__model
-                for fname in fnames:  # Getting proper nested model
-                    try:
-                        attr = getattr(current_model, fname)
-                        current_model = attr.ref
-                    except AttributeError:
-                        break
-                prefetched[pfield] = tuple(
-                    mdl.ModelInstance(
-                        current_model,
-                        **{
-                            key.replace(f'{pfield}__', ''): row.pop(key)
-                            for key in tuple(row.keys())
-                            if re.search(f'^{pfield}__([a-z]+_?)+$', key)
-                        }
-                    ) for row in rows
-                )
-        return prefetched
+    def __prefetch(self, instances: tuple) -> None:  # Loading prefetch_related() fields for the rows given
+        for path in self.__query['prefetch_related']:
+            current_model, level = self.__model, instances
+            for fname in path.split('__'):  # Single batch select per relation of the path
+                field = current_model.fields[fname]
+                if isinstance(field, fld.ManyToManyField):
+                    field.m1 = current_model
+                batch, wrappers = fld.LinkBatch(field), [
+                    getattr(instance, fname) for instance in level
+                ]
+                for wrapper in wrappers:  # Already loaded ones are not selected again
+                    wrapper.share(batch)
+                level = []  # Selected instances become parents for next path part
+                for wrapper in wrappers:
+                    loaded = wrapper.load()
+                    if isinstance(field, fld.ManyToManyField):
+                        level.extend(loaded)
+                    elif loaded is not None:
+                        level.append(loaded)
+                current_model = field.ref
 
     def prefetch_related(self, *args):  # SELECT with ManyToMany fields
         self.__validate_related('prefetch', (fld.ForeignKey, fld.ManyToManyField), *args)
@@ -341,64 +558,67 @@ class QuerySet:
 
     def update(self, **kwargs) -> None:  # Updating all the QuerySet members according to the kwargs given
         self.__model.check_table()
-        update_set = []
+        update_set, update_params = [], []
         for name, val in kwargs.items():
             if name not in self.__model.fields:  # Checking if all fields specified right
                 raise Exception('Wrong fields specified in update method')
+            elif isinstance(val, expr.BaseExpression):  # Value is computed by database
+                sql, params = qr.compile_expression(self.__model, val)
+                update_set.append(f'{self.__model.table_name}.{name} = {sql}')
+                update_params.extend(params)
             else:
-                update_set.append(
-                    f'{self.__model.table_name}.{name} = '
-                    f'{self.__model.fields[name].to_sql(val)}'
-                )
-                for mi in self.__container:
+                update_set.append(f'{self.__model.table_name}.{name} = %s')
+                update_params.append(self.__model.fields[name].to_param(val))
+                for mi in self.__container if self.__values_mode is None else ():
                     setattr(mi, name, val)
+                    mi.mark_saved(name)
+        sql, params = qr.assemble_query(self.__model, dict(self.__query, values=None))
         try:  # UPDATE command
-            with connect(**db_data) as connection:
-                with connection.cursor(dictionary=True) as cursor:
-                    cursor.execute(
-                        f"""UPDATE {self.__model.table_name}, ({
-                        qr.assemble_query(self.__model, self.__query)
-                        }) AS __tab SET {', '.join(
-                            update_set
-                        )} WHERE {self.__model.table_name}.id = __tab.id"""
-                    )
-                    connection.commit()
+            with cn.connection() as connection:
+                with cn.execute(
+                    connection,
+                    f"""UPDATE {self.__model.table_name}, ({sql}) AS __tab SET {
+                    ', '.join(update_set)
+                    } WHERE {self.__model.table_name}.id = __tab.id""",
+                    params + tuple(update_params)
+                ):
+                    cn.commit(connection)
+            self.__forget((self.__model.table_name,))
         except Error as err:
             print(err)
 
     def delete(self) -> None:  # Deleting all the QuerySet members
         self.__model.check_table()
+        sql, params = qr.assemble_query(self.__model, dict(self.__query, values=None))
         try:  # DELETE command
-            with connect(**db_data) as connection:
-                with connection.cursor(dictionary=True) as cursor:
-                    cursor.execute(
-                        f"""DELETE FROM {self.__model.table_name} WHERE {
-                        self.__model.table_name}.id IN (SELECT {
-                        self.__model.table_name}00.id FROM ({
-                        qr.assemble_query(
-                            model=self.__model,
-                            query=self.__query
-                        )}) AS {self.__model.table_name}00)"""
-                    )
-                    connection.commit()
+            with cn.connection() as connection:
+                with cn.execute(
+                    connection,
+                    f"""DELETE FROM {self.__model.table_name} WHERE {
+                    self.__model.table_name}.id IN (SELECT {
+                    self.__model.table_name}00.id FROM ({sql}) AS {
+                    self.__model.table_name}00)""",
+                    params
+                ):
+                    cn.commit(connection)
+            self.__forget(self.__model.cascade_tables())
         except Error as err:
             print(err)
 
+    def __forget(self, tables) -> None:  # Session and results cache must not reuse rows changed by database side
+        cch.invalidate(*tables)
+        identity = ses.current()
+        if identity is not None:
+            identity.discard(self.__model)
+
     def exists(self):  # Checking will the QuerySet be empty or not
         if not self.__executed:
             self.__model.check_table()
             try:  # SELECT EXISTS command
-                with connect(**db_data) as connection:
-                    with connection.cursor() as cursor:
-                        cursor.execute(
-                            f"""SELECT EXISTS({
-                            qr.assemble_query(
-                                model=self.__model,
-                                query=self.__query
-                            )})"""
-                        )
-                        results = cursor.fetchall()
-                        return bool(results[0][0])
+                sql, params = qr.assemble_query(self.__model, self.__query)
+                with cn.connection() as connection:
+                    rows, _ = self.__fetch(connection, f'SELECT EXISTS({sql})', params)
+                    return bool(rows[0][0])
             except Error as err:
                 print(err)
         else:
@@ -466,11 +686,13 @@ class QuerySet:
 # Raw SQL-query wrapper.
 # Allows to directly execute SQL requests.
 class RawQuerySet:
-    def __init__(self, model, query: str):
+    def __init__(self, model, query: str, dictionary: bool=False):
         self.__model = model
         self.__query = query  # Raw SQL statement
+        self.__dictionary = dictionary  # Rows are fetched as dicts instead of tuples
         self.__executed = False  # Execution indicator
         self.__container = []  # Raw data selected storage
+        self.__columns = ()  # Selected column names (tuple rows layout)
         self.__validate_query()  # Validating query given using regular expression
 
     def __validate_query(self):  # Validating query SQL syntax
@@ -495,14 +717,21 @@ class RawQuerySet:
     def __exec(self):  # Executing query given
         self.__model.check_table()  # Check if necessary table exists
         try:  # SELECT command
-            with connect(**db_data) as connection:
-                with connection.cursor(dictionary=True) as cursor:
+            with cn.connection() as connection:
+                with connection.cursor(dictionary=self.__dictionary) as cursor:
                     cursor.execute(self.__query)
                     self.__container = cursor.fetchall()  # Saving raw data fetched to container
+                    self.__columns = tuple(column[0] for column in cursor.description or ())
                     self.__executed = True
         except Error as err:
             print(err)
 
+    @property
+    def columns(self) -> tuple[str]:  # Column names, index of each one matches tuple rows
+        if not self.__executed:
+            self.__exec()
+        return self.__columns
+
     # RawQuerySet commands require execution before direct data access
     def __getitem__(self, key: int | slice):
         if not self.__executed:
@@ -514,7 +743,7 @@ class RawQuerySet:
             self.__exec()
         yield from self.__container
 
-    def __len__(self, item):
+    def __len__(self):
         if not self.__executed:
             self.__exec()
         return len(self.__container)
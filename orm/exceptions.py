@@ -18,3 +18,7 @@ class SQLError(Exception):
 
     def __str__(self):
         return self.message
+
+
+class TransactionError(Exception):  # Raised when atomic block had to be rolled back
+    pass
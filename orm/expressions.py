@@ -0,0 +1,111 @@
+from abc import ABC, abstractmethod
+
+
+# Interface for expressions evaluated on database side
+# (field references, constants and arithmetic operations on them).
+class BaseExpression(ABC):
+    @abstractmethod  # Assembling expression into SQL, column(<field>__<subfield>...) gives column SQL name
+    def assemble(self, column, slots) -> str:
+        pass
+
+    @abstractmethod  # Hashable structure (constants excluded) collecting constants in binding order
+    def shape(self, values: list) -> tuple:
+        pass
+
+    # Arithmetic operations overload.
+    def __add__(self, other):
+        return ExpressionOperationWrapper('+', self, other)
+
+    def __radd__(self, other):
+        return ExpressionOperationWrapper('+', other, self)
+
+    def __sub__(self, other):
+        return ExpressionOperationWrapper('-', self, other)
+
+    def __rsub__(self, other):
+        return ExpressionOperationWrapper('-', other, self)
+
+    def __mul__(self, other):
+        return ExpressionOperationWrapper('*', self, other)
+
+    def __rmul__(self, other):
+        return ExpressionOperationWrapper('*', other, self)
+
+    def __floordiv__(self, other):
+        return ExpressionOperationWrapper('DIV', self, other)
+
+    def __rfloordiv__(self, other):
+        return ExpressionOperationWrapper('DIV', other, self)
+
+    def __truediv__(self, other):
+        return ExpressionOperationWrapper('/', self, other)
+
+    def __rtruediv__(self, other):
+        return ExpressionOperationWrapper('/', other, self)
+
+    def __mod__(self, other):
+        return ExpressionOperationWrapper('%', self, other)
+
+    def __rmod__(self, other):
+        return ExpressionOperationWrapper('%', other, self)
+
+    def __neg__(self):
+        return ExpressionOperationWrapper('-', Value(0), self)
+
+
+class F(BaseExpression):  # Reference to field value of the row: F('<field>__<subfield>__...')
+    def __init__(self, field_name: str):
+        self.field_name = field_name
+
+    def assemble(self, column, slots) -> str:
+        return column(self.field_name)
+
+    def shape(self, values: list) -> tuple:
+        return 'F', self.field_name
+
+    def __repr__(self):
+        return f'F({self.field_name!r})'
+
+
+class OuterRef(F):  # Reference to field of enclosing query row inside of Exists() subquery
+    def assemble(self, column, slots) -> str:
+        return slots.outer_column(self.field_name)
+
+    def shape(self, values: list) -> tuple:
+        return 'OuterRef', self.field_name
+
+    def __repr__(self):
+        return f'OuterRef({self.field_name!r})'
+
+
+class Value(BaseExpression):  # Constant passed as query parameter
+    def __init__(self, value):
+        self.value = value
+
+    def assemble(self, column, slots) -> str:
+        return slots.parameter(self.value)()
+
+    def shape(self, values: list) -> tuple:
+        values.append(self.value)
+        return 'Value',
+
+    def __repr__(self):
+        return f'Value({self.value!r})'
+
+
+class ExpressionOperationWrapper(BaseExpression):  # Binary operation on expressions or constants
+    def __init__(self, operation: str, left, right):
+        self.__operation = operation
+        self.__operands = tuple(
+            operand if isinstance(operand, BaseExpression) else Value(operand)
+            for operand in (left, right)
+        )
+
+    def assemble(self, column, slots) -> str:
+        return f'({f" {self.__operation} ".join(o.assemble(column, slots) for o in self.__operands)})'
+
+    def shape(self, values: list) -> tuple:
+        return (self.__operation,) + tuple(o.shape(values) for o in self.__operands)
+
+    def __repr__(self):
+        return f'({self.__operands[0]!r} {self.__operation} {self.__operands[1]!r})'
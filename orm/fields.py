@@ -1,9 +1,7 @@
-from mysql.connector import connect, Error
-from settings import db_data
-from . import model as mdl, query as qr, containers as cont
+from mysql.connector import Error
+from . import model as mdl, query as qr, containers as cont, connection as cn, session as ses, cache as cch
 import datetime
 import json
-from itertools import chain
 from abc import ABC, abstractmethod
 
 
@@ -40,6 +38,10 @@ class Field(ABC):  # Basic model field class to inherit from
             f'CHECK ({name} IN {self._choices})' if self._choices else ''
         ))
 
+    @property
+    def unique(self) -> bool:  # Whether column values are unique (primary or UNIQUE key)
+        return self._unique
+
     @abstractmethod  # Used to transform python type to sql type
     def to_sql(self, value):
         pass
@@ -48,6 +50,9 @@ class Field(ABC):  # Basic model field class to inherit from
     def from_sql(self, value):
         pass
 
+    def to_param(self, value):  # Used to transform python type to query parameter
+        return value
+
 
 class IntField(Field):  # Field to store int value aka SQL INTEGER
     def __init__(
@@ -200,6 +205,9 @@ class BooleanField(Field):  # Field to store bool value aka SQL BIT
     def to_sql(self, value: bool):
         return str(int(value)) if isinstance(value, bool) else value
 
+    def to_param(self, value: bool):
+        return int(value) if isinstance(value, bool) else value
+
     def from_sql(self, value: bool):
         return value
 
@@ -222,6 +230,9 @@ class JSONField(Field):  # Field to store dict value aka SQL JSON
     def to_sql(self, value: dict):
         return f'\'{json.dumps(value)}\'' if isinstance(value, dict) else value
 
+    def to_param(self, value: dict):
+        return json.dumps(value) if isinstance(value, dict) else value
+
     def from_sql(self, value: dict):
         return value
 
@@ -245,9 +256,15 @@ class DurationField(Field):  # Field to store timedelta value aka SQL INT
     def to_sql(self, value: datetime.timedelta):
         return str(int(datetime.timedelta.total_seconds(value))) if isinstance(value, datetime.timedelta) else value
 
+    def to_param(self, value: datetime.timedelta):
+        return int(value.total_seconds()) if isinstance(value, datetime.timedelta) else value
+
     def from_sql(self, value: int):
         return datetime.timedelta(seconds=value)
 
+# Max number of ids listed in a single IN (...) of relation selects
+SELECT_CHUNK_SIZE = 1000
+
 # ON DELETE and ON UPDATE options list
 CASCADE = 'CASCADE'
 RESTRICT = 'RESTRICT'
@@ -301,9 +318,33 @@ class ForeignKey(IntField, LinkField):  # Field to link models via many-to-one r
         else:
             return str(value.id)
 
+    def to_param(self, value: mdl.ModelInstance | int):  # Referenced model instance or its id
+        if isinstance(value, mdl.ModelInstance):
+            if self.ref != value.model:
+                raise TypeError(
+                    f'Wrong model type for ForeignKey: '
+                    f'expected {self.ref.__name__} but got {value.model.__name__}'
+                )
+            return value.id
+        elif isinstance(value, ForeignKeyInstance):  # Lazy reference wrapper
+            return value.id
+        return value
+
     def from_sql(self, value: int):
         return value
 
+    def select_many(self, ids) -> dict:  # Loading referenced rows by ids in chunked queries
+        ids, selected, identity = tuple({id for id in ids if id is not None}), {}, ses.current()
+        if identity is not None:  # Rows already loaded by session are not selected again
+            selected = {id: identity.get(self.ref, id) for id in ids if (self.ref, id) in identity}
+            ids = tuple(id for id in ids if id not in selected)
+        for start in range(0, len(ids), SELECT_CHUNK_SIZE):
+            selected.update(
+                (ref.id, ref) for ref in
+                self.ref.filter(id__in=ids[start:start + SELECT_CHUNK_SIZE])
+            )
+        return selected
+
     def sql_init(self, name: str):
         return IntField.sql_init(self, name) + f""", FOREIGN KEY ({name
         }) REFERENCES {self.ref.table_name} (id)""" + LinkField.sql_init(self)
@@ -387,7 +428,7 @@ class ManyToManyField(IntField, LinkField):  # Field to link models via many-to-
 
     def create(self):
         try:  # Creating junction table
-            with connect(**db_data) as connection:
+            with cn.connection() as connection:
                 with connection.cursor() as cursor:
                     cursor.execute(f'''CREATE TABLE IF NOT EXISTS {
                     self.__m1.__name__}_{self.__m2.__name__} ({
@@ -403,149 +444,259 @@ class ManyToManyField(IntField, LinkField):  # Field to link models via many-to-
         except Error as err:
             print(err)
 
-    def select(self, m1_id: int):
-        try:  # Selecting rows from junction table
-            with connect(**db_data) as connection:
-                with connection.cursor() as cursor:
-                    m1_name, m2_name = self.__m1.__name__, self.__m2.__name__
-                    cursor.execute(
-                        f"""SELECT {m2_name.lower()}_id FROM {m1_name}_{m2_name} WHERE {
-                        m1_name.lower()}_id = {m1_id}"""
-                    )
-                    return cont.QuerySet(self.__m2, {
-                        'args': (),
-                        'kwargs': {'id__in': tuple(chain(*cursor.fetchall()))}
-                    })
+    def select(self, m1_id: int):  # QuerySet of model instances linked to m1 row given
+        return cont.QuerySet(
+            self.__m2, container=self.select_many((m1_id,)).get(m1_id, ())
+        )
+
+    def select_many(self, m1_ids) -> dict:  # Loading linked rows for many m1 rows in chunked queries
+        selected = {m1_id: [] for m1_id in m1_ids if m1_id is not None}
+        if not selected:
+            return {}
+        self.__m2.check_table()
+        m1_name, m2_name, ids = self.__m1.__name__, self.__m2.__name__, tuple(selected)
+        plan, identity = qr.row_plan(self.__m2), ses.current()  # Linked model columns layout
+        try:  # Selecting rows from junction table joined with referenced table
+            with cn.connection() as connection:
+                for start in range(0, len(ids), SELECT_CHUNK_SIZE):
+                    chunk = ids[start:start + SELECT_CHUNK_SIZE]
+                    with cn.execute(
+                        connection,
+                        f"""SELECT {m1_name}_{m2_name}.{m1_name.lower()}_id AS m1__id, {', '.join(
+                            f'{self.__m2.table_name}.{name}' for _, name in plan.columns
+                        )} FROM {m1_name}_{m2_name} INNER JOIN {self.__m2.table_name} ON {
+                        m1_name}_{m2_name}.{m2_name.lower()}_id = {self.__m2.table_name}.id WHERE {
+                        m1_name}_{m2_name}.{m1_name.lower()}_id IN ({', '.join('%s' for _ in chunk)})""",
+                        chunk
+                    ) as cursor:
+                        for row in cursor.fetchall():  # Grouping linked rows by parent id
+                            selected[row[0]].append(mdl.ModelInstance.hydrate(plan, row[1:], None, identity))
         except Error as err:
             print(err)
-
-    def insert(self, m1_id: int, m2_id: int):
-        try:  # Inserting row into junction table
-            with connect(**db_data) as connection:
-                with connection.cursor(dictionary=True) as cursor:
-                    m1_name, m2_name = self.__m1.__name__, self.__m2.__name__
-                    cursor.execute(
-                        f'''INSERT INTO {m1_name}_{m2_name} ({
+        return {m1_id: tuple(refs) for m1_id, refs in selected.items()}
+
+    def linked_ids(self, m1_id: int, for_update: bool=False) -> tuple:  # Ids of m2 rows linked to m1 row given (junction table only)
+        m1_name, m2_name = self.__m1.__name__, self.__m2.__name__
+        try:
+            with cn.connection() as connection:
+                with cn.execute(
+                    connection,
+                    f'''SELECT {m2_name.lower()}_id FROM {m1_name}_{m2_name
+                    } WHERE {m1_name.lower()}_id = %s{' FOR UPDATE' if for_update else ''}''',
+                    (m1_id,)
+                ) as cursor:
+                    return tuple(m2_id for m2_id, in cursor.fetchall())
+        except Error as err:
+            print(err)
+        return ()
+
+    def insert(self, m1_id: int, *m2_ids: int):  # Linking m2 rows given, already linked ones are skipped
+        m1_name, m2_name = self.__m1.__name__, self.__m2.__name__
+        try:  # Inserting rows into junction table
+            with cn.connection() as connection:
+                for start in range(0, len(m2_ids), SELECT_CHUNK_SIZE):
+                    chunk = m2_ids[start:start + SELECT_CHUNK_SIZE]
+                    with cn.execute(
+                        connection,
+                        f'''INSERT IGNORE INTO {m1_name}_{m2_name} ({
                         m1_name.lower()}_id, {m2_name.lower()
-                        }_id) VALUES ({m1_id}, {m2_id})'''
-                    )
-                    connection.commit()
+                        }_id) VALUES {', '.join('(%s, %s)' for _ in chunk)}''',
+                        [id for m2_id in chunk for id in (m1_id, m2_id)]
+                    ):
+                        pass
+                cn.commit(connection)
+            cch.invalidate(f'{m1_name}_{m2_name}')
         except Error as err:
             print(err)
 
-    def delete(self, m2_id: int):
-        try:  # Deleting row from junction table
-            with connect(**db_data) as connection:
-                with connection.cursor(dictionary=True) as cursor:
-                    cursor.execute(
-                        f'''DELETE FROM {self.__m1.__name__}_{self.__m2.__name__
-                        } WHERE {self.m2.__name__.lower()}_id = {m2_id}'''
-                    )
-                    connection.commit()
+    def delete(self, m1_id: int, *m2_ids: int):  # Unlinking m2 rows given (all of them if none given)
+        m1_name, m2_name = self.__m1.__name__, self.__m2.__name__
+        sql = f'DELETE FROM {m1_name}_{m2_name} WHERE {m1_name.lower()}_id = %s'
+        try:  # Deleting rows from junction table
+            with cn.connection() as connection:
+                if not m2_ids:
+                    with cn.execute(connection, sql, (m1_id,)):
+                        pass
+                for start in range(0, len(m2_ids), SELECT_CHUNK_SIZE):
+                    chunk = m2_ids[start:start + SELECT_CHUNK_SIZE]
+                    with cn.execute(
+                        connection,
+                        f'''{sql} AND {m2_name.lower()}_id IN ({
+                        ', '.join('%s' for _ in chunk)})''',
+                        (m1_id, *chunk)
+                    ):
+                        pass
+                cn.commit(connection)
+            cch.invalidate(f'{m1_name}_{m2_name}')
         except Error as err:
             print(err)
 
 
 class LinkFieldInstance:  # Field instance lazy wrapper for nested models fields
-    def __init__(self, cache: dict=None):
-        self._cache = cache if cache else {}
+    pass
+
+
+class LinkBatch:  # Lazy loader shared by link field wrappers of the rows selected together
+    def __init__(self, field: ForeignKey | ManyToManyField):
+        self.__field = field
+        self.__ids = {}  # Ids to load links for (ForeignKey values or ManyToMany m1 ids), ordered set
+        self.__selected = None
+
+    def add(self, id: int) -> None:  # Registering row to be loaded along with others
+        self.__ids[id] = None
+
+    def load(self, id: int, default=None):  # First access loads links of all the rows at once
+        if id not in self.__ids:  # Id was not registered (e.g. assigned after select)
+            return self.__field.select_many((id,)).get(id, default)
+        if self.__selected is None:
+            self.__selected = self.__field.select_many(tuple(self.__ids))
+        return self.__selected.get(id, default)
 
 
 class ForeignKeyInstance(LinkFieldInstance):  # Wrapper to work with ForeignKey field using model instance
-    def __init__(self, fk: ForeignKey, id: int, cache: dict=None):
+    def __init__(self, fk: ForeignKey, id: int, ref=None, batch: LinkBatch=None):  # ref is select_related() row
         self.__fk = fk
         self.__id = id
-        self.__ref = cache.get(
-            self.__fk.ref.__name__.lower(), None
-        ) if cache else None
-        super().__init__(cache)
+        self.__ref = ref
+        self.__loaded = self.__ref is not None or id is None
+        self.__batch = batch if not self.__loaded else None  # LinkBatch shared with sibling rows
+
+    @property
+    def loaded(self) -> bool:
+        return self.__loaded
+
+    def share(self, batch: LinkBatch) -> None:  # Joining sibling rows batch select
+        if not self.__loaded:
+            self.__batch = batch
+            batch.add(self.__id)
+
+    def load(self):  # Lazy select of referenced model instance
+        if not self.__loaded:
+            self.__ref = self.__batch.load(self.__id) if self.__batch \
+                else self.__fk.select_many((self.__id,)).get(self.__id)
+            self.__loaded, self.__batch = True, None
+        return self.__ref
 
     def __getattr__(self, item):
-        if not self.__ref:  # Make lazy database select
-            self.__ref = self.__fk.ref.get(id=self.__id)
-        # Dragging cache inside nested models fields
-        for name, val in self._cache.items():
-            getattr(  # Getting nested model field by name
-                self.__ref, name.split('__')[1]
-            )._cache.update(  # Direct cache update
-                {'__'.join(name.split('__')[1:]): val}
-            )
+        if item == 'id':  # Referenced row id is known without select
+            return self.__id
+        self.load()  # Make lazy database select (nested select_related() rows are kept by referenced instance)
         return getattr(self.__ref, item)
 
 
 class ManyToManyFieldInstance(LinkFieldInstance):  # Wrapper to work with M2M field using model instance
-    def __init__(self, m2m: ManyToManyField, m1_id: int, cache: dict=None):
+    def __init__(self, m2m: ManyToManyField, m1_id: int, batch: LinkBatch=None):
         self.__m2m = m2m
         self.__m1_id = m1_id
-        self.__refs = cont.QuerySet(self.__m2m.ref, cache.get(
-            self.__m2m.ref.__name__.lower(), None
-        )) if cache else m2m.select(m1_id)
-        super().__init__(cache)
-
-    def __data_access(self):
-        for el in self.__refs:
-            # Dragging cache inside nested models fields
-            for name, val in self._cache.items():
-                fnames = name.split('__')[1:]
-                attr = el
-                for fname in fnames:  # Getting proper nested model
-                    try:
-                        attr = getattr(attr, fname)
-                    except AttributeError:
-                        break
-                getattr(  # Getting nested model field by name
-                    el, name.split('__')[1]
-                )._cache.update(  # Direct cache update
-                    {'__'.join(name.split('__')[1:]): next(filter(
-                        lambda x: x.id == attr.id, val
-                    ))}
+        self.__refs = None  # Linked model instances QuerySet, no select until first access
+        self.__batch = batch  # LinkBatch shared with sibling rows
+
+    @property
+    def loaded(self) -> bool:
+        return self.__refs is not None
+
+    def share(self, batch: LinkBatch) -> None:  # Joining sibling rows batch select
+        if self.__refs is None:
+            self.__batch = batch
+            batch.add(self.__m1_id)
+
+    def __set(self, refs: tuple):  # Wrapping linked instances into already executed QuerySet
+        self.__refs = cont.QuerySet(
+            self.__m2m.ref,
+            id__in=tuple(ref.id for ref in refs),
+            container=tuple(refs)
+        )
+
+    def load(self):  # Lazy select of linked instances
+        if self.__refs is None:
+            self.__set(
+                self.__batch.load(self.__m1_id, ()) if self.__batch
+                else self.__m2m.select_many((self.__m1_id,)).get(self.__m1_id, ())
+            )
+            self.__batch = None
+        return self.__refs
+
+    def __check(self, refs) -> dict:  # Validating model instances given, returns them by id
+        for ref in refs:
+            if not issubclass(type(ref), mdl.ModelInstance):
+                raise TypeError(
+                    f'You can only store model instances in ManyToManyField:'
+                    f' got type "{type(ref).__name__}"'
+                )
+            elif ref.model != self.__m2m.ref:
+                raise TypeError(
+                    f"Model type does not match ManyToManyField's one:"
+                    f" expected {self.__m2m.ref.__name__} but got {ref.model.__name__}"
                 )
+        return {ref.id: ref for ref in refs}
+
+    def add(self, *refs) -> None:  # Linking model instances given in a single statement
+        refs = self.__check(refs)
+        if refs:
+            self.__m2m.insert(self.__m1_id, *refs)
+        if self.__refs is not None:  # Otherwise will be selected on first access
+            linked = {ref.id for ref in self.__refs}
+            self.__set(tuple(self.__refs) + tuple(
+                ref for id, ref in refs.items() if id not in linked
+            ))
+        self.__batch = None  # Sibling rows selection may predate the write
+
+    def remove(self, *refs) -> None:  # Unlinking model instances given in a single statement
+        refs = self.__check(refs)
+        if refs:
+            self.__m2m.delete(self.__m1_id, *refs)
+        if self.__refs is not None:
+            self.__set(tuple(ref for ref in self.__refs if ref.id not in refs))
+        self.__batch = None  # Sibling rows selection may predate the write
+
+    def set(self, refs) -> None:  # Making model instances given the only linked ones
+        refs = self.__check(tuple(refs))
+        # Only the difference with current links is written, both statements are run in a single
+        # transaction not to leave links half-replaced. Current links are read (and locked) inside
+        # of it rather than taken from loaded instances, which may miss links added since the load
+        with cn.atomic():
+            linked = set(self.__m2m.linked_ids(self.__m1_id, for_update=True))
+            if linked - refs.keys():
+                self.__m2m.delete(self.__m1_id, *(linked - refs.keys()))
+            if refs.keys() - linked:
+                self.__m2m.insert(self.__m1_id, *(refs.keys() - linked))
+        self.__set(tuple(refs.values()))
+        self.__batch = None
+
+    def clear(self) -> None:  # Unlinking all the model instances
+        self.__m2m.delete(self.__m1_id)
+        self.__set(())
+        self.__batch = None
 
     def append(self, ref):  # Appending model instance to model's m2m
-        if not issubclass(type(ref), mdl.ModelInstance):
-            raise TypeError(
-                f'You can only store model instances in ManyToManyField:'
-                f' got type "{type(ref).__name__}"'
-            )
-        elif ref.model != self.__m2m.m2:
-            raise TypeError(
-                f"Model type does not match ManyToManyField's one:"
-                f" expected {self.__m2m.m2.__name__} but got {ref.model.__name__}"
-            )
-        self.__m2m.insert(self.__m1_id, ref.id)
-        self.__refs = self.__refs + ref.model.filter(id=ref.id)
+        self.add(ref)
 
     def delete(self, ref):  # Deleting model instance from model's m2m
-        if ref in self.__refs:
-            self.__m2m.delete(ref.id)
-            self.__refs = self.__refs.exclude(id=ref.id)
+        if ref in self.load():
+            self.remove(ref)
         else:
             raise KeyError('No submodel found in ManyToManyField')
     # Next methods make projection on nested QuerySet object
     def filter(self, **kwargs):
-        return self.__refs.filter(**kwargs)
+        return self.load().filter(**kwargs)
 
     def get(self, *args, **kwargs):
-        return self.__refs.get(*args, **kwargs)
+        return self.load().get(*args, **kwargs)
 
     def exclude(self, *args, **kwargs):
-        return self.__refs.exclude(*args, **kwargs)
+        return self.load().exclude(*args, **kwargs)
 
     def __iter__(self):
-        result = self.__refs.__iter__()
-        self.__data_access()
-        return result
+        return self.load().__iter__()
 
     def __getitem__(self, key: int | slice):
-        result = self.__refs.__getitem__(key)
-        self.__data_access()
-        return result
+        return self.load().__getitem__(key)
 
     def __contains__(self, item):
-        return self.__refs.__contains__(item)
+        return self.load().__contains__(item)
 
     def __str__(self) -> str:
-        return self.__refs.__str__()
+        return self.load().__str__()
 
     def __len__(self):
-        return self.__refs.__len__()
+        return self.load().__len__()
@@ -1,39 +1,139 @@
-from settings import db_data
-from . import fields as fld, query as qr, containers as cont
-from mysql.connector import connect, Error
+from . import fields as fld, query as qr, containers as cont, connection as cn, schema as sch, expressions as expr
+from . import session as ses, cache as cch
+from mysql.connector import Error
 import re
 
 
+INSERT_BATCH_SIZE = 1000  # Max number of rows inserted by a single bulk_create statement
+UPDATE_BATCH_SIZE = 1000  # Max number of rows updated by a single bulk_update statement
+MAX_STATEMENT_PARAMS = 65535  # MySQL placeholders limit of a prepared statement
+INSERT_BATCH_BYTES = 1024 * 1024  # Max size of string values sent by a single bulk INSERT (max_allowed_packet)
+_missing = object()  # Marker of field values not loaded into model instance
+
+
+class DeferredBatch:  # Lazy loader of only()/defer() skipped fields shared by the rows selected together
+    def __init__(self, model, fields: set[str]):
+        self.model = model
+        self.fields = frozenset(fields)
+        self.__instances = []  # Rows to load skipped fields for
+        self.__loaded = False
+
+    def add(self, instance) -> None:  # Registering row to be loaded along with others
+        self.__instances.append(instance)
+
+    def load(self) -> None:  # First access selects skipped fields of all the rows at once
+        if self.__loaded:
+            return
+        self.__loaded, instances, names = True, {}, sorted(self.fields)
+        for instance in self.__instances:
+            if instance.id is not None:  # LEFT JOIN of select_related found nothing
+                instances.setdefault(instance.id, []).append(instance)
+        self.__instances, ids = [], tuple(instances)
+        try:  # SELECT command
+            with cn.connection() as connection:
+                for start in range(0, len(ids), fld.SELECT_CHUNK_SIZE):
+                    chunk = ids[start:start + fld.SELECT_CHUNK_SIZE]
+                    with cn.execute(
+                        connection,
+                        f'''SELECT id, {', '.join(names)} FROM {self.model.table_name} WHERE id IN ({
+                        ', '.join('%s' for _ in chunk)})''',
+                        chunk
+                    ) as cursor:
+                        for id, *values in cursor.fetchall():
+                            for instance in instances[id]:
+                                instance.load_deferred(**dict(zip(names, values)))
+        except Error as err:
+            print(err)
+
+
+class LinkAttribute:  # Relation field of row class, its wrapper is created on first access
+    def __init__(self, name: str, column):
+        self.__name = name
+        self.__column = column  # Slot storing ForeignKey id or created wrapper
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        try:
+            value = self.__column.__get__(instance, owner)
+        except AttributeError:  # ManyToMany wrapper is not created yet (ForeignKey is skipped by only()/defer())
+            if not isinstance(instance.model.fields[self.__name], fld.ManyToManyField):
+                raise
+            value = None
+        if value is None or type(value) is int:  # Raw ForeignKey id (or NULL)
+            value = instance.link(self.__name, value)
+            self.__column.__set__(instance, value)
+        return value
+
+    def __set__(self, instance, value):
+        self.__column.__set__(instance, value)
+
+    def __delete__(self, instance):
+        self.__column.__delete__(instance)
+
+
+def make_row_class(model) -> type:  # ModelInstance subclass storing model columns in __slots__
+    columns = type(f'{model.__name__}Columns', (ModelInstance,), {'__slots__': tuple(model.fields)})
+    return type(f'{model.__name__}Instance', (columns,), {
+        '__slots__': (),
+        'columns': {name: vars(columns)[name] for name in model.fields},
+        **{  # Relation wrappers are created lazily
+            name: LinkAttribute(name, vars(columns)[name])
+            for name, field in model.fields.items()
+            if isinstance(field, (fld.ForeignKey, fld.ManyToManyField))
+        }
+    })
+
+
+def insert_batches(rows: list, batch_size: int):  # Splitting rows parameters by rows number and statement size
+    batch, size = [], 0
+    for row in rows:
+        row_size = sum(len(param) for param in row if isinstance(param, (str, bytes)))
+        if batch and (len(batch) == batch_size or size + row_size > INSERT_BATCH_BYTES):
+            yield batch
+            batch, size = [], 0
+        batch.append(row)
+        size += row_size
+    if batch:
+        yield batch
+
+
 class ModelInstance:  # Model wrapper class to restrict access to Model class fields and methods
+    # Column values are stored in slots of per model row class (Model.row_class),
+    # other attributes (annotated fields) are kept in instance dict
+    __slots__ = ('__model', '__cache', '__deferred', '__links', '__original', '__dict__')
+    columns = {}  # Column slots by field name
+
+    def __new__(cls, model, *args, **kwargs):  # Rows are built as instances of model row class
+        return super().__new__(model.row_class if cls is ModelInstance else cls)
+
     def __init__(
             self,
             model,
             related_fields: list[str]=None,
-            prefetched_fields: dict=None,
+            deferred: dict[str, DeferredBatch]=None,  # Loaders of skipped fields by select_related path ('' for own)
             **kwargs
     ):
-        self.__cache = {}  # Cache to store nested model fields data
-        # Ejecting related model data from kwargs given (Foreign Key)
-        if related_fields:
-            for field in related_fields:  # Nested model field (ForeignKey)
-                fnames = field.split('__')  # Splitting to get subfields sequence
-                current_model = model
-                for fname in fnames:  # Getting proper nested model
-                    try:
-                        attr = getattr(current_model, fname)
-                        current_model = attr.ref
-                    except AttributeError:
-                        break
-                self.__cache[field] = ModelInstance(
-                    current_model,
-                    **{
-                        key.replace(f'{field}__', ''): kwargs.pop(key)
-                        for key in tuple(kwargs.keys())
-                        if re.search(f'^{field}__([a-z]+_?)+$', key)
-                    }
+        self.__deferred = (deferred or {}).get('', None)  # Loader of own fields skipped by only()/defer()
+        if self.__deferred is not None:
+            self.__deferred.add(self)
+        self.__cache = {}  # Rows selected by select_related() by ForeignKey name
+        self.__links = None  # Relation loaders shared by sibling rows (see share_links())
+        # Ejecting related model data from kwargs given (Foreign Key), parents first
+        related, models = {'': self}, {'': model}
+        for field in sorted(related_fields or (), key=lambda path: path.count('__')):
+            parent, _, fname = field.rpartition('__')
+            models[field] = models[parent].fields[fname].ref
+            values = {
+                key[len(field) + 2:]: kwargs.pop(key) for key in tuple(kwargs)
+                if key.startswith(f'{field}__') and '__' not in key[len(field) + 2:]
+            }
+            if parent in related and values.get('id', None) is not None:  # LEFT JOIN found a row
+                related[field] = related[parent].__cache[fname] = ModelInstance(
+                    models[field],
+                    deferred={'': deferred[field]} if deferred and field in deferred else None,
+                    **values
                 )
-        if prefetched_fields:
-            self.__cache.update(prefetched_fields)
         # Initializing all given fields as class attributes
         for name, value in kwargs.items():
             try:
@@ -41,66 +141,195 @@ class ModelInstance:  # Model wrapper class to restrict access to Model class fi
                 setattr(self, name, attr.from_sql(value))
             except AttributeError:
                 setattr(self, name, value)
-        self.__model, fields = model, model.fields
-        # Initializing related models fields as field wrappers
-        for name, value in fields.items():
-            if isinstance(value, fld.ManyToManyField):
-                fields[name].m1 = model
-                setattr(
-                    self, name, fld.ManyToManyFieldInstance(
-                        fields[name], self.id, dict(filter(
-                            lambda f: name in f[0],
-                            self.__cache.items()
-                        ))
-                    )
-                )
-            elif isinstance(value, fld.ForeignKey):
-                setattr(
-                    self, name, fld.ForeignKeyInstance(
-                        fields[name], getattr(self, name),
-                        dict(filter(
-                            lambda f: name in f[0],
-                            self.__cache.items()
-                        ))
-                    )
-                )
+        self.__model = model  # Related models fields are wrapped on first access
+        self.__original = {}  # Column values as stored in database (query parameters form)
+        self.mark_saved()
+        identity = ses.current()
+        if identity is not None:  # Created or loaded rows are known to the session
+            identity.add(self)
 
     @property
     def model (self):
         return self.__model
 
-    def save(self):  # Saves changes manually appended to model instance via <model>.<field> = <value>
+    def __getattr__(self, name: str):  # Skipped field is loaded on first access along with sibling rows
+        if name.startswith('_') or self.__deferred is None or name not in self.__deferred.fields:
+            raise AttributeError(
+                f'"{type(self).__name__}" object has no attribute "{name}"'
+            )
+        self.__deferred.load()
+        if self.__value(name) is _missing:  # Row was deleted before skipped fields were loaded
+            raise AttributeError(
+                f'Deferred field "{name}" could not be loaded'
+            )
+        return getattr(self, name)
+
+    def __value(self, name: str):  # Stored field value (raw ForeignKey id), skipped fields are not loaded
+        column = self.columns.get(name, None)
+        try:
+            return column.__get__(self) if column is not None else object.__getattribute__(self, name)
+        except AttributeError:
+            return _missing
+
+    def link(self, name: str, value: int=None):  # Relation wrapper of ForeignKey id or ManyToMany field
+        field = self.__model.fields[name]
+        batch = self.__links.get(name, None) if self.__links is not None else None
+        if isinstance(field, fld.ManyToManyField):
+            field.m1 = self.__model
+            return fld.ManyToManyFieldInstance(field, self.id, batch=batch)
+        return fld.ForeignKeyInstance(field, value, self.__cache.get(name, None), batch=batch)
+
+    def share_links(self, batches: dict) -> None:  # Registering relation ids in sibling rows loaders by field name
+        self.__links = batches  # Wrappers are still created on first access only
+        for name, batch in batches.items():
+            value = self.__value(name)
+            if isinstance(self.__model.fields[name], fld.ManyToManyField):
+                if value is _missing:  # Already created wrapper (e.g. prefetched) is kept
+                    batch.add(self.id)
+            elif type(value) is int and name not in self.__cache:  # Raw id not selected by select_related()
+                batch.add(value)
+
+    @staticmethod  # Building model instance (with select_related() ones) from tuple row by precomputed plan
+    def hydrate(plan: qr.HydrationPlan, row: tuple, deferred: dict=None, identity=None):
+        instances = {}
+        for path, parent, fname, model, id_index, columns in plan.instances:
+            if path and (row[id_index] is None or parent not in instances):  # LEFT JOIN found nothing
+                continue
+            known = identity.get(model, row[id_index]) if identity is not None else None
+            if known is not None:  # Session already has the row, its instance is reused
+                if path:
+                    instances[parent].__cache.setdefault(fname, known)
+                instances[path] = known
+                continue
+            self, original = object.__new__(model.row_class), {}
+            self.__model, self.__cache, self.__links = model, {}, None
+            for index, name, column, from_sql, to_param in columns:
+                value = row[index]
+                if value is not None:
+                    value = from_sql(value)
+                column.__set__(self, value)
+                original[name] = to_param(value)
+            del original['id']
+            self.__original = original
+            self.__deferred = deferred.get(path, None) if deferred else None
+            if self.__deferred is not None:
+                self.__deferred.add(self)
+            if path:
+                instances[parent].__cache[fname] = self
+            if identity is not None:
+                identity.add(self)
+            instances[path] = self
+        self = instances['']
+        for index, alias in plan.extra:  # Annotated fields
+            setattr(self, alias, row[index])
+        return self
+
+    @property
+    def deferred_fields(self) -> list[str]:  # Fields skipped by only()/defer() and not loaded yet
+        return [
+            name for name in self.__deferred.fields if self.__value(name) is _missing
+        ] if self.__deferred is not None else []
+
+    def load_deferred(self, **values) -> None:  # Setting skipped fields selected (assigned ones are kept)
+        values = {name: value for name, value in values.items() if self.__value(name) is _missing}
+        for name, value in values.items():
+            field = self.__model.fields[name]
+            setattr(self, name, field.from_sql(value))  # ForeignKey is wrapped on first access
+        if values:
+            self.mark_saved(*values)
+
+    def __param(self, name: str):  # Current value of field in query parameter form
+        value = self.__value(name)
+        return value if value is _missing else self.__model.fields[name].to_param(value)
+
+    @property
+    def dirty_fields(self) -> list[str]:  # Fields changed since instance was loaded or saved
+        return [
+            name for name, field in self.__model.fields.items()
+            if name != 'id' and not isinstance(field, fld.ManyToManyField)
+            and self.__param(name) != self.__original.get(name, _missing)
+        ]
+
+    def mark_saved(self, *names: str) -> None:  # Remembering current values as stored ones (all fields if none given)
+        for name in names or self.__model.fields:
+            if name != 'id' and not isinstance(self.__model.fields[name], fld.ManyToManyField):
+                value = self.__param(name)
+                if value is not _missing:
+                    self.__original[name] = value
+
+    def save(self, update_fields: list[str]=None):  # Saves changes manually appended to model instance via <model>.<field> = <value>
+        if update_fields is not None:  # Explicitly given fields are written regardless of changes
+            for name in update_fields:
+                if name == 'id' or name not in self.__model.fields or isinstance(
+                        self.__model.fields[name], fld.ManyToManyField
+                ):  # Checking if all fields specified right
+                    raise Exception(f'Wrong field specified in save method: "{name}"')
+            # Skipped fields not loaded yet hold stored values already
+            update_fields = [name for name in update_fields if self.__param(name) is not _missing]
+        else:  # Only changed columns are written
+            update_fields = self.dirty_fields
+        if not update_fields:  # Nothing to write
+            return
         self.__model.check_table()
+        update_set, params, computed = [], [], []
+        for name in update_fields:
+            value = self.__param(name)
+            if isinstance(value, expr.BaseExpression):  # Value is computed by database
+                sql, eparams = qr.compile_expression(self.__model, value)
+                update_set.append(f'{self.__model.table_name}.{name} = {sql}')
+                params.extend(eparams)
+                computed.append(name)
+            else:
+                update_set.append(f'{self.__model.table_name}.{name} = %s')
+                params.append(value)
         try:  # UPDATE command
-            with connect(**db_data) as connection:
-                with connection.cursor(dictionary=True) as cursor:
-                    cursor.execute(
-                        f"""UPDATE {self.__model.table_name} SET {', '.join([
-                        f'''{self.__model.table_name}.{name} = {
-                        self.__model.fields[name].to_sql(val)}'''
-                        for name, val in self.__model.fields.items() 
-                        if name != 'id'
-                        ])} WHERE {self.__model.table_name}.id = {self.id}"""
-                    )
-                    connection.commit()
+            with cn.connection() as connection:
+                with cn.execute(
+                    connection,
+                    f"""UPDATE {self.__model.table_name} SET {', '.join(
+                        update_set
+                    )} WHERE {self.__model.table_name}.id = %s""",
+                    (*params, self.id)
+                ):
+                    pass
+                if computed:  # Reading values computed by database back
+                    with cn.execute(
+                        connection,
+                        f'''SELECT {', '.join(computed)} FROM {
+                        self.__model.table_name} WHERE id = %s''',
+                        (self.id,)
+                    ) as cursor:
+                        for name, value in zip(computed, cursor.fetchall()[0]):  # ForeignKey is wrapped on access
+                            setattr(self, name, self.__model.fields[name].from_sql(value))
+                cn.commit(connection)
+            cch.invalidate(self.__model.table_name)
+            self.mark_saved(*update_fields)
         except Error as err:
             print(err)
 
     def delete(self):  # Deletes model instance row by id
         self.__model.check_table()
         try:  # DELETE command
-            with connect(**db_data) as connection:
-                with connection.cursor(dictionary=True) as cursor:
-                    cursor.execute(
-                        f"""DELETE FROM {self.__model.table_name
-                        } WHERE id = {self.id}"""
-                    )
-                    connection.commit()
+            with cn.connection() as connection:
+                with cn.execute(
+                    connection,
+                    f'DELETE FROM {self.__model.table_name} WHERE id = %s',
+                    (self.id,)
+                ):
+                    cn.commit(connection)
+            cch.invalidate(*self.__model.cascade_tables())
+            identity = ses.current()
+            if identity is not None:  # Deleted row must not be reused by session
+                identity.discard(self.__model, self.id)
         except Error as err:
             print(err)
 
 
 class Model:
+    def __init_subclass__(cls, **kwargs):  # Generating compact row class once model class is defined
+        super().__init_subclass__(**kwargs)
+        cls.row_class = make_row_class(cls)
+
     def __validate_field_names(self):  # Validating model field names
         for name in self.fields.keys():
             if '__' in name:  # Special query kwargs delimiter
@@ -117,13 +346,13 @@ class Model:
     @classmethod
     @property
     def fields(cls):  # Returns dict with model field names and Field-class types
-        try:  # If already filled
-            return cls.__fields
-        except AttributeError:  # Getting model fields
+        try:  # If already filled (parent model fields are not inherited)
+            return vars(cls)['_Model__fields']
+        except KeyError:  # Getting model fields
             fields = {'id': fld.IntField(null=False, unique=True)}  # Adding id field not to get false error during validation
             for name in dir(cls):  # All class attributes iteration
                 try:
-                    if name == 'fields':  # Ignoring fields attribute not to get infinite recursion
+                    if name in ('fields', 'row_class'):  # Ignoring fields attribute not to get infinite recursion
                         raise AttributeError
                     attr = getattr(cls, name)
                     if issubclass(type(attr), fld.Field):  # Only Field subclasses are taken into consideration
@@ -135,28 +364,63 @@ class Model:
 
     @classmethod
     def check_table(cls):
+        if sch.registry.known(cls.table_name):  # Table was already verified by this process
+            return
         for field in cls.fields.values():
             if isinstance(field, fld.ForeignKey):
                 field.ref.check_table()
             elif isinstance(field, fld.ManyToManyField):
                 field.m1 = cls
+                field.ref.check_table()  # Junction table references both models
         try:  # Check if model table exists, create if not
-            with connect(**db_data) as connection:
-                with connection.cursor() as cursor:
-                    cursor.execute('SHOW TABLES')
-                    tables = cursor.fetchall()
-                    if not (cls.table_name,) in tables:
-                        cls.__init__(cls)
+            if not sch.registry.synced:  # Remembering all the tables found not to query them later
+                with cn.connection() as connection:
+                    with connection.cursor() as cursor:
+                        cursor.execute('SHOW TABLES')
+                        sch.registry.sync(table for table, in cursor.fetchall())
+            if not sch.registry.known(cls.table_name):
+                cls.__init__(cls)
         except Error as err:
             print(err)
 
+    @classmethod
+    def __models(cls) -> list:  # Model and all its subclasses (all the models if called for Model)
+        models, subclasses = [], [cls] if cls is not Model else cls.__subclasses__()
+        while subclasses:  # Collecting all the model subclasses recursively
+            model = subclasses.pop(0)
+            models.append(model)
+            subclasses.extend(model.__subclasses__())
+        return models
+
+    @classmethod
+    def create_all(cls):  # Verifies (creating if necessary) tables of all the models at once
+        sch.registry.reset()  # Tables list is loaded once by the first check
+        for model in cls.__models():
+            model.check_table()
+
+    @classmethod
+    def cascade_tables(cls) -> tuple[str]:  # Tables deleting model rows may change (model table included)
+        tables, pending, models = [], [cls], Model.__models()
+        while pending:  # Referencing models rows are deleted or updated by ON DELETE actions
+            model = pending.pop()
+            if model.table_name in tables:
+                continue
+            tables.append(model.table_name)
+            for other in models:
+                for field in other.fields.values():
+                    if isinstance(field, fld.ForeignKey) and field.ref is model:
+                        pending.append(other)
+                    elif isinstance(field, fld.ManyToManyField) and model in (other, field.ref):
+                        tables.append(f'{other.__name__}_{field.ref.__name__}')  # Junction table
+        return tuple(tables)
+
     def __init__(self):  # Check if db table exists. If not creates one.
         try:  # Validating field list either in @classmethod...
             self.__validate_field_names(self)
         except TypeError:  # ... or in regular method
             self.__validate_field_names()
         try:
-            with connect(**db_data) as connection:
+            with cn.connection() as connection:
                 with connection.cursor() as cursor:
                     cursor.execute(
                         f'''CREATE TABLE IF NOT EXISTS {self.table_name
@@ -171,68 +435,237 @@ class Model:
                     for field in self.fields.values():
                         if isinstance(field, fld.ManyToManyField):
                             field.create()   # And creating necessary joint table
+            sch.registry.add(self.table_name)
         except Error as err:
             print(err)
 
     @classmethod
-    def create(cls, **kwargs):  # Creating new row in table
+    def create(cls, fetch_defaults: bool=False, **kwargs):  # Creating new row in table
         cls.check_table()
-        vals = []  # Placeholder for SQL-friendly fields values
+        vals = []  # Placeholder for query parameters
         for name, val in kwargs.items():
             if not name in cls.fields or isinstance(
                     cls.fields[name], fld.ManyToManyField
             ):  # Checking if all fields specified right
                 raise Exception(f'Wrong field specified in create method: "{name}"')
-            else:  # Converting fields value to SQL-friendly form
-                vals.append(cls.fields[name].to_sql(val))
+            else:  # Converting fields value to query parameter
+                vals.append(cls.fields[name].to_param(val))
         try:  # Creating database log
-            with connect(**db_data) as connection:
-                with connection.cursor() as cursor:
-                    cursor.execute(
-                        f'''INSERT INTO {cls.table_name} ({', '.join(
-                            kwargs.keys()
-                        )}) VALUES ({', '.join(vals)})'''
-                    )
-                    connection.commit()
+            with cn.connection() as connection:
+                with cn.execute(
+                    connection,
+                    f'''INSERT INTO {cls.table_name} ({', '.join(
+                        kwargs.keys()
+                    )}) VALUES ({', '.join('%s' for _ in vals)})''',
+                    vals
+                ) as cursor:
+                    row_id = cursor.lastrowid  # Auto increment id of inserted row
+                    cn.commit(connection)
+            cch.invalidate(cls.table_name)
         except Error as err:
             print(err)
-        return cls.get(**kwargs)
+            return None
+        omitted = [  # Columns filled by database defaults
+            name for name, field in cls.fields.items()
+            if name != 'id' and name not in kwargs
+            and not isinstance(field, fld.ManyToManyField)
+        ]
+        if omitted and fetch_defaults:  # Single primary key lookup to get default values
+            return cls.get(id=row_id)
+        return ModelInstance(  # Building instance from inserted values, omitted ones are left None
+            cls, id=row_id, **dict(zip(kwargs.keys(), vals)), **dict.fromkeys(omitted)
+        )
 
     @classmethod
-    def bulk_create(cls, *args):  # Creating new rows in table
+    def bulk_create(
+            cls,
+            *args,
+            batch_size: int=INSERT_BATCH_SIZE,  # Max rows per INSERT statement
+            return_instances: bool=True,  # Pure ingest returns nothing if False
+            fetch_defaults: bool=False  # Whether to select rows back if some columns were omitted
+    ):  # Creating new rows in table
         # Performing necessary data correctness checks
         if not all(map(lambda a: isinstance(a, dict), args)):
             raise TypeError('Wrong arguments type for bulk_create: expected dict.')
         if not all(map(lambda a: a.keys() == args[0].keys(), args[1:])):
             raise TypeError('All init dicts must have the same set of attributes.')
+        if not args:
+            return cont.QuerySet(cls, container=()) if return_instances else None
+        names = tuple(args[0].keys())
+        for name in names:
+            if not name in cls.fields or isinstance(
+                    cls.fields[name], fld.ManyToManyField
+            ):  # Checking if all fields specified right
+                raise Exception(f'Wrong field specified in bulk_create method: "{name}"')
         cls.check_table()
-        vals = []  # Placeholder for SQL-friendly field values sets
-        for arg in args:
-            vals.append([])
-            for name, val in arg.items():
-                if not name in cls.fields:  # Checking if all fields specified right
-                    raise Exception(f'Wrong field specified in bulk_create method: "{name}"')
-                else:  # Converting fields value to SQL-friendly form
-                    vals[-1].append(cls.fields[name].to_sql(val))
-            vals[-1] = f"({', '.join(vals[-1])})"
+        rows = [  # Query parameters of every row
+            tuple(cls.fields[name].to_param(arg[name]) for name in names)
+            for arg in args
+        ]
+        # Batches are bounded by rows number, statement placeholders limit and string values size
+        batch_size = max(1, min(batch_size, MAX_STATEMENT_PARAMS // max(len(names), 1)))
+        row_sql = f"({', '.join('%s' for _ in names)})"  # Single row placeholders
+        given_ids = 'id' in names  # Rows are inserted with explicit ids, nothing to compute
+        ids, increment = [], 1  # Auto increment ids of inserted rows and step between them
         try:  # Creating database log
-            with connect(**db_data) as connection:
-                with connection.cursor() as cursor:
-                    cursor.execute(
-                        f'''INSERT INTO {cls.table_name} ({', '.join(
-                            args[0].keys()
-                        )}) VALUES {', '.join(vals)}'''
-                    )
-                    connection.commit()
+            with cn.connection() as connection:
+                if return_instances and len(rows) > 1 and not given_ids:  # Step differs from 1 e.g. under Galera or group replication
+                    with cn.execute(connection, 'SELECT @@auto_increment_increment') as cursor:
+                        increment = cursor.fetchall()[0][0]
+                for batch in insert_batches(rows, batch_size):
+                    with cn.execute(
+                        connection,
+                        f'''INSERT INTO {cls.table_name} ({', '.join(names)
+                        }) VALUES {', '.join(row_sql for _ in batch)}''',
+                        [param for row in batch for param in row]
+                    ) as cursor:
+                        if given_ids:
+                            ids.extend(row[names.index('id')] for row in batch)
+                        else:  # Multi-row INSERT reports id of its first row, the rest ones follow
+                            # by auto_increment_increment since InnoDB allocates them all at once
+                            ids.extend(range(
+                                cursor.lastrowid, cursor.lastrowid + len(batch) * increment, increment
+                            ))
+                cn.commit(connection)  # All the batches are committed together
+            cch.invalidate(cls.table_name)
         except Error as err:
             print(err)
-        return cls.filter(
-            qr.Q.Or(
-                *(qr.Q.And(
-                    *(qr.Q(**{name: value}) for name, value in kwargs.items())
-                ) for kwargs in args)
-            )
-        )
+            return None
+        if not return_instances:
+            return None
+        omitted = [  # Columns filled by database defaults
+            name for name, field in cls.fields.items()
+            if name != 'id' and name not in names
+            and not isinstance(field, fld.ManyToManyField)
+        ]
+        if omitted and fetch_defaults:  # Default values are selected lazily by primary keys
+            return cls.filter(id__in=ids)
+        return cont.QuerySet(cls, id__in=ids, container=tuple(
+            ModelInstance(cls, **{'id': row_id, **dict(zip(names, row))}, **dict.fromkeys(omitted))
+            for row_id, row in zip(ids, rows)
+        ))
+
+    @classmethod
+    def bulk_update(
+            cls,
+            instances,  # Model instances to write
+            fields: list[str],  # Names of fields to write
+            batch_size: int=UPDATE_BATCH_SIZE  # Max rows per UPDATE statement
+    ) -> int:  # UPDATE ... SET <field> = CASE id WHEN ... END ... WHERE id IN (...) command
+        instances = tuple(instances)
+        for instance in instances:
+            if not isinstance(instance, ModelInstance) or instance.model is not cls:
+                raise TypeError(
+                    f'Wrong instance type for bulk_update: expected {cls.__name__} instance.'
+                )
+        if not fields:
+            raise ValueError('At least one field required for bulk_update method.')
+        for name in fields:
+            if name == 'id' or name not in cls.fields or isinstance(
+                    cls.fields[name], fld.ManyToManyField
+            ):  # Checking if all fields specified right
+                raise Exception(f'Wrong field specified in bulk_update method: "{name}"')
+        if not instances:
+            return 0
+        cls.check_table()
+        # Every row takes two placeholders per field and one inside of IN (...)
+        batch_size = max(1, min(batch_size, MAX_STATEMENT_PARAMS // (2 * len(fields) + 1)))
+        updated = 0  # Number of rows changed
+        try:  # UPDATE command
+            with cn.connection() as connection:
+                for start in range(0, len(instances), batch_size):
+                    batch = instances[start:start + batch_size]
+                    params = []
+                    for name in fields:
+                        for instance in batch:
+                            params.extend((
+                                instance.id,
+                                cls.fields[name].to_param(getattr(instance, name))
+                            ))
+                    params.extend(instance.id for instance in batch)
+                    with cn.execute(
+                        connection,
+                        f'''UPDATE {cls.table_name} SET {', '.join(
+                            f"{name} = CASE id {' '.join('WHEN %s THEN %s' for _ in batch)} END"
+                            for name in fields
+                        )} WHERE id IN ({', '.join('%s' for _ in batch)})''',
+                        params
+                    ) as cursor:
+                        updated += cursor.rowcount
+                cn.commit(connection)  # All the batches are committed together
+            cch.invalidate(cls.table_name)
+            for instance in instances:
+                instance.mark_saved(*fields)
+        except Error as err:
+            print(err)
+        return updated
+
+    @classmethod
+    def bulk_upsert(
+            cls,
+            rows,  # Dicts of field values, all with the same keys
+            unique_fields: list[str],  # Fields identifying existing rows (unique key columns)
+            update_fields: list[str]=None,  # Fields overwritten on existing rows (all the rest by default)
+            batch_size: int=INSERT_BATCH_SIZE  # Max rows per statement
+    ) -> tuple[int, int]:  # INSERT ... ON DUPLICATE KEY UPDATE command
+        # Returns (inserted, updated) rows numbers, unchanged existing rows are not counted as updated
+        rows = tuple(rows)
+        if not all(map(lambda r: isinstance(r, dict), rows)):
+            raise TypeError('Wrong arguments type for bulk_upsert: expected dict.')
+        if not rows:
+            return 0, 0
+        names = tuple(rows[0].keys())
+        if not all(map(lambda r: tuple(r.keys()) == names, rows[1:])):
+            raise TypeError('All upsert dicts must have the same set of attributes.')
+        if not unique_fields or not set(unique_fields) <= set(names):
+            raise ValueError('All unique_fields must be given in every upserted row.')
+        if update_fields is None:
+            update_fields = [name for name in names if name not in unique_fields]
+        for name in set(names) | set(update_fields):
+            if not name in cls.fields or isinstance(
+                    cls.fields[name], fld.ManyToManyField
+            ):  # Checking if all fields specified right
+                raise Exception(f'Wrong field specified in bulk_upsert method: "{name}"')
+        for name in unique_fields:  # Otherwise rows would silently match on some other key
+            if not cls.fields[name].unique:
+                raise ValueError(f'Field "{name}" given in unique_fields is not unique.')
+        if not set(update_fields) <= set(names):
+            raise ValueError('All update_fields must be given in every upserted row.')
+        cls.check_table()
+        batch_size = max(1, min(batch_size, MAX_STATEMENT_PARAMS // len(names)))
+        row_sql = f"({', '.join('%s' for _ in names)})"  # Single row placeholders
+        update_sql = ', '.join(  # Existing row stays the same if nothing to update
+            f'{name} = VALUES({name})' for name in update_fields
+        ) if update_fields else 'id = id'
+        params = [tuple(cls.fields[name].to_param(row[name]) for name in names) for row in rows]
+        inserted = updated = 0
+        try:  # Creating or updating database logs
+            with cn.connection() as connection:
+                for batch in insert_batches(params, batch_size):
+                    with cn.execute(
+                        connection,
+                        f'''INSERT INTO {cls.table_name} ({', '.join(names)
+                        }) VALUES {', '.join(row_sql for _ in batch)
+                        } ON DUPLICATE KEY UPDATE {update_sql}''',
+                        [param for row in batch for param in row]
+                    ) as cursor:
+                        # MySQL counts 1 affected row per insert, 2 per changed existing row and 0 per
+                        # unchanged one, while every existing row is reported among duplicates
+                        duplicates = re.search(r'Duplicates: (\d+)', cn.info(connection))
+                        if duplicates is not None:
+                            batch_inserted = len(batch) - int(duplicates.group(1))
+                        elif len(batch) == 1:  # Single row statement reports no info
+                            batch_inserted = int(cursor.rowcount == 1)
+                        else:
+                            raise Error('Server did not report duplicates of bulk_upsert statement.')
+                        inserted += batch_inserted
+                        updated += (cursor.rowcount - batch_inserted) // 2
+                cn.commit(connection)  # All the batches are committed together
+            cch.invalidate(cls.table_name)
+            cls.__forget()
+        except Error as err:
+            print(err)
+        return inserted, updated
 
     @classmethod
     def filter(cls, *args, **kwargs):  # Returns QuerySet of model instances matching query
@@ -267,34 +700,64 @@ class Model:
     def prefetch_related(cls, *args):
         return cls.filter().prefetch_related(*args)
 
+    @classmethod  # Returns QuerySet selecting given fields only, others are loaded on first access
+    def only(cls, *fields):
+        return cls.filter().only(*fields)
+
+    @classmethod  # Returns QuerySet skipping given fields, they are loaded on first access
+    def defer(cls, *fields):
+        return cls.filter().defer(*fields)
+
+    @classmethod  # Returns QuerySet of dicts with given fields only
+    def values(cls, *fields):
+        return cls.filter().values(*fields)
+
+    @classmethod  # Returns QuerySet of tuples (values if flat, named tuples if named) with given fields only
+    def values_list(cls, *fields, flat: bool=False, named: bool=False):
+        return cls.filter().values_list(*fields, flat=flat, named=named)
+
+    @classmethod
+    def cache(cls, ttl: float=None):
+        return cls.filter().cache(ttl)
+
     @classmethod  # Drops database table associated with model
     def drop(cls):
         cls.check_table()
         try:  # DROP TABLE SQL command
-            with connect(**db_data) as connection:
-                with connection.cursor(dictionary=True) as cursor:
+            with cn.connection() as connection:
+                with connection.cursor() as cursor:
                     cursor.execute(f'DROP TABLE IF EXISTS {cls.__name__}s CASCADE')
         except Error as err:
             print(err)
+        finally:  # Table must be verified again on next access
+            sch.registry.discard(cls.table_name)
+            cch.invalidate(*cls.cascade_tables())
+            cls.__forget()
+
+    @classmethod
+    def __forget(cls) -> None:  # Session must not reuse rows changed by database side
+        identity = ses.current()
+        if identity is not None:
+            identity.discard(cls)
 
     @classmethod  # Describes database table
     def describe(cls):
         cls.check_table()
         try:  # DESCRIBE SQL command
-            with connect(**db_data) as connection:
-                with connection.cursor(dictionary=True) as cursor:
+            with cn.connection() as connection:
+                with connection.cursor() as cursor:
                     # Executing query and fetching results
                     cursor.execute(f'DESCRIBE {cls.table_name}')
                     results = cursor.fetchall()
                     # Finding the longest statement in every column
                     cnames = ('Field name', 'Field type', 'Null', 'Key', 'Default value', 'Extra statement')
-                    maxlens = [len(str(max(results, key=lambda res: len(str(res[k])))[k])) for k in results[0].keys()]
+                    maxlens = [len(str(max(results, key=lambda res: len(str(res[k])))[k])) for k in range(len(results[0]))]
                     maxlens = [maxlens[i] if maxlens[i] > len(cnames[i]) else len(cnames[i]) for i in range(len(maxlens))]
                     # Console output
                     print(f'{cls.__name__}s table description:')
                     print(''.join([cnames[i] + ' ' * (maxlens[i] - len(cnames[i])) + '\t\t' for i in range(len(cnames))]))
                     for field in results:  # Adding spaces to fill max column length
-                        vals = list(field.values())
+                        vals = list(field)
                         print(''.join([
                             (
                                 str(vals[i]) if str(vals[i]) else '-'
@@ -305,6 +768,6 @@ class Model:
         except Error as err:
             print(err)
 
-    @classmethod  # Wraps query given into RawQuerySet
-    def raw(cls, query: str):
-        return cont.RawQuerySet(cls, query)
+    @classmethod  # Wraps query given into RawQuerySet (rows are tuples unless dictionary is set)
+    def raw(cls, query: str, dictionary: bool=False):
+        return cont.RawQuerySet(cls, query, dictionary)
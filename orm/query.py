@@ -1,5 +1,10 @@
-from . import fields as fld, aggregate as aggr
+from . import fields as fld, aggregate as aggr, expressions as expr
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+import functools
+import itertools
+import threading
+import re
 
 
 class BaseOperation(ABC):  # Database operation interface
@@ -8,8 +13,13 @@ class BaseOperation(ABC):  # Database operation interface
             self,
             model: object,
             primary_join_index: int,
-            annotate_join_index: int
-    ) -> tuple[list, str, int]:
+            annotate_join_index: int,
+            slots
+    ) -> tuple[list, dict, int]:
+        pass
+
+    @abstractmethod  # Hashable query structure (values excluded) collecting values in binding order
+    def shape(self, values: list) -> tuple:
         pass
 
     @abstractmethod  # Logical OR operation
@@ -33,31 +43,318 @@ class BaseOperation(ABC):  # Database operation interface
         pass
 
 
-ops = {  # SQL operations used in WHERE statement
-    '': lambda name, val: f'''{name} = {val}''',
-    'gt': lambda name, val: f'''{name} > {val}''',
-    'gte': lambda name, val: f'''{name} >= {val}''',
-    'lt': lambda name, val: f'''{name} < {val}''',
-    'lte': lambda name, val: f'''{name} <= {val}''',
-    'startswith': lambda name, val: f"""{name} LIKE BINARY '{val.replace("'", "")}%'""",
-    'istartswith': lambda name, val: f"""LOWER({name}) LIKE '{val.replace("'", "").lower()}%'""",
-    'endswith': lambda name, val: f"""{name} LIKE BINARY '%{val.replace("'", "")}'""",
-    'iendswith': lambda name, val: f"""LOWER({name}) LIKE '%{val.replace("'", "").lower()}'""",
-    'contains': lambda name, val: f"""{name} LIKE BINARY '%{val.replace("'", "")}%'""",
-    'icontains': lambda name, val: f"""LOWER({name}) LIKE '%{val.replace("'", "").lower()}%'""",
-    'range': lambda name, val: f"{name} BETWEEN {val[0]} AND {val[1]}",
-    'year': lambda name, val: f"year({name}) = {val}",
-    'month': lambda name, val: f"month({name}) = {val}",
-    'day': lambda name, val: f"day({name}) = {val}",
-    'hour': lambda name, val: f"hour({name}) = {val}",
-    'minute': lambda name, val: f"minute({name}) = {val}",
-    'second': lambda name, val: f"second({name}) = {val}",
-    'isnull': lambda name, val: f"{name} IS {'NOT' if not val else ''} NULL",
-    'regex': lambda name, val: f"{name} LIKE {val}",
-    'in': lambda name, val: f"{name} IN {val}"
+class InListPolicy:  # How "in" lookups with very long value lists are executed
+    strategies = (
+        'chunk',  # Splitting QuerySet select into several queries (temporary table if impossible)
+        'temp_table'  # Loading values into session temporary table joined by query
+    )
+
+    def __init__(self, threshold: int | None=1000, strategy: str='chunk'):
+        self.threshold = None
+        self.strategy = None
+        self.configure(threshold, strategy)
+
+    def configure(self, threshold: int | None, strategy: str) -> None:  # threshold=None disables both strategies
+        if strategy not in InListPolicy.strategies:
+            raise ValueError(f'Wrong "in" lookup strategy specified: "{strategy}".')
+        if threshold is not None and threshold < 1:
+            raise ValueError('"in" lookup threshold must be positive.')
+        self.threshold = threshold
+        self.strategy = strategy
+
+    def large(self, values) -> bool:  # Check if values list exceeds threshold
+        return self.threshold is not None and len(values) > self.threshold
+
+
+in_lists = InListPolicy()  # Process-wide large "in" lists policy
+temp_table_names = itertools.count()  # Unique temporary table names source
+
+
+def configure_in_lists(threshold: int | None=1000, strategy: str='chunk') -> None:
+    in_lists.configure(threshold, strategy)
+
+
+class Params(tuple):  # Query parameters along with temporary tables to fill before execution
+    def __new__(cls, params=(), temp_tables: dict=None):
+        self = super().__new__(cls, params)
+        self.temp_tables = temp_tables if temp_tables else {}  # Table name -> ids
+        return self
+
+    def __add__(self, other):
+        return Params(
+            tuple(self) + tuple(other),
+            {**self.temp_tables, **getattr(other, 'temp_tables', {})}
+        )
+
+    def __radd__(self, other):
+        return Params(
+            tuple(other) + tuple(self),
+            {**getattr(other, 'temp_tables', {}), **self.temp_tables}
+        )
+
+
+class Slot:  # Parameter placeholder of compiled query filled on every execution
+    def __init__(self, index: int, item: int=None, converters: tuple=(), many: bool=False):
+        self.index = index  # Index of lookup value the parameter is taken from
+        self.item = item  # Index of item inside of lookup value (e.g. range bounds)
+        self.converters = tuple(c for c in converters if c)  # Python value to parameter converters
+        self.many = many  # Value is a sequence rendered as (%s, %s, ...)
+
+    def __convert(self, value):
+        for converter in self.converters:
+            value = converter(value)
+        return value
+
+    def render(self, values: list, temp_tables: dict) -> tuple[str, list]:  # Placeholder and parameters for values given
+        value = values[self.index]
+        if self.item is not None:
+            value = value[self.item]
+        if self.many:
+            params = [self.__convert(v) for v in value]
+            if in_lists.large(params) and all(isinstance(p, int) for p in params):
+                # Long id lists are joined from temporary table instead of being inlined
+                name = f'orm_in_{next(temp_table_names)}'
+                temp_tables[name] = params
+                return f'(SELECT id FROM {name})', []
+            return f"({', '.join('%s' for _ in params)})", params
+        return '%s', [self.__convert(value)]
+
+
+class Parameter:  # Compile-time lookup value handle used by ops to place slots into SQL
+    def __init__(self, slots, index: int | None, value, converter=None):
+        self.__slots = slots
+        self.__index = index  # None for values affecting query structure only
+        self.__converter = converter  # Field value converter
+        self.value = value  # Value query is being compiled for
+
+    def __call__(self, item: int=None, converter=None, many: bool=False) -> str:
+        if self.__index is None:
+            raise ValueError(
+                'Structural lookup value can not be passed as query parameter.'
+            )
+        return self.__slots.add(
+            Slot(self.__index, item, (self.__converter, converter), many)
+        )
+
+
+class ExpressionParameter:  # Compile-time lookup value handle rendering database side expression
+    def __init__(self, sql: str, value):
+        self.__sql = sql
+        self.value = value
+
+    def __call__(self, item: int=None, converter=None, many: bool=False) -> str:
+        if item is not None or many:
+            raise ValueError('Expression can not be used as a sequence lookup value.')
+        return self.__sql
+
+
+class SubqueryParameter:  # Compile-time lookup value handle rendering QuerySet as subquery
+    def __init__(self, sql: str):
+        self.__sql = sql
+        self.value = True  # Subquery is never treated as an empty sequence
+
+    def __call__(self, item: int=None, converter=None, many: bool=False) -> str:
+        if item is not None or not many:
+            raise ValueError('QuerySet can only be used as a value of "in" lookup.')
+        return f'({self.__sql})'
+
+
+class Slots:  # Compile-time collector of query parameter slots
+    marker = re.compile('\x00(\\d+)\x00')  # Slot marker inside of SQL being compiled
+
+    def __init__(self):
+        self.slots = []  # Slots in order of creation
+        self.values = 0  # Number of lookup values consumed so far
+        self.outer = []  # (outer model, its annotate join index, inner model) of subqueries being compiled
+
+    def outer_column(self, name: str) -> str:  # Column of enclosing query referenced via OuterRef
+        if not self.outer:
+            raise ValueError('OuterRef can only be used inside of Exists() subquery.')
+        model, annotate_join_index, inner_model = self.outer[-1]
+        if model.table_name == inner_model.table_name:  # Both would be aliased the same way
+            raise ValueError(
+                f'Exists() subquery referencing outer query must select '
+                f'from other model than {model.__name__}.'
+            )
+        if name not in model.fields or isinstance(model.fields[name], fld.ManyToManyField):
+            raise ValueError(f'Only {model.__name__} own fields may be referenced by OuterRef: "{name}".')
+        return f'{model.table_name}0{annotate_join_index}.{name}'
+
+    def add(self, slot: Slot) -> str:  # Registering slot and returning its marker
+        self.slots.append(slot)
+        return f'\x00{len(self.slots) - 1}\x00'
+
+    def parameter(self, value, converter=None, structural: bool=False) -> Parameter:
+        if structural:  # Value is a part of query shape, nothing to bind
+            return Parameter(self, None, value)
+        self.values += 1
+        return Parameter(self, self.values - 1, value, converter)
+
+
+class HydrationPlan:  # Layout of rows selected by query shape, computed once along with its SQL
+    def __init__(
+            self,
+            model,
+            columns: list[tuple[str | None, str]]  # (select_related path ('' for own, None for annotated), name)
+    ):
+        self.columns = tuple(columns)
+        models, instances = {'': model}, {}
+        for index, (path, name) in enumerate(columns):
+            if path is None:
+                continue
+            if path not in instances:  # Parents are always selected before nested paths
+                parent, _, fname = path.rpartition('__')
+                if path:
+                    models[path] = models[parent].fields[fname].ref
+                instances[path] = (path, parent, fname, models[path], [], [])
+            field = models[path].fields[name]
+            if name == 'id':
+                instances[path][4].append(index)
+            instances[path][5].append((  # Column index, name, slot, converters
+                index, name, models[path].row_class.columns[name], field.from_sql, field.to_param
+            ))
+        # (path, parent path, ForeignKey name, model, id column index, columns) of each row instance
+        self.instances = tuple(
+            (path, parent, fname, model, ids[0], tuple(fcolumns))
+            for path, parent, fname, model, ids, fcolumns in instances.values()
+        )
+        self.extra = tuple(  # Annotated columns (index, alias)
+            (index, name) for index, (path, name) in enumerate(columns) if path is None
+        )
+
+
+@functools.lru_cache(maxsize=None)
+def row_plan(model) -> HydrationPlan:  # Layout of model own columns selected in fields order
+    return HydrationPlan(model, [
+        ('', fname) for fname, fval in model.fields.items()
+        if not isinstance(fval, fld.ManyToManyField)
+    ])
+
+
+class CompiledQuery:  # Reusable SQL template of a query shape with parameter slots
+    def __init__(self, sql: str, slots: Slots, plan: HydrationPlan=None):
+        self.plan = plan  # Model rows layout (None for projections and aggregates)
+        parts = Slots.marker.split(sql)
+        self.__parts = parts[::2]  # SQL pieces between slots
+        self.__slots = tuple(slots.slots[int(i)] for i in parts[1::2])  # Slots in SQL order
+        self.__sql = None if any(  # SQL does not depend on values if no sequences expanded
+            slot.many for slot in self.__slots
+        ) else '%s'.join(self.__parts)
+
+    def bind(self, values: list) -> tuple[str, tuple]:  # SQL and parameters for values given
+        sql, params, temp_tables = [self.__parts[0]], [], {}
+        for slot, part in zip(self.__slots, self.__parts[1:]):
+            placeholder, sparams = slot.render(values, temp_tables)
+            sql.extend((placeholder, part))
+            params.extend(sparams)
+        return self.__sql if self.__sql is not None else ''.join(sql), Params(params, temp_tables)
+
+
+class QueryCache:  # Bounded LRU cache of compiled queries keyed by query shape
+    def __init__(self, maxsize: int=512):
+        self.__maxsize = maxsize
+        self.__queries = OrderedDict()
+        self.__lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def maxsize(self) -> int:
+        return self.__maxsize
+
+    @maxsize.setter
+    def maxsize(self, value: int):
+        with self.__lock:
+            self.__maxsize = value
+            self.__evict()
+
+    def __evict(self):  # Dropping least recently used queries above maxsize
+        while len(self.__queries) > max(self.__maxsize, 0):
+            self.__queries.popitem(last=False)
+
+    def get(self, key: tuple, compile_query) -> CompiledQuery:  # Compiling query on miss
+        with self.__lock:
+            compiled = self.__queries.get(key)
+            if compiled is not None:
+                self.__queries.move_to_end(key)
+                self.hits += 1
+                return compiled
+            self.misses += 1
+        compiled = compile_query()
+        with self.__lock:
+            self.__queries[key] = compiled
+            self.__evict()
+        return compiled
+
+    def clear(self):
+        with self.__lock:
+            self.__queries.clear()
+            self.hits = self.misses = 0
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self.__queries),
+            'maxsize': self.__maxsize
+        }
+
+
+compiled_queries = QueryCache()  # Process-wide compiled queries storage
+
+
+def like(pattern: str, lower: bool=False):  # LIKE pattern converter escaping wildcards of value
+    def converter(value) -> str:
+        value = str(value).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return pattern.format(value.lower() if lower else value)
+    return converter
+
+
+ops = {  # SQL operations used in WHERE statement (val is a Parameter placing value slots)
+    '': lambda name, val: f'{name} = {val()}',
+    'gt': lambda name, val: f'{name} > {val()}',
+    'gte': lambda name, val: f'{name} >= {val()}',
+    'lt': lambda name, val: f'{name} < {val()}',
+    'lte': lambda name, val: f'{name} <= {val()}',
+    'startswith': lambda name, val: f"{name} LIKE BINARY {val(converter=like('{}%'))}",
+    'istartswith': lambda name, val: f"LOWER({name}) LIKE {val(converter=like('{}%', True))}",
+    'endswith': lambda name, val: f"{name} LIKE BINARY {val(converter=like('%{}'))}",
+    'iendswith': lambda name, val: f"LOWER({name}) LIKE {val(converter=like('%{}', True))}",
+    'contains': lambda name, val: f"{name} LIKE BINARY {val(converter=like('%{}%'))}",
+    'icontains': lambda name, val: f"LOWER({name}) LIKE {val(converter=like('%{}%', True))}",
+    'range': lambda name, val: f"{name} BETWEEN {val(0)} AND {val(1)}",
+    'year': lambda name, val: f"year({name}) = {val(converter=int)}",
+    'month': lambda name, val: f"month({name}) = {val(converter=int)}",
+    'day': lambda name, val: f"day({name}) = {val(converter=int)}",
+    'hour': lambda name, val: f"hour({name}) = {val(converter=int)}",
+    'minute': lambda name, val: f"minute({name}) = {val(converter=int)}",
+    'second': lambda name, val: f"second({name}) = {val(converter=int)}",
+    'isnull': lambda name, val: f"{name} IS {'NOT ' if not val.value else ''}NULL",
+    'regex': lambda name, val: f"{name} LIKE {val()}",
+    'in': lambda name, val: f"{name} IN {val(many=True)}" if val.value else 'FALSE'  # Empty list matches nothing
 }
 
 
+def is_subquery(value) -> bool:  # QuerySet (or its slice) compiled into subquery
+    return hasattr(value, 'as_subquery')
+
+
+def value_shape(opname: str, value) -> tuple[object, bool]:  # Lookup value part of query shape
+    if opname == 'isnull':  # IS NULL or IS NOT NULL
+        return bool(value), True
+    elif opname == 'in' and not value:  # Always false constraint
+        return 'empty', True
+    return None, False  # Plain parameter
+
+
+def combine(constraints: list[str], operator: str) -> str:  # Joining non-empty constraints
+    constraints = [c for c in constraints if c]
+    if len(constraints) > 1:
+        return f' {operator} '.join(f'({c})' for c in constraints)
+    return constraints[0] if constraints else ''
+
+
 class Q(BaseOperation):  # Query class to add more complex constraints like AND, OR, NOT
     # Query logical operations wrappers
     class And(BaseOperation):  # Logical AND wrapper
@@ -71,35 +368,37 @@ class Q(BaseOperation):  # Query class to add more complex constraints like AND,
             return Q.Or(other, self)
 
         def __and__(self, other):
-            self.subset.extend(other.subset)
-            return self
+            return Q.And(*self.subset, other)
 
         def __rand__(self, other):
-            other.subset.extend(self.subset)
-            return other
+            return Q.And(other, *self.subset)
 
         def __invert__(self):
-            return Q.Or([~q for q in self.subset])
+            return Q.Not(self)
+
+        def shape(self, values: list) -> tuple:
+            return ('AND',) + tuple(q.shape(values) for q in self.subset)
 
         def assemble_query(
                 self,
                 model: object,
                 primary_join_index: int,
-                annotate_join_index: int
-        ) -> tuple[list, str, int]:
+                annotate_join_index: int,
+                slots
+        ) -> tuple[list, dict, int]:
             joins, constraints = [], {'where': [], 'having': []}
             for q in self.subset:
-                ajoins, aconstraints, primary_join_index  = q.assemble_query(
-                    model, primary_join_index, annotate_join_index
+                ajoins, aconstraints, primary_join_index = q.assemble_query(
+                    model, primary_join_index, annotate_join_index, slots
                 )
                 joins.extend(ajoins)
-                constraints['where'].append(f"({aconstraints['where']})")
-                constraints['having'].append(f"({aconstraints['having']})")
+                constraints['where'].append(aconstraints['where'])
+                constraints['having'].append(aconstraints['having'])
             return (
                 joins,
                 {
-                    'where': ' AND '.join(constraints['where']),
-                    'having': ' AND '.join(constraints['having']),
+                    'where': combine(constraints['where'], 'AND'),
+                    'having': combine(constraints['having'], 'AND'),
                 },
                 primary_join_index
             )
@@ -109,12 +408,10 @@ class Q(BaseOperation):  # Query class to add more complex constraints like AND,
             self.subset = args
 
         def __or__(self, other):
-            self.subset.extend(other.subset)
-            return self
+            return Q.Or(*self.subset, other)
 
         def __ror__(self, other):
-            other.subset.extend(self.subset)
-            return other
+            return Q.Or(other, *self.subset)
 
         def __and__(self, other):
             return Q.And(self, other)
@@ -123,33 +420,37 @@ class Q(BaseOperation):  # Query class to add more complex constraints like AND,
             return Q.And(other, self)
 
         def __invert__(self):
-            return Q.And([~q for q in self.subset])
+            return Q.Not(self)
+
+        def shape(self, values: list) -> tuple:
+            return ('OR',) + tuple(q.shape(values) for q in self.subset)
 
         def assemble_query(
                 self,
                 model: object,
                 primary_join_index: int,
-                annotate_join_index: int
-        ) -> tuple[list, str, int]:
+                annotate_join_index: int,
+                slots
+        ) -> tuple[list, dict, int]:
             joins, constraints = [], {'where': [], 'having': []}
             for q in self.subset:
-                ajoins, aconstraints = q.assemble_query(
-                    model, primary_join_index, annotate_join_index
+                ajoins, aconstraints, primary_join_index = q.assemble_query(
+                    model, primary_join_index, annotate_join_index, slots
                 )
                 joins.extend(ajoins)
-                constraints['where'].append(f"({aconstraints['where']})")
-                constraints['having'].append(f"({aconstraints['having']})")
+                constraints['where'].append(aconstraints['where'])
+                constraints['having'].append(aconstraints['having'])
             return (
                 joins,
                 {
-                    'where': ' OR '.join(constraints['where']),
-                    'having': ' OR '.join(constraints['having']),
+                    'where': combine(constraints['where'], 'OR'),
+                    'having': combine(constraints['having'], 'OR'),
                 },
                 primary_join_index
             )
 
     class Not(BaseOperation):  # Logical NOT wrapper
-        def __init__(self, q):
+        def __init__(self, q: BaseOperation):
             self.query = q
 
         def __or__(self, other):
@@ -165,69 +466,154 @@ class Q(BaseOperation):  # Query class to add more complex constraints like AND,
             return Q.And(other, self)
 
         def __invert__(self):
-            return Q(**self.query)
+            return self.query
+
+        def shape(self, values: list) -> tuple:
+            return 'NOT', self.query.shape(values)
 
         def assemble_query(
                 self,
                 model: object,
                 primary_join_index: int,
-                annotate_join_index: int
-        ) -> tuple[list, str, int]:
-            joins, constraints, primary_join_index = Q.make_query(
-                model, primary_join_index, annotate_join_index  **self.query
+                annotate_join_index: int,
+                slots
+        ) -> tuple[list, dict, int]:
+            joins, constraints, primary_join_index = self.query.assemble_query(
+                model, primary_join_index, annotate_join_index, slots
             )
             return (
                 joins,
                 {
-                    'where': f"NOT ({constraints['where']})",
-                    'having': f"NOT ({constraints['having']})",
+                    'where': f"NOT ({constraints['where']})" if constraints['where'] else '',
+                    'having': f"NOT ({constraints['having']})" if constraints['having'] else '',
                 },
                 primary_join_index
             )
 
+    @staticmethod  # Splitting keyword query into field names sequence and operation name
+    def parse_lookup(query: str) -> tuple[list[str], str]:
+        parts = query.split('__')
+        opname = parts[-1] if len(parts) > 1 and parts[-1] in ops else ''
+        return (parts[:-1] if opname else parts), opname
+
+    @staticmethod  # Keyword query structure collecting its values
+    def make_shape(values: list, **kwargs) -> tuple:
+        shape = []
+        for query, value in kwargs.items():
+            if isinstance(value, expr.BaseExpression):  # Expression constants are parameters
+                shape.append((query, value.shape(values)))
+                continue
+            elif is_subquery(value):  # Subquery values are parameters
+                smodel, squery = value.as_subquery()
+                shape.append((query, ('QuerySet', query_shape(smodel, squery, None, values))))
+                continue
+            vshape, structural = value_shape(Q.parse_lookup(query)[1], value)
+            if not structural:
+                values.append(value)
+            shape.append((query, vshape))
+        return tuple(shape)
+
+    @staticmethod  # Column SQL name for field names sequence given
+    def make_column(
+            model,
+            fnames: list[str],
+            primary_join_index: int,
+            annotate_join_index: int
+    ) -> tuple[tuple, str, object, int]:
+        joins, current_model, next_join_index = Q.make_joins(
+            model, fnames[:-1], primary_join_index, annotate_join_index
+        )
+        name = fnames[-1]
+        field = current_model.fields.get(name)
+        if isinstance(field, fld.ManyToManyField):  # Comparing linked rows ids
+            joins, current_model, next_join_index = Q.make_joins(
+                model, fnames, primary_join_index, annotate_join_index
+            )
+            name, field = 'id', current_model.fields['id']
+        if joins:
+            column = f'{joins[-1]["alias"]}.{name}'
+        elif field is not None:
+            column = f'{model.table_name}0{annotate_join_index}.{name}'
+        else:  # Annotated field alias
+            column = name
+        return joins, column, field, next_join_index
+
     @staticmethod  # Create SQL-query string from keyword one
     def make_query(
             model,
             primary_join_index: int,
             annotate_join_index: int,
+            slots,
             **kwargs
-    ):
+    ) -> tuple[list, dict, int]:
         joins, constraints = [], {'where': [], 'having': []}
         for query, value in kwargs.items():
-            parts = query.split('__')
-            opname = parts[-1] if parts[-1] in ops else ''
-            fnames = parts[:-1] if opname else parts
-            joins_extend, current_model, primary_join_index = Q.make_joins(
+            fnames, opname = Q.parse_lookup(query)
+            ajoins, column, field, primary_join_index = Q.make_column(
                 model, fnames, primary_join_index, annotate_join_index
             )
-            joins.extend(joins_extend)  # Extending joins for nested fields
-            if fnames[-1] in current_model.fields:
-                # Reformatting value given into an SQL-friendly
-                # one if model field name is given
+            joins.extend(ajoins)  # Extending joins for nested fields
+            if isinstance(value, expr.BaseExpression):  # Comparing with other columns
+                ajoins, sql, primary_join_index = Q.make_expression(
+                    model, value, primary_join_index, annotate_join_index, slots
+                )
+                joins.extend(ajoins)
+                constraints['where' if field is not None else 'having'].append(
+                    ops[opname](column, ExpressionParameter(sql, value))
+                )
+                continue
+            elif is_subquery(value):  # Subquery executed by database
+                if isinstance(field, fld.ForeignKey) and value.model is not field.ref and \
+                        value.as_subquery()[1].get('values', None) is None:  # Projected column is not checked
+                    raise TypeError(
+                        f'Wrong QuerySet model for ForeignKey lookup: '
+                        f'expected {field.ref.__name__} but got {value.model.__name__}'
+                    )
+                constraints['where' if field is not None else 'having'].append(
+                    ops[opname](column, SubqueryParameter(make_subquery(value, slots)))
+                )
+                continue
+            structural = value_shape(opname, value)[1]
+            if field is not None:
+                # Converting value given into a database
+                # parameter if model field name is given
                 constraints['where'].append(ops[opname](
-                    f'''{joins[-1]["alias"] + '.' if joins
-                    else f"{model.table_name}00."
-                    if fnames[-1] in model.fields else ''}{fnames[-1]}''',
-                    current_model.fields.get(fnames[-1]).to_sql(value)
+                    column, slots.parameter(value, field.to_param, structural)
                 ))
             else:
-                # Last subfield specified in query was either not
-                # in operations list or not in model fields list
+                # Last subfield specified in query was
+                # not in model fields list (annotated field)
                 constraints['having'].append(ops[opname](
-                    f'''{joins[-1]["alias"] + '.' if joins
-                    else f"{model.table_name}00."
-                    if fnames[-1] in model.fields else ''}{fnames[-1]}''',
-                    value
+                    column, slots.parameter(value, None, structural)
                 ))
         return (
             joins,
             {
-                'where': ' AND '.join(constraints['where']),
-                'having': ' AND '.join(constraints['having'])
+                'where': combine(constraints['where'], 'AND'),
+                'having': combine(constraints['having'], 'AND')
             },
             primary_join_index
         )
 
+    @staticmethod  # Assembling database side expression, each field reference with its own joins
+    def make_expression(
+            model,
+            expression: expr.BaseExpression,
+            primary_join_index: int,
+            annotate_join_index: int,
+            slots
+    ) -> tuple[list, str, int]:
+        joins, state = [], {'primary_join_index': primary_join_index}
+
+        def column(name: str) -> str:
+            ajoins, acolumn, _, state['primary_join_index'] = Q.make_column(
+                model, name.split('__'), state['primary_join_index'], annotate_join_index
+            )
+            joins.extend(ajoins)
+            return acolumn
+        sql = expression.assemble(column, slots)
+        return joins, sql, state['primary_join_index']
+
     @staticmethod  # Create list of fields for ORDER BY command
     def make_order_by(
             model,
@@ -238,44 +624,38 @@ class Q(BaseOperation):  # Query class to add more complex constraints like AND,
         joins, fields = [], []
         for query in args:
             fnames = query.replace('-', '').split('__')  # "-" -> DESC / "" -> ASC
-            ajoins, _, primary_join_index = Q.make_joins(
+            ajoins, column, _, primary_join_index = Q.make_column(
                 model, fnames, primary_join_index, annotate_join_index
             )
             joins.extend(ajoins)  # Extending joins for nested fields
-            fields.append(
-                f'''{joins[-1]["alias"] + '.' if ajoins
-                else f"{model.table_name}00." 
-                if fnames[-1] in model.fields else ''}{fnames[-1]} {
-                "DESC" if query[0] == "-" else "ASC"}'''
-            )
+            fields.append(f'{column} {"DESC" if query[0] == "-" else "ASC"}')
         return joins, fields, primary_join_index
 
-    @staticmethod  # Assembling query with aggregate functions in fields list
+    @staticmethod  # Assembling aggregate function fields, each one with its own joins
     def make_aggregate(
             model: object,
             primary_join_index: int,
             annotate_join_index: int,
             *args: tuple[aggr.BaseAggregate | aggr.AggregateOperationWrapper],
-            **kwargs: dict[str, aggr.BaseAggregate | aggr.AggregateOperationWrapper]
-    ) -> tuple[list, list, list, int, int]:
-        joins, fields, aliases = [], [], []
-        for aggregate in args:
+            slots=None,  # Parameter slots of expressions constants
+            **kwargs: dict[str, aggr.BaseAggregate | aggr.AggregateOperationWrapper | expr.BaseExpression]
+    ) -> tuple[list[tuple[tuple, str, str, int]], int, int]:
+        aggregates = []  # (joins, field definition, alias, annotate join index) tuples
+        for alias, aggregate in [(None, a) for a in args] + list(kwargs.items()):
             annotate_join_index += 1
-            ajoins, afields, aalias, primary_join_index = aggregate(
-                model, primary_join_index, annotate_join_index
-            )  # BasicAggregate or AggregateOperationWrapper class __call__() method
-            joins.extend(ajoins)
-            fields.append(afields)
-            aliases.append(aalias)  # Using automatically generated aliases
-        for alias, aggregate in kwargs.items():
-            annotate_join_index += 1
-            ajoins, afields, aalias, primary_join_index = aggregate(
+            if isinstance(aggregate, expr.BaseExpression):  # Row expression (always aliased)
+                ajoins, afield, primary_join_index = Q.make_expression(
+                    model, aggregate, primary_join_index, annotate_join_index, slots
+                )
+                aggregates.append((ajoins, afield, alias, annotate_join_index))
+                continue
+            ajoins, afield, aalias, primary_join_index = aggregate(
                 model, primary_join_index, annotate_join_index
             )  # BasicAggregate or AggregateOperationWrapper class __call__() method
-            joins.extend(ajoins)
-            fields.append(afields)
-            aliases.append(alias)  # Using aliases given
-        return joins, fields, aliases, primary_join_index, annotate_join_index
+            aggregates.append((  # Using automatically generated alias if not given
+                ajoins, afield, alias if alias else aalias, annotate_join_index
+            ))
+        return aggregates, primary_join_index, annotate_join_index
 
     @staticmethod
     def make_related_fields(
@@ -283,6 +663,7 @@ class Q(BaseOperation):  # Query class to add more complex constraints like AND,
             primary_join_index: int,
             annotate_join_index: int,
             *args: tuple[str],
+            deferred: dict[str, set]=None  # Fields skipped by only()/defer() for each related field
     ) -> tuple[list, list, int]:
         joins, fields = [], []
         for field in args:
@@ -292,10 +673,11 @@ class Q(BaseOperation):  # Query class to add more complex constraints like AND,
             )
             joins.extend(ajoins)  # Extending joins for nested fields
             fields.append(', '.join(
-                f'{joins[-1]["alias"]}.{fname} AS {field}__{fname}'
+                f'{ajoins[-1]["alias"]}.{fname} AS {field}__{fname}'
                 for fname, fval in
                 current_model.fields.items()
                 if not isinstance(fval, fld.ManyToManyField)
+                and fname not in (deferred or {}).get(field, ())
             ))
         return joins, fields, primary_join_index
 
@@ -307,21 +689,19 @@ class Q(BaseOperation):  # Query class to add more complex constraints like AND,
             annotate_join_index: int
     ) -> tuple[tuple, object, int]:
         current_model, joins = model, ()
+        parent = f'{model.table_name}0{annotate_join_index}'  # Primary table alias
         for field in fnames:  # Using joins to specify subfield constraints
-            try:  # Adding joins for ForeignKey and ManyToManyField
-                attr = getattr(current_model, field)
-                joins += (attr.get_joins(
-                    f'{current_model.table_name}'
-                    f'{primary_join_index - 1 if current_model != model else 0}'
-                    f'{annotate_join_index}',
-                    field,
-                    primary_join_index,
-                    annotate_join_index
-                ))
-                current_model = attr.ref
-                primary_join_index += 1
-            except AttributeError:
+            attr = current_model.fields.get(field)
+            if not isinstance(attr, (fld.ForeignKey, fld.ManyToManyField)):
                 break
+            if isinstance(attr, fld.ManyToManyField):
+                attr.m1 = current_model
+            # Adding joins for ForeignKey and ManyToManyField
+            joins += attr.get_joins(
+                parent, field, primary_join_index, annotate_join_index
+            )
+            parent, current_model = joins[-1]['alias'], attr.ref
+            primary_join_index += 1
         return joins, current_model, primary_join_index
 
     @staticmethod  # Eliminates joins duplication (DEPRECATED)
@@ -362,23 +742,182 @@ class Q(BaseOperation):  # Query class to add more complex constraints like AND,
         return Q.And(other, self)
 
     def __invert__(self):
-        return Q.Not(self.query)
+        return Q.Not(self)
+
+    def shape(self, values: list) -> tuple:
+        return ('Q',) + Q.make_shape(values, **self.query)
 
     def assemble_query(
             self,
             model: object,
             primary_join_index: int,
-            annotate_join_index: int
-    ) -> tuple[list, str, int]:
+            annotate_join_index: int,
+            slots
+    ) -> tuple[list, dict, int]:
         return Q.make_query(
-            model, primary_join_index, annotate_join_index, **self.query
+            model, primary_join_index, annotate_join_index, slots, **self.query
         )
 
 
-def assemble_query(  # Making SQL query-string for given model with given parameters
+class Exists(BaseOperation):  # EXISTS (subquery) constraint, OuterRef links subquery to enclosing query rows
+    def __init__(self, queryset):
+        if not is_subquery(queryset):
+            raise TypeError(
+                f'Exists() expects QuerySet but got "{type(queryset).__name__}"'
+            )
+        self.queryset = queryset
+
+    def __or__(self, other):
+        return Q.Or(self, other)
+
+    def __ror__(self, other):
+        return Q.Or(other, self)
+
+    def __and__(self, other):
+        return Q.And(self, other)
+
+    def __rand__(self, other):
+        return Q.And(other, self)
+
+    def __invert__(self):
+        return Q.Not(self)
+
+    def shape(self, values: list) -> tuple:
+        model, query = self.queryset.as_subquery()
+        return 'EXISTS', query_shape(model, query, None, values)
+
+    def assemble_query(
+            self,
+            model: object,
+            primary_join_index: int,
+            annotate_join_index: int,
+            slots
+    ) -> tuple[list, dict, int]:
+        smodel, squery = self.queryset.as_subquery()
+        slots.outer.append((model, annotate_join_index, smodel))
+        try:
+            sql = compile_sql(smodel, dict(squery, order_by=[]), None, slots, select_id=True)
+        finally:
+            slots.outer.pop()
+        return [], {'where': f'EXISTS ({sql})', 'having': ''}, primary_join_index
+
+
+def make_subquery(queryset, slots) -> str:  # SELECT id subquery of QuerySet given for IN constraint
+    model, query = queryset.as_subquery()
+    if query.get('values', None) is not None and len(query['values']) != 1:
+        raise ValueError('QuerySet used as a subquery must select exactly one field with values().')
+    if query.get('limit', None) or query.get('offset', None) or \
+            query['annotate']['args'] or query['annotate']['kwargs']:
+        # MySQL does not support LIMIT inside of IN subquery and annotated
+        # subquery selects several columns, wrapping it into derived table
+        column = query['values'][0] if query.get('values', None) else 'id'
+        return f"SELECT {model.table_name}00.{column} FROM ({compile_sql(model, query, None, slots, select_id=True)}) AS {model.table_name}00"
+    # Ordering is pointless for a set of ids
+    return compile_sql(model, dict(query, order_by=[]), None, slots, select_id=True)
+
+
+def make_from(model, joins, annotate_join_index: int=0) -> str:  # FROM statement with joins
+    return f'{model.table_name} AS {model.table_name}0{annotate_join_index}' + ''.join(
+        f" {j['type']} JOIN {j['table']} AS {j['alias']} ON {j['on']}"
+        for j in joins
+    )
+
+
+def annotation_shape(annotation, values: list) -> tuple:  # Aggregates have no values to bind
+    if isinstance(annotation, expr.BaseExpression):
+        return annotation.shape(values)
+    return annotation.shape()
+
+
+def deferred_fields(model, query: dict, path: str='') -> set[str]:  # Fields skipped by only()/defer()
+    prefix = f'{path}__' if path else ''  # select_related field path (primary model if empty)
+    for fname in path.split('__') if path else ():
+        model = model.fields[fname].ref
+    columns = {
+        fname for fname, fval in model.fields.items()
+        if not isinstance(fval, fld.ManyToManyField)
+    }
+    deferred = {
+        name[len(prefix):] for name in query.get('defer', ())
+        if name.startswith(prefix) and '__' not in name[len(prefix):]
+    }
+    only = [name[len(prefix):] for name in query.get('only', None) or () if name.startswith(prefix)]
+    if only:  # Related model without fields mentioned in only() is selected entirely
+        deferred |= columns - {name.split('__')[0] for name in only} - {'id'}
+    return deferred
+
+
+def values_paths(model, annotations=()) -> list[str]:  # Default values() paths: own columns and annotations
+    return [
+        fname for fname, fval in model.fields.items()
+        if not isinstance(fval, fld.ManyToManyField)
+    ] + list(annotations)
+
+
+def values_field(model, path: str):  # Model field selected by values() path (None for annotated fields)
+    current_model, fnames = model, path.split('__')
+    for fname in fnames[:-1]:
+        field = current_model.fields.get(fname)
+        if not isinstance(field, (fld.ForeignKey, fld.ManyToManyField)):
+            return None
+        current_model = field.ref
+    field = current_model.fields.get(fnames[-1])
+    if isinstance(field, fld.ManyToManyField):  # Linked rows ids are selected
+        return field.ref.fields['id']
+    return field
+
+
+def query_shape(  # Hashable query structure (values excluded) collecting values in binding order
+        model,
+        query: dict,
+        aggregate_fields: dict[str, tuple | dict]=None,
+        values: list=None
+) -> tuple:
+    values = [] if values is None else values
+    shape = (
+        model,
+        tuple(arg.shape(values) for arg in query['args']),
+        Q.make_shape(values, **query['kwargs']),
+        tuple(query['select_related']),
+        tuple(annotation_shape(a, values) for a in query['annotate']['args']),
+        tuple(
+            (alias, annotation_shape(a, values)) for alias, a in query['annotate']['kwargs'].items()
+        ),
+        tuple(query['order_by']),
+        tuple(query['values']) if query.get('values', None) is not None else None,
+        tuple(query['only']) if query.get('only', None) is not None else None,
+        tuple(query.get('defer', ())),
+        tuple(a.shape() for a in aggregate_fields['args']) if aggregate_fields else (),
+        tuple(
+            (alias, a.shape()) for alias, a in aggregate_fields['kwargs'].items()
+        ) if aggregate_fields else (),
+        bool(query.get('limit', None)),
+        bool(query.get('offset', None))
+    )
+    if query.get('limit', None):
+        values.append(query['limit'])
+    if query.get('offset', None):
+        values.append(query['offset'])
+    return shape
+
+
+def compile_query(  # Making SQL template for given model with given parameters
         model,  # Allows to gain access to model resources
         query: dict,  # Dictionary storing query parameters
         aggregate_fields: dict[str, tuple | dict]=None,  # Aggregate fields list to select (optional)
+) -> CompiledQuery:
+    slots, columns = Slots(), []
+    sql = compile_sql(model, query, aggregate_fields, slots, columns=columns)
+    return CompiledQuery(sql, slots, HydrationPlan(model, columns) if columns else None)
+
+
+def compile_sql(  # Making SQL with parameter slot markers (also used for subqueries sharing slots)
+        model,
+        query: dict,
+        aggregate_fields: dict[str, tuple | dict],
+        slots: Slots,
+        select_id: bool=False,  # Selecting primary key only (subqueries)
+        columns: list=None  # Filled with selected model rows layout (select_related path, name)
 ) -> str:
     # Initialising storages for JOIN, WHERE and ORDER BY
     joins, constraints, order_by = [], {'where': [], 'having': []}, ''
@@ -386,100 +925,180 @@ def assemble_query(  # Making SQL query-string for given model with given parame
     # Assembling WHERE query
     for arg in query['args']:  # Q-class queries (Q, Q.Not, Q.Or, Q.And)
         ajoins, aconstraints, primary_join_index = arg.assemble_query(
-            model, primary_join_index, annotate_join_index
+            model, primary_join_index, annotate_join_index, slots
         )
         joins.extend(ajoins)
-        constraints['where'].append(f"({aconstraints['where']})")
-        constraints['having'].append(f"({aconstraints['having']})")
+        constraints['where'].append(aconstraints['where'])
+        constraints['having'].append(aconstraints['having'])
     if query['kwargs']:  # Keyword queries (<field>__<subfield>__...(__<op>)=<value>)
         ajoins, aconstraints, primary_join_index = Q.make_query(
-            model, primary_join_index, annotate_join_index, **query['kwargs']
+            model, primary_join_index, annotate_join_index, slots, **query['kwargs']
         )
         joins.extend(ajoins)
-        constraints['where'].append(f"({aconstraints['where']})")
-        constraints['having'].append(f"({aconstraints['having']})")
+        constraints['where'].append(aconstraints['where'])
+        constraints['having'].append(aconstraints['having'])
+    where = combine(constraints['where'], 'AND')
+    having = combine(constraints['having'], 'AND')
     # Assembling field list to select from database
     # Related models fields
+    # values()/values_list() projection, only requested columns are selected
+    # (subquery selects its single projected column instead of primary key)
+    projection = query.get('values', None) is not None and not aggregate_fields and (
+        not select_id or len(query['values']) == 1
+    )
     related_flist = ''  # Doing variable assign not to get error if no related fields were specified
-    if query['select_related']:  # Appending related fields
+    if query['select_related'] and not projection:  # Appending related fields
         ajoins, afields, primary_join_index = Q.make_related_fields(
             model, primary_join_index,
-            annotate_join_index, *query['select_related']
+            annotate_join_index, *query['select_related'],
+            deferred={path: deferred_fields(model, query, path) for path in query['select_related']}
         )
         joins.extend(ajoins)
         related_flist = ', '.join(afields)
     # Annotated fields
-    annotated_flist = ''  # Doing variable assign not to get error if no annotate was specified
+    annotated_flist, annotated = '', {}  # Doing variable assign not to get error if no annotate was specified
     if query['annotate']['args'] or query['annotate']['kwargs']:  # Appending annotated fields
-        ajoins, afields, aaliases, primary_join_index, annotate_join_index = Q.make_aggregate(
+        aggregates, primary_join_index, annotate_join_index = Q.make_aggregate(
             model, primary_join_index, annotate_join_index,
-            *query['annotate']['args'], **query['annotate']['kwargs']
+            *query['annotate']['args'], slots=slots, **query['annotate']['kwargs']
         )
-        annotated_flist = ', '.join(  # Making SELECT subquery for each annotated field
-            f"""(SELECT {fdef} FROM {model.table_name} AS {model.table_name}0{annotate_join_index}{''.join(
-                f" {j['type']} JOIN {j['table']} AS {j['alias']} ON {j['on']}"
-                for j in ajoins
-            )} WHERE {model.table_name}0{annotate_join_index}.id = {model.table_name}00.id) AS {falias}"""
-            for fdef, falias in zip(
-                afields, aaliases
+        annotated = {  # Making SELECT subquery for each annotated field
+            falias: f'(SELECT {fdef} FROM {make_from(model, ajoins, aindex)} WHERE '
+            f'{model.table_name}0{aindex}.id = {model.table_name}00.id) AS {falias}'
+            for ajoins, fdef, falias, aindex in aggregates
+        }
+        annotated_flist = ', '.join(annotated.values())
+    if projection:
+        columns = []
+        for path in query['values'] or values_paths(model, annotated):
+            if path in annotated:  # Annotated field is moved to its position
+                columns.append(annotated.pop(path))
+                continue
+            ajoins, column, field, primary_join_index = Q.make_column(
+                model, path.split('__'), primary_join_index, 0
             )
+            if field is None:
+                raise ValueError(f'Wrong field specified for values() method: "{path}".')
+            joins.extend(ajoins)
+            columns.append(f'{column} AS {path}')
+        # Annotated fields not requested are kept after requested ones for HAVING constraints
+        flist = ', '.join(columns + list(annotated.values()))
+    else:  # Primary model fields
+        deferred = deferred_fields(model, query)
+        flist = ', '.join(  # Primary model fields
+            f'{model.table_name}00.{fname}'
+            for fname, fval in
+            model.fields.items()
+            if not isinstance(fval, fld.ManyToManyField) and fname not in deferred
+        ) + (  # Related fields
+            f', {related_flist}' if related_flist else ''
+        ) + (  # Annotated fields
+            f', {annotated_flist}' if annotated_flist else ''
         )
-    # Primary model fields
-    flist = ', '.join(  # Primary model fields
-        f'{model.table_name}00.{fname}'
-        for fname, fval in
-        model.fields.items()
-        if not isinstance(fval, fld.ManyToManyField)
-    ) + (  # Related fields
-        f', {related_flist}' if related_flist else ''
-    ) + (  # Annotated fields
-        f', {annotated_flist}' if annotated_flist else ''
-    )
-    if aggregate_fields and (aggregate_fields['args'] or aggregate_fields['kwargs']):  # Fields wrapped in aggregate functions
-        ajoins, afields, aaliases, primary_join_index, annotate_join_index = Q.make_aggregate(
-            model, 0, -1, *aggregate_fields['args'], **aggregate_fields['kwargs']
+    if select_id and not annotated_flist and not projection:  # Annotated fields are kept for HAVING constraints
+        flist = f'{model.table_name}00.id'
+    elif columns is not None and not projection and not aggregate_fields:  # Same order as in flist
+        columns.extend(
+            ('', fname) for fname, fval in model.fields.items()
+            if not isinstance(fval, fld.ManyToManyField) and fname not in deferred
         )
-        # joins.extend(ajoins)
-        aflist = ', '.join(
-            f'{fdef} AS {falias}'
-            for fdef, falias in zip(
-                afields, aaliases
+        for path in query['select_related']:
+            current_model = model
+            for fname in path.split('__'):
+                current_model = current_model.fields[fname].ref
+            rdeferred = deferred_fields(model, query, path)
+            columns.extend(
+                (path, fname) for fname, fval in current_model.fields.items()
+                if not isinstance(fval, fld.ManyToManyField) and fname not in rdeferred
             )
-        )
-        return f"""SELECT {aflist} FROM (SELECT {
-            flist} FROM {model.table_name} AS {model.table_name}00{''.join(
-                f" {j['type']} JOIN {j['table']} AS {j['alias']} ON {j['on']}"
-                for j in joins
-            ) + (
-                ' WHERE ' + ' AND '.join(constraints['where']) if constraints['where'] != ['()'] else ''
-            ) + (
-                ' HAVING ' + ' AND '.join(constraints['having']) if constraints['having'] != ['()'] else ''
-            ) + order_by + (
-                f' LIMIT {query["limit"]}' if query.get('limit', None) else ''
-            ) + (
-                f' OFFSET {query["offset"]}' if query.get('offset', None) else ''
-        )}) AS {model.table_name}00{''.join(
-            f" {j['type']} JOIN {j['table']} AS {j['alias']} ON {j['on']}"
-            for j in ajoins
-        )}"""
-    # Assembling ORDER BY query
-    if query.get('order_by', None):  # Specifying ORDER BY fields if listed
+        columns.extend((None, alias) for alias in annotated)
+    # Assembling ORDER BY query (pointless inside of aggregate subquery)
+    if query.get('order_by', None) and not aggregate_fields:
         ajoins, afields, primary_join_index = Q.make_order_by(
             model, primary_join_index, annotate_join_index, *query['order_by']
         )
         joins.extend(ajoins)
-        order_by = f''' ORDER BY {", ".join(afields)}'''
+        order_by = f' ORDER BY {", ".join(afields)}'
     # Assembling SQL query
-    return f"""SELECT {flist} FROM {model.table_name} AS {
-    model.table_name}00{''.join(
-        f" {j['type']} JOIN {j['table']} AS {j['alias']} ON {j['on']}"
-        for j in joins
-    ) + (
-        ' WHERE ' + ' AND '.join(constraints['where']) if constraints['where'] != ['()'] else ''
+    sql = f'SELECT {flist} FROM {make_from(model, joins)}' + (
+        f' WHERE {where}' if where else ''
     ) + (
-        ' HAVING ' + ' AND '.join(constraints['having']) if constraints['having'] != ['()'] else ''
+        f' HAVING {having}' if having else ''
     ) + order_by + (
-        f' LIMIT {query["limit"]}' if query.get('limit', None) else ''
+        f" LIMIT {slots.parameter(query['limit'], int)()}" if query.get('limit', None)
+        else ' LIMIT 18446744073709551615' if query.get('offset', None) else ''  # OFFSET requires LIMIT
     ) + (
-        f' OFFSET {query["offset"]}' if query.get('offset', None) else ''
-    )}"""
+        f" OFFSET {slots.parameter(query['offset'], int)()}" if query.get('offset', None) else ''
+    )
+    if aggregate_fields and (aggregate_fields['args'] or aggregate_fields['kwargs']):  # Fields wrapped in aggregate functions
+        afields, ajoins = [], []
+        for alias, aggregate in [(None, a) for a in aggregate_fields['args']] + \
+                list(aggregate_fields['kwargs'].items()):
+            # Joins are made to the derived table, so indexes continue from the last one
+            aggr_joins, afield, aalias, primary_join_index = aggregate(
+                model, primary_join_index, 0
+            )
+            ajoins.extend(aggr_joins)
+            afields.append(f'{afield} AS {alias if alias else aalias}')
+        sql = f"SELECT {', '.join(afields)} FROM ({sql}) AS {model.table_name}00" + ''.join(
+            f" {j['type']} JOIN {j['table']} AS {j['alias']} ON {j['on']}"
+            for j in ajoins
+        )
+    return sql
+
+
+def prepare_query(  # Compiled query of given parameters shape and values to bind to it
+        model,
+        query: dict,
+        aggregate_fields: dict[str, tuple | dict]=None
+) -> tuple[CompiledQuery, list]:
+    values = []  # Query values in binding order
+    compiled = compiled_queries.get(  # Compiling query only if its shape was not met before
+        query_shape(model, query, aggregate_fields, values),
+        lambda: compile_query(model, query, aggregate_fields)
+    )
+    return compiled, values
+
+
+def assemble_query(  # Making SQL query-string and its parameters for given model with given parameters
+        model,  # Allows to gain access to model resources
+        query: dict,  # Dictionary storing query parameters
+        aggregate_fields: dict[str, tuple | dict]=None,  # Aggregate fields list to select (optional)
+) -> tuple[str, tuple]:
+    compiled, values = prepare_query(model, query, aggregate_fields)
+    return compiled.bind(values)
+
+
+def chunk_query(query: dict) -> list[dict]:  # Splitting query by its longest "in" list (chunk strategy)
+    if in_lists.strategy != 'chunk' or query.get('limit', None) or \
+            query.get('offset', None) or query['order_by']:  # Results can not be simply merged
+        return [query]
+    name, ids = max((
+        (name, value) for name, value in query['kwargs'].items()
+        if Q.parse_lookup(name)[1] == 'in' and isinstance(value, (list, tuple, set, frozenset))
+    ), key=lambda lookup: len(lookup[1]), default=(None, ()))
+    if not in_lists.large(ids):
+        return [query]
+    ids = tuple(dict.fromkeys(ids))  # Chunks must not select same rows twice
+    return [
+        {**query, 'kwargs': {**query['kwargs'], name: ids[start:start + in_lists.threshold]}}
+        for start in range(0, len(ids), in_lists.threshold)
+    ]
+
+
+def compile_expression(  # Making SQL and parameters of expression referencing columns of a single table
+        model,
+        expression: expr.BaseExpression,
+        table: str=None  # Table name or alias columns are taken from
+) -> tuple[str, tuple]:
+    table = table if table else model.table_name
+
+    def column(name: str) -> str:
+        if name not in model.fields or isinstance(model.fields[name], fld.ManyToManyField):
+            raise ValueError(
+                f'Only {model.__name__} own fields may be referenced here: "{name}".'
+            )
+        return f'{table}.{name}'
+    values, slots = [], Slots()
+    expression.shape(values)
+    return CompiledQuery(expression.assemble(column, slots), slots).bind(values)
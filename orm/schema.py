@@ -0,0 +1,43 @@
+import threading
+
+
+# Per-process registry of database tables known to exist.
+# Allows Model.check_table() to skip SHOW TABLES query once
+# model table was verified or created.
+class SchemaRegistry:
+    def __init__(self):
+        self.__tables = set()  # Names of tables known to exist
+        self.__synced = False  # Whether tables list was loaded from database
+        self.__lock = threading.Lock()
+
+    @property
+    def synced(self) -> bool:
+        return self.__synced
+
+    def sync(self, table_names) -> None:  # Loading SHOW TABLES result
+        with self.__lock:
+            self.__tables.update(table_names)
+            self.__synced = True
+
+    def known(self, table_name: str) -> bool:  # Check if table was already verified
+        return table_name in self.__tables
+
+    def add(self, *table_names: str) -> None:  # Marking tables as existing
+        with self.__lock:
+            self.__tables.update(table_names)
+
+    def discard(self, *table_names: str) -> None:  # Forgetting dropped tables
+        with self.__lock:
+            self.__tables.difference_update(table_names)
+
+    def reset(self) -> None:  # Forgetting everything, next check_table() calls hit database again
+        with self.__lock:
+            self.__tables.clear()
+            self.__synced = False
+
+    @property
+    def tables(self) -> frozenset:
+        return frozenset(self.__tables)
+
+
+registry = SchemaRegistry()
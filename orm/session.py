@@ -0,0 +1,62 @@
+from contextlib import ContextDecorator
+import threading
+
+
+# Model instances loaded within session stored by (model, id).
+# Every load path returns the same object for the same row
+# and rows already loaded are not selected again.
+class IdentityMap:
+    def __init__(self):
+        self.__instances = {}  # (model, id) -> model instance
+
+    def get(self, model, id: int, default=None):
+        return self.__instances.get((model, id), default)
+
+    def add(self, instance):  # Remembering instance, returns one already known for its row if any
+        if instance.id is None:
+            return instance
+        return self.__instances.setdefault((instance.model, instance.id), instance)
+
+    def discard(self, model, *ids: int) -> None:  # Forgetting deleted rows (all the model rows if no ids given)
+        if not ids:
+            ids = [id for m, id in self.__instances if m is model]
+        for id in ids:
+            self.__instances.pop((model, id), None)
+
+    def clear(self) -> None:
+        self.__instances.clear()
+
+    def __contains__(self, key: tuple) -> bool:  # (model, id) in identity_map
+        return key in self.__instances
+
+    def __len__(self) -> int:
+        return len(self.__instances)
+
+
+_local = threading.local()  # Per-thread session state
+
+
+def current() -> IdentityMap | None:  # Identity map of current thread session (None outside of session)
+    return getattr(_local, 'identity_map', None)
+
+
+# Identity map scope usable both as context manager and decorator.
+# Nested sessions share identity map of the outermost one.
+class Session(ContextDecorator):
+    def __enter__(self) -> IdentityMap:
+        if current() is None:
+            _local.identity_map, _local.depth = IdentityMap(), 0
+        _local.depth += 1
+        return _local.identity_map
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _local.depth -= 1
+        if not _local.depth:  # Outermost session forgets loaded instances
+            del _local.identity_map
+        return False
+
+
+def session(func=None):  # Usage: @session, @session() or with session() as identity_map: ...
+    if callable(func):
+        return Session()(func)
+    return Session()
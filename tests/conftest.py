@@ -0,0 +1,174 @@
+import os
+import re
+import sys
+import types
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# In-memory stand-in for MySQL server used by the fake connector below.
+# Statements are logged, results are served by rules matching SQL text.
+class FakeServer:
+    def __init__(self):
+        self.log = []  # (sql, params) of every executed statement
+        self.rules = []  # [pattern, result, times left (None for unlimited)]
+        self.connections = []  # Every connection opened
+        self.lastrowid = 0
+
+    def on(self, pattern: str, rows=(), columns=(), rowcount=None, lastrowid=None, error=None, info='', times=1):
+        # Result of the next statement(s) matching regex pattern, rows may be callable(sql, params)
+        self.rules.append([re.compile(pattern, re.S), (rows, columns, rowcount, lastrowid, error, info), times])
+
+    def result(self, sql: str, params: tuple):
+        for rule in self.rules:
+            pattern, result, times = rule
+            if pattern.search(sql):
+                if times is not None:
+                    rule[2] -= 1
+                    if not rule[2]:
+                        self.rules.remove(rule)
+                return result
+        return (), (), None, None, None, ''
+
+    def statements(self, pattern: str='') -> list:  # Executed SQL matching pattern
+        return [sql for sql, _ in self.log if re.search(pattern, sql, re.S)]
+
+    def queries(self, pattern: str='') -> list:  # Executed statements except for transaction control
+        return [
+            sql for sql in self.statements(pattern)
+            if not re.match(r'\s*(SAVEPOINT|RELEASE|ROLLBACK|COMMIT|START)', sql)
+        ]
+
+
+class FakeError(Exception):
+    def __init__(self, msg: str='', errno: int=-1):
+        super().__init__(msg)
+        self.msg, self.errno = msg, errno
+
+
+class FakePoolError(FakeError):
+    pass
+
+
+class FakeCursor:
+    def __init__(self, connection, **kwargs):
+        self.connection, self.kwargs = connection, kwargs
+        self.rows, self.description, self.rowcount, self.lastrowid = [], None, -1, None
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def execute(self, sql: str, params=()):
+        server = self.connection.server
+        if not self.connection.open:
+            raise FakeError('Connection is closed', 2055)
+        server.log.append((sql, tuple(params or ())))
+        if re.match(r'\s*(SAVEPOINT|RELEASE|ROLLBACK)', sql):
+            return
+        rows, columns, rowcount, lastrowid, error, info = server.result(sql, tuple(params or ()))
+        if error is not None:
+            raise error
+        self.connection.info_msg = info  # OK packet info of the last statement
+        rows = list(rows(sql, tuple(params or ())) if callable(rows) else rows)
+        self.rows = rows
+        self.description = [(name,) for name in columns] if columns else None
+        self.rowcount = rowcount if rowcount is not None else len(rows)
+        if re.match(r'\s*INSERT', sql):
+            server.lastrowid = lastrowid if lastrowid is not None else server.lastrowid + 1
+            self.lastrowid = server.lastrowid
+
+    def fetchall(self) -> list:
+        rows, self.rows = self.rows, []
+        return rows
+
+    def fetchmany(self, size: int=1) -> list:
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection:
+    def __init__(self, server, **kwargs):
+        self.server, self.kwargs = server, kwargs
+        self.open, self.alive, self.in_transaction = True, True, False
+        self.info_msg = ''
+        self.cursors = []
+
+    def cursor(self, **kwargs) -> FakeCursor:
+        cursor = FakeCursor(self, **kwargs)
+        self.cursors.append(cursor)
+        return cursor
+
+    def start_transaction(self):
+        self.server.log.append(('START TRANSACTION', ()))
+        self.in_transaction = True
+
+    def commit(self):
+        self.server.log.append(('COMMIT', ()))
+        self.in_transaction = False
+
+    def rollback(self):
+        self.server.log.append(('ROLLBACK', ()))
+        self.in_transaction = False
+
+    def is_connected(self) -> bool:
+        return self.open and self.alive
+
+    def close(self):
+        self.open = False
+
+
+server = FakeServer()
+
+
+def connect(**kwargs) -> FakeConnection:
+    connection = FakeConnection(server, **kwargs)
+    server.connections.append(connection)
+    return connection
+
+
+# Fake mysql.connector and settings modules, ORM is imported after them
+connector = types.ModuleType('mysql.connector')
+connector.Error, connector.connect = FakeError, connect
+errors = types.ModuleType('mysql.connector.errors')
+errors.Error, errors.PoolError = FakeError, FakePoolError
+connector.errors = errors
+sys.modules['mysql'] = types.ModuleType('mysql')
+sys.modules['mysql'].connector = connector
+sys.modules['mysql.connector'] = connector
+sys.modules['mysql.connector.errors'] = errors
+sys.modules['settings'] = types.SimpleNamespace(db_data={'database': 'test'})
+
+from orm import fields, model as mdl, connection as cn, schema as sch, cache as cch  # noqa: E402, F401
+from applications.booking import models  # noqa: E402, F401 (all the application models are registered)
+
+
+@pytest.fixture(autouse=True)
+def db():  # Clean fake server, pool, results cache and schema registry (all tables exist)
+    server.__init__()
+    cn.configure_pool()
+    cch.configure(cch.LocalCache())
+    sch.registry.reset()
+    models, subclasses = [], mdl.Model.__subclasses__()
+    while subclasses:
+        model = subclasses.pop(0)
+        models.append(model)
+        subclasses.extend(model.__subclasses__())
+    sch.registry.sync(model.table_name for model in models)
+    yield server
+    server.rules.clear()
+
+
+def row(model, **values) -> tuple:  # Model row as selected by ORM (id first, then other columns by name)
+    names = sorted(
+        name for name, field in model.fields.items()
+        if name != 'id' and not isinstance(field, fields.ManyToManyField)
+    )
+    return tuple(values.get(name) for name in ['id', *names])
@@ -0,0 +1,144 @@
+import threading
+import pytest
+from conftest import row
+from orm import cache as cch, connection as cn
+from applications.airline.models import Airport, Flight
+from applications.booking.models import Ticket
+
+
+def airports(db, name: str='a'):  # Queues Airports select result
+    db.on('FROM Airports', rows=[row(Airport, id=1, name=name, code='A', city='c', country='c')])
+
+
+def test_cached_query_is_selected_once(db):
+    airports(db)
+    assert [a.name for a in Airport.filter(code='A').cache()] == ['a']
+    assert [a.name for a in Airport.filter(code='A').cache()] == ['a']
+    assert len(db.queries('FROM Airports')) == 1
+    airports(db)
+    list(Airport.filter(code='B').cache())  # Different parameters
+    assert len(db.queries('FROM Airports')) == 2
+
+
+def test_query_is_not_cached_without_cache_call(db):
+    airports(db), list(Airport.filter())
+    airports(db), list(Airport.filter())
+    assert len(db.queries('FROM Airports')) == 2
+
+
+@pytest.mark.parametrize('write', [
+    lambda: Airport.create(name='b', code='B', city='c', country='c'),
+    lambda: Airport.filter(code='A').update(city='d'),
+    lambda: Airport.filter(code='A').delete(),
+    lambda: Airport.bulk_upsert([{'code': 'A', 'name': 'b'}], unique_fields=['code']),
+])
+def test_writes_invalidate_table(db, write):
+    airports(db), list(Airport.filter().cache())
+    write()
+    airports(db, 'b')
+    assert [a.name for a in Airport.filter().cache()] == ['b']
+
+
+def test_delete_invalidates_referencing_tables(db):
+    db.on('FROM Tickets', rows=[row(Ticket, id=1, flight=1, type='economy')], times=2)
+    list(Ticket.filter().cache())
+    Flight.filter(id=1).delete()  # Tickets are deleted by ON DELETE CASCADE
+    list(Ticket.filter().cache())
+    assert len(db.queries('FROM Tickets')) == 2
+
+
+def test_results_are_not_cached_inside_atomic_block(db):
+    with cn.atomic():
+        airports(db), list(Airport.filter().cache())
+        airports(db), list(Airport.filter().cache())
+    assert len(db.queries('FROM Airports')) == 2
+
+
+def test_result_read_before_concurrent_write_is_not_stored(db):
+    def read_during_write(sql, params):  # Another connection writes while the result is read
+        cch.invalidate(Airport.table_name)
+        return [row(Airport, id=1, name='a', code='A', city='c', country='c')]
+    db.on('FROM Airports', rows=read_during_write)
+    list(Airport.filter().cache())
+    airports(db, 'b')
+    assert [a.name for a in Airport.filter().cache()] == ['b']
+
+
+@pytest.mark.parametrize('backend', [
+    lambda: cch.LocalCache(), lambda: cch.StoreCache(cch.MemoryStore())
+], ids=['local', 'store'])
+def test_backends(backend):
+    cache, tables = backend(), frozenset({'Airports'})
+    cache.set(('sql', ()), ((1,),), None, tables, cache.snapshot(tables))
+    assert cache.get(('sql', ()))[0] == (1,)
+    cache.invalidate('Flights')
+    assert cache.get(('sql', ())) is not None
+    cache.invalidate('Airports')
+    assert cache.get(('sql', ())) is None
+    snapshot = cache.snapshot(tables)
+    cache.invalidate('Airports')  # Write between the read and the store
+    cache.set(('sql', ()), ((2,),), None, tables, snapshot)
+    assert cache.get(('sql', ())) is None
+    cache.set(('sql', ()), ((3,),), None, tables, cache.snapshot(tables))
+    cache.clear()
+    assert cache.get(('sql', ())) is None
+
+
+class RedisLikeStore(cch.MemoryStore):  # Store taking arguments the way redis.Redis client does
+    def set(self, name: str, value: bytes, ex: int=None, px: int=None):
+        assert ex is None or isinstance(ex, int)
+        super().set(name, value, ex)
+
+
+def test_store_cache_generations_are_incremented_atomically(db):
+    store, tables = RedisLikeStore(), frozenset({'Airports'})
+    cache = cch.StoreCache(store)
+    cache.invalidate('Airports')
+    snapshot = cache.snapshot(tables)  # Read started after the first of two concurrent writes
+    cache.invalidate('Airports')
+    cache.set(('sql', ()), ((1,),), 0.5, tables, snapshot)
+    assert cache.get(('sql', ())) is None
+    assert cache.snapshot(tables) == (('*', 0), ('Airports', 2))
+    cache.set(('sql', ()), ((2,),), 0.5, tables, cache.snapshot(tables))
+    assert cache.get(('sql', ()))[0] == (2,)
+
+
+def test_local_cache_evicts_least_recently_used(db):
+    cache, tables = cch.LocalCache(maxsize=2), frozenset()
+    for key in 'abc':
+        if key == 'c':
+            cache.get('a')
+        cache.set(key, key, None, tables, cache.snapshot(tables))
+    assert cache.get('a') == 'a' and cache.get('b') is None and cache.get('c') == 'c'
+
+
+def test_local_cache_expires_entries(db):
+    cache, tables = cch.LocalCache(), frozenset()
+    cache.set('a', 'a', 0, tables, cache.snapshot(tables))
+    assert cache.get('a') is None
+
+
+def test_cache_ttl_must_be_positive(db):
+    with pytest.raises(ValueError):
+        Airport.filter().cache(0)
+
+
+def test_end_callbacks_run_after_outermost_block(db):
+    called = []
+    with cn.atomic():
+        with cn.atomic():
+            cn.on_end(lambda: called.append(cn.in_atomic()))
+        assert not called
+    assert called == [False]
+    cn.on_end(lambda: called.append('now'))  # Outside of block callback is called right away
+    assert called == [False, 'now']
+
+
+def test_atomic_write_invalidates_again_at_commit(db):
+    with cn.atomic():
+        Airport.filter(code='A').update(city='d')
+        airports(db)  # Other thread caches rows read before the transaction commits
+        reader = threading.Thread(target=lambda: list(Airport.filter().cache()))
+        reader.start(), reader.join()
+    airports(db, 'b')
+    assert [a.name for a in Airport.filter().cache()] == ['b']
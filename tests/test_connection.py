@@ -0,0 +1,159 @@
+import os
+import pytest
+from mysql.connector import Error
+from mysql.connector.errors import PoolError
+from orm import connection as cn
+from orm.exceptions import TransactionError
+from applications.airline.models import Airport
+
+
+def test_checkout_reuses_idle_connection(db):
+    pool = cn.ConnectionPool({}, size=2)
+    first = pool.checkout()
+    pool.checkin(first)
+    assert pool.checkout() is first
+    assert pool.stats['connects'] == 1
+
+
+def test_overflow_connections_are_closed_on_checkin(db):
+    pool = cn.ConnectionPool({}, size=1, max_overflow=1, timeout=0.01)
+    first, second = pool.checkout(), pool.checkout()
+    with pytest.raises(PoolError):
+        pool.checkout()
+    assert pool.stats['timeouts'] == 1
+    pool.checkin(first)
+    pool.checkin(second)
+    assert first.open and not second.open
+    assert pool.stats['idle'] == 1 and pool.stats['checked_out'] == 0
+
+
+def test_idle_connection_is_recycled(db):
+    pool = cn.ConnectionPool({}, recycle=0)
+    first = pool.checkout()
+    pool.checkin(first)
+    second = pool.checkout()
+    assert second is not first and not first.open
+    assert pool.stats['recycled'] == 1
+
+
+def test_broken_connection_is_replaced_on_checkout(db):
+    pool = cn.ConnectionPool({})
+    first = pool.checkout()
+    pool.checkin(first)
+    first.alive = False
+    assert pool.checkout() is not first
+    assert pool.stats['invalidated'] == 1
+
+
+def test_checkin_rolls_back_open_transaction(db):
+    pool = cn.ConnectionPool({})
+    connection = pool.checkout()
+    connection.start_transaction()
+    pool.checkin(connection)
+    assert db.statements()[-1] == 'ROLLBACK'
+
+
+def test_forked_child_does_not_close_parent_connections(db, monkeypatch):
+    pool = cn.ConnectionPool({})
+    idle, used = pool.checkout(), pool.checkout()
+    pool.checkin(idle)
+    monkeypatch.setattr(os, 'getpid', lambda: -1)
+    pool.invalidate(used)
+    pool.dispose()
+    assert idle.open and used.open
+    assert pool.checkout() not in (idle, used)
+
+
+def test_configure_pool_closes_old_pool_connections(db):
+    old = cn.get_pool()
+    idle, used = old.checkout(), old.checkout()
+    old.checkin(idle)
+    cn.configure_pool()
+    assert not idle.open
+    old.checkin(used)  # Connection in use while pool was replaced
+    assert not used.open
+    assert cn.get_pool() is not old
+
+
+def transaction(db) -> list:  # Transaction control statements and writes in execution order
+    return [sql.split()[0] for sql in db.statements(r'^\s*(START|COMMIT|ROLLBACK|SAVEPOINT|RELEASE|INSERT|UPDATE)')]
+
+
+def test_atomic_commits_once_at_the_end(db):
+    with cn.atomic():
+        Airport.create(name='a', code='A', city='c', country='c')
+        Airport.create(name='b', code='B', city='c', country='c')
+    assert transaction(db) == ['START', 'INSERT', 'INSERT', 'COMMIT']
+    assert len(db.connections) == 1
+
+
+def test_atomic_rolls_back_on_exception(db):
+    with pytest.raises(KeyError):
+        with cn.atomic():
+            Airport.create(name='a', code='A', city='c', country='c')
+            raise KeyError
+    assert transaction(db) == ['START', 'INSERT', 'ROLLBACK']
+    assert not cn.in_atomic()
+
+
+def test_nested_atomic_rolls_back_to_savepoint(db):
+    with cn.atomic():
+        Airport.create(name='a', code='A', city='c', country='c')
+        with pytest.raises(KeyError):
+            with cn.atomic():
+                Airport.filter(code='A').update(city='d')
+                raise KeyError
+    assert transaction(db) == ['START', 'INSERT', 'SAVEPOINT', 'UPDATE', 'ROLLBACK', 'COMMIT']
+    assert 'ROLLBACK TO SAVEPOINT atomic_savepoint_1' in db.statements()
+
+
+def test_failed_statement_rolls_back_block(db):
+    db.on('INSERT INTO Airports', error=Error('Duplicate entry', 1062))
+    with pytest.raises(TransactionError):
+        with cn.atomic():
+            Airport.create(name='a', code='A', city='c', country='c')  # Error is printed, not raised
+    assert transaction(db)[-1] == 'ROLLBACK'
+
+
+def test_atomic_decorator(db):
+    @cn.atomic
+    def write():
+        assert cn.in_atomic()
+        Airport.create(name='a', code='A', city='c', country='c')
+    write()
+    assert transaction(db) == ['START', 'INSERT', 'COMMIT']
+    assert not cn.in_atomic()
+
+
+def prepared_cursors(db) -> list:
+    return [cursor for connection in db.connections for cursor in connection.cursors if cursor.kwargs.get('prepared')]
+
+
+def test_prepared_statements_are_reused_per_connection(db):
+    cn.configure_pool(prepared=True, statement_cache_size=1)
+    db.on('EXISTS', rows=[(0,)], times=None)
+    Airport.filter(code='A').exists()
+    Airport.filter(code='B').exists()
+    assert len(prepared_cursors(db)) == 1
+    assert [params for sql, params in db.log if 'EXISTS' in sql] == [('A',), ('B',)]
+    Airport.filter(name='A').exists()  # Evicts the first statement
+    first, second = prepared_cursors(db)
+    assert first.closed and not second.closed
+    assert cn.get_pool().stats['prepared'] == 1
+
+
+def test_failed_prepared_statement_is_discarded(db):
+    cn.configure_pool(prepared=True)
+    db.on('EXISTS', error=Error('Lost connection', 2013))
+    db.on('EXISTS', rows=[(0,)], times=None)
+    Airport.filter(code='A').exists()  # Error is printed
+    Airport.filter(code='A').exists()
+    first, second = prepared_cursors(db)
+    assert first.closed and not second.closed
+
+
+def test_parameters_are_never_inlined(db):
+    db.on('EXISTS', rows=[(0,)])
+    Airport.filter(name="x' OR '1'='1").exists()
+    (sql, params), = [(sql, params) for sql, params in db.log if 'EXISTS' in sql]
+    assert "x'" not in sql and params == ("x' OR '1'='1",)
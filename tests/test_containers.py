@@ -0,0 +1,162 @@
+import pytest
+from orm import connection as cn
+from orm.aggregate import Count, Max
+from conftest import row
+from applications.airline.models import Airline, Airport, Flight, Plane, Route
+from applications.booking.models import Ticket
+
+
+def test_iterator_validates_chunk_size_at_call_site(db):
+    for chunk_size in (0, -1, 1.5):
+        with pytest.raises(ValueError):
+            Airport.filter().iterator(chunk_size)
+        with pytest.raises(ValueError):
+            Airport.filter()[:5].iterator(chunk_size)
+    assert not db.queries()
+
+
+def test_iterator_streams_chunks_through_unbuffered_cursor(db):
+    db.on('FROM Flights', rows=[row(Flight, id=i, airline=1) for i in range(1, 6)])
+    assert [f.id for f in Flight.filter().iterator(chunk_size=2)] == [1, 2, 3, 4, 5]
+    connection, = db.connections
+    assert connection.cursors[-1].kwargs == {'buffered': False}
+
+
+def test_iterator_inside_atomic_reads_through_pinned_connection(db):
+    db.on('FROM Flights', rows=[row(Flight, id=i, airline=1) for i in range(1, 4)])
+    with cn.atomic():
+        Airport.create(name='a', code='A', city='c', country='c')
+        assert [f.id for f in Flight.filter().iterator(chunk_size=2)] == [1, 2, 3]
+    connection, = db.connections  # Uncommitted writes of the block are visible
+    assert connection.cursors[-1].kwargs == {'buffered': True}
+    assert db.statements()[-1] == 'COMMIT' and connection.open
+
+
+def test_iterator_loads_relations_once_per_chunk(db):
+    db.on('FROM Flights', rows=[row(Flight, id=i, airline=i) for i in range(1, 5)])
+    db.on('FROM Airlines', rows=lambda sql, params: [(id, 'c', f'a{id}') for id in params])
+    db.on('FROM Airlines', rows=lambda sql, params: [(id, 'c', f'a{id}') for id in params])
+    names = [f.airline.name for f in Flight.filter().iterator(chunk_size=2)]
+    assert names == ['a1', 'a2', 'a3', 'a4']
+    assert len(db.queries('FROM Airlines')) == 2
+
+
+def test_iterator_streams_projection_rows(db):
+    db.on('FROM Airports', rows=[('A',), ('B',)], columns=['code'])
+    assert list(Airport.filter().values_list('code', flat=True).iterator()) == ['A', 'B']
+
+
+def test_abandoned_stream_discards_connection(db):
+    db.on('FROM Flights', rows=[row(Flight, id=i, airline=1) for i in range(1, 5)])
+    stream = Flight.filter().iterator(chunk_size=1)
+    next(stream)
+    stream.close()  # Connection is left with unread result
+    connection, = db.connections
+    assert not connection.open
+    assert cn.get_pool().stats['checked_out'] == 0
+
+
+def test_prefetch_related_distributes_rows_by_parent_id(db):
+    db.on('FROM Flights', rows=[row(Flight, id=1, airline=1), row(Flight, id=2, airline=1)])
+    db.on('FROM Flight_Route', rows=[
+        (1, *row(Route, id=5, plane=3)), (2, *row(Route, id=5, plane=3)), (2, *row(Route, id=6, plane=4))
+    ])
+    db.on('FROM Planes', rows=[row(Plane, id=3, name='p3'), row(Plane, id=4, name='p4')])
+    first, second = Flight.filter().prefetch_related('routes__plane')
+    assert len(db.queries()) == 3  # Single select per relation of the path
+    assert [r.id for r in first.routes] == [5] and [r.id for r in second.routes] == [5, 6]
+    assert [r.plane.name for r in second.routes] == ['p3', 'p4']
+    assert len(db.queries()) == 3
+    assert db.log[-1][1] == (3, 4)
+
+
+def test_prefetch_related_foreign_key(db):
+    db.on('FROM Flights', rows=[row(Flight, id=1, airline=1), row(Flight, id=2, airline=1)])
+    db.on('FROM Airlines', rows=[(1, 'c', 'a1')])
+    first, second = Flight.filter().prefetch_related('airline')
+    assert first.airline.load() is second.airline.load()
+    assert len(db.queries('FROM Airlines')) == 1
+
+
+def test_values_returns_dicts_with_related_columns(db):
+    db.on('FROM Tickets', rows=[(1, 'USD'), (0, None)])
+    rows = list(Ticket.filter().values('baggage', 'flight__currency'))
+    assert rows == [{'baggage': 1, 'flight__currency': 'USD'}, {'baggage': 0, 'flight__currency': None}]
+    sql, _ = db.log[-1]
+    assert sql.startswith('SELECT Tickets00.baggage AS baggage, Flights10.currency AS flight__currency FROM')
+
+
+def test_values_without_fields_selects_own_columns(db):
+    db.on('FROM Tickets', rows=[(1, 0, 7, 'economy')], columns=['id', 'baggage', 'flight', 'type'])
+    assert list(Ticket.filter().values()) == [{'id': 1, 'baggage': 0, 'flight': 7, 'type': 'economy'}]
+
+
+def test_values_list_row_types(db):
+    db.on('FROM Airports', rows=[('A', 'a')], times=3)
+    assert list(Airport.filter().values_list('code', 'name')) == [('A', 'a')]
+    assert list(Airport.filter().values_list('code', flat=True)) == ['A']
+    named, = Airport.filter().values_list('code', 'name', named=True)
+    assert (named.code, named.name) == ('A', 'a')
+
+
+def test_values_list_arguments_are_validated(db):
+    with pytest.raises(ValueError):
+        Airport.filter().values_list('code', 'name', flat=True)
+    with pytest.raises(ValueError):
+        Airport.filter().values_list('code', flat=True, named=True)
+    with pytest.raises(TypeError):
+        Airport.filter().values(1)
+
+
+def test_only_loads_skipped_fields_of_all_rows_on_first_access(db):
+    db.on('FROM Airports', rows=[(1, 'A'), (2, 'B')])
+    first, second = Airport.filter().only('code')
+    assert db.log[-1][0].startswith('SELECT Airports00.id, Airports00.code FROM')
+    assert first.deferred_fields and first.code == 'A'
+    db.on('FROM Airports WHERE id IN', rows=[(1, 'c1', 'r1', 'n1'), (2, 'c2', 'r2', 'n2')])
+    assert (first.name, second.city) == ('n1', 'c2')
+    (sql, params), = [(sql, params) for sql, params in db.log if 'WHERE id IN' in sql]
+    assert sql.startswith('SELECT id, city, country, name FROM Airports') and params == (1, 2)
+    assert not first.deferred_fields and not first.dirty_fields
+
+
+def test_skipped_fields_are_not_written_by_save(db):
+    db.on('FROM Airports', rows=[(1, 'A', 'a')])
+    airport, = Airport.filter().defer('city', 'country')
+    airport.code = 'B'
+    airport.save()
+    (sql, params), = [(sql, params) for sql, params in db.log if sql.startswith('UPDATE')]
+    assert 'SET Airports.code = %s WHERE' in sql and params == ('B', 1)
+    assert not db.queries('WHERE id IN')  # Skipped fields were not loaded
+
+
+def test_only_and_defer_validate_fields(db):
+    for method, fields in (('only', ()), ('only', ('wrong',)), ('defer', ('id',)), ('only', ('planes__name',))):
+        with pytest.raises(ValueError):
+            getattr(Airline.filter(), method)(*fields)
+
+
+def test_raw_rows_are_tuples_with_column_names(db):
+    db.on('FROM Airports', rows=[(1, 'A'), (2, 'B')], columns=['id', 'code'])
+    result = Airport.raw('SELECT id, code FROM Airports')
+    assert result[0] == (1, 'A') and result.columns == ('id', 'code')
+    assert len(result) == 2 and len(db.queries()) == 1
+    assert not db.connections[0].cursors[-1].kwargs['dictionary']
+
+
+def test_raw_rows_as_dictionaries_on_request(db):
+    db.on('FROM Airports', rows=[{'id': 1, 'code': 'A'}], columns=['id', 'code'])
+    result = Airport.raw('SELECT id, code FROM Airports', dictionary=True)
+    assert list(result) == [{'id': 1, 'code': 'A'}]
+    assert db.connections[0].cursors[-1].kwargs['dictionary']
+
+
+def test_raw_query_format_is_validated(db):
+    with pytest.raises(ValueError):
+        Airport.raw('DELETE FROM Airports')
+
+
+def test_aggregate_builds_dicts_from_cursor_description(db):
+    db.on('FROM Airports', rows=[(3, 'C')], columns=['total', 'last'])
+    assert Airport.filter().aggregate(total=Count('id'), last=Max('code')) == [{'total': 3, 'last': 'C'}]
+    assert not any(cursor.kwargs.get('dictionary') for cursor in db.connections[0].cursors)
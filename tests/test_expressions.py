@@ -0,0 +1,31 @@
+from conftest import row
+from orm.expressions import F
+from applications.airline.models import Flight
+
+
+def executed(db, prefix: str) -> list:
+    return [(sql, params) for sql, params in db.log if sql.startswith(prefix)]
+
+
+def test_filter_compares_columns_on_database_side(db):
+    db.on('EXISTS', rows=[(1,)])
+    assert Flight.filter(business_price__gt=F('economy_price') * 2).exists()
+    (sql, params), = executed(db, 'SELECT EXISTS')
+    assert 'Flights00.business_price > (Flights00.economy_price * %s)' in sql and params == (2,)
+
+
+def test_update_increments_on_database_side(db):
+    Flight.filter(id=1).update(economy_price=F('economy_price') + 10)
+    (sql, params), = executed(db, 'UPDATE')
+    assert 'SET Flights.economy_price = (Flights.economy_price + %s)' in sql and params == (1, 10)
+
+
+def test_save_reads_computed_value_back(db):
+    db.on('FROM Flights', rows=[row(Flight, id=1, airline=1, economy_price=5.0)])
+    flight, = Flight.filter()
+    flight.economy_price = F('economy_price') + 1
+    db.on('SELECT economy_price FROM Flights', rows=[(6.0,)])
+    flight.save()
+    (sql, params), = executed(db, 'UPDATE')
+    assert 'SET Flights.economy_price = (Flights.economy_price + %s) WHERE Flights.id = %s' in sql
+    assert params == (1, 1) and flight.economy_price == 6.0 and not flight.dirty_fields
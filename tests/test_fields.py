@@ -0,0 +1,92 @@
+from conftest import row
+from orm import fields
+from applications.airline.models import Flight, Route
+from applications.booking.models import Ticket
+
+
+def route(id: int, m1_id: int) -> tuple:  # Junction table row joined with route row
+    return (m1_id, *row(Route, id=id, plane=1, departure_point=1, arrival_point=2))
+
+
+def flights(db) -> list:
+    db.on('FROM Flights', rows=[row(Flight, id=1, airline=1), row(Flight, id=2, airline=1)])
+    return list(Flight.filter())
+
+
+def test_many_to_many_loads_sibling_rows_at_once(db):
+    first, second = flights(db)
+    db.on('FROM Flight_Route', rows=[route(5, 1), route(6, 2), route(7, 2)])
+    assert [r.id for r in first.routes] == [5]
+    assert [r.id for r in second.routes] == [6, 7]
+    assert len(db.queries('FROM Flight_Route')) == 1
+
+
+def test_add_after_sibling_batch_load_is_visible(db):
+    first, second = flights(db)
+    db.on('FROM Flight_Route', rows=[route(5, 1), route(6, 2)])
+    list(second.routes)  # Sibling rows batch is selected before the write
+    first.routes.add(Route.row_class(Route, id=99))
+    db.on('FROM Flight_Route', rows=[route(5, 1), route(99, 1)])
+    assert [r.id for r in first.routes] == [5, 99]
+    assert db.queries('INSERT IGNORE INTO Flight_Route')
+
+
+def test_remove_after_sibling_batch_load_is_visible(db):
+    first, second = flights(db)
+    db.on('FROM Flight_Route', rows=[route(5, 1), route(6, 1), route(7, 2)])
+    list(second.routes)
+    first.routes.remove(Route.row_class(Route, id=5))
+    db.on('FROM Flight_Route', rows=[route(6, 1)])
+    assert [r.id for r in first.routes] == [6]
+    assert db.queries('DELETE FROM Flight_Route')
+
+
+def test_set_writes_only_difference(db):
+    first, _ = flights(db)
+    db.on('SELECT route_id FROM Flight_Route', rows=[(5,), (6,)])
+    first.routes.set([Route.row_class(Route, id=6), Route.row_class(Route, id=8)])
+    delete, = [(s, p) for s, p in db.log if s.startswith('DELETE')]
+    insert, = [(s, p) for s, p in db.log if s.startswith('INSERT')]
+    assert delete[1] == (1, 5) and insert[1] == (1, 8)
+    assert [r.id for r in first.routes] == [6, 8]
+
+
+def test_set_reads_current_links_inside_transaction(db):
+    first, _ = flights(db)
+    db.on('FROM Flight_Route', rows=[route(5, 1)])
+    list(first.routes)  # Loaded links miss route 7 linked since then
+    db.on('SELECT route_id FROM Flight_Route', rows=[(5,), (7,)])
+    first.routes.set([Route.row_class(Route, id=5)])
+    statements = db.statements('^(START|SELECT route_id|DELETE|COMMIT)')
+    assert statements[0] == 'START TRANSACTION' and statements[-1] == 'COMMIT'
+    assert statements[1].endswith('FOR UPDATE')
+    delete, = [p for s, p in db.log if s.startswith('DELETE')]
+    assert delete == (1, 7) and not db.queries('INSERT')
+
+
+def test_many_to_many_is_not_selected_until_accessed(db):
+    first, second = flights(db)
+    assert not first.routes.loaded and not db.queries('Flight_Route')
+    db.on('FROM Flight_Route', rows=[route(5, 1)])
+    assert len(first.routes) == 1 and first.routes.loaded
+    assert len(second.routes) == 0
+    assert len(db.queries('Flight_Route')) == 1
+
+
+def test_foreign_keys_of_sibling_rows_are_loaded_together(db, monkeypatch):
+    monkeypatch.setattr(fields, 'SELECT_CHUNK_SIZE', 2)
+    db.on('FROM Tickets', rows=[row(Ticket, id=i, flight=i % 3 + 1, type='economy') for i in range(6)])
+    tickets = list(Ticket.filter())
+    db.on('FROM Flights', rows=lambda sql, params: [row(Flight, id=id, currency=f'c{id}') for id in params], times=2)
+    assert [t.flight.currency for t in tickets] == ['c1', 'c2', 'c3', 'c1', 'c2', 'c3']
+    assert len(db.queries('FROM Flights')) == 2  # Distinct ids in chunks
+
+
+def test_select_related_rows_are_not_selected_again(db):
+    db.on('FROM Tickets', rows=[
+        (*row(Ticket, id=1, flight=7, type='economy'), *row(Flight, id=7, currency='USD', airline=1)),
+        (*row(Ticket, id=2, flight=None, type='economy'), *row(Flight))
+    ])
+    first, second = Ticket.filter().select_related('flight')
+    assert first.flight.currency == 'USD' and second.flight.load() is None
+    assert len(db.queries()) == 1
@@ -0,0 +1,225 @@
+import pytest
+from conftest import row
+from orm import model as mdl, query as qr
+from applications.airline.models import Airport, Flight
+from applications.booking.models import Order, Ticket
+
+
+def test_rows_store_columns_in_slots(db):
+    db.on('FROM Tickets', rows=[row(Ticket, id=1, baggage=0, flight=7, type='economy')])
+    ticket, = Ticket.filter()
+    assert type(ticket) is Ticket.row_class
+    assert not vars(ticket)  # Columns are not kept in instance dict
+    assert ticket.type == 'economy'
+
+
+def test_relation_wrappers_are_created_on_first_access(db):
+    db.on('FROM Tickets', rows=[
+        row(Ticket, id=1, baggage=0, flight=7, type='economy'),
+        row(Ticket, id=2, baggage=0, flight=8, type='economy')
+    ])
+    first, second = Ticket.filter()
+    for ticket in (first, second):  # Slot still holds raw ForeignKey id
+        assert Ticket.row_class.columns['flight'].__get__(ticket) in (7, 8)
+    db.on('FROM Flights', rows=[row(Flight, id=7, currency='USD'), row(Flight, id=8, currency='EUR')])
+    assert first.flight.currency == 'USD'
+    assert Ticket.row_class.columns['flight'].__get__(second) == 8
+    assert second.flight.currency == 'EUR'
+    assert len(db.queries('FROM Flights')) == 1  # Sibling rows are loaded by the same select
+    assert '_cache' not in vars(first.flight)  # No per-wrapper storage
+
+
+def test_assigned_foreign_key_is_loaded_by_itself(db):
+    db.on('FROM Tickets', rows=[row(Ticket, id=1, baggage=0, flight=7, type='economy')])
+    ticket, = Ticket.filter()
+    ticket.flight = 9  # Id not registered in sibling rows loader
+    db.on('FROM Flights', rows=[row(Flight, id=9, currency='GBP')])
+    assert ticket.flight.currency == 'GBP'
+
+
+def test_bulk_upsert_returns_inserted_and_updated_rows(db):
+    db.on('INSERT INTO Airports', rowcount=3, info='Records: 2  Duplicates: 1  Warnings: 0')  # Insert and change
+    db.on('INSERT INTO Airports', rowcount=0)  # Unchanged row, single row statement reports no info
+    rows = [{'code': code, 'name': code.lower()} for code in ('AAA', 'BBB', 'CCC')]
+    assert Airport.bulk_upsert(rows, unique_fields=['code'], batch_size=2) == (1, 1)
+    first, second = db.queries()
+    assert 'ON DUPLICATE KEY UPDATE name = VALUES(name)' in first
+    assert db.log[-3][1] == ('AAA', 'aaa', 'BBB', 'bbb') and db.log[-2][1] == ('CCC', 'ccc')
+
+
+def test_bulk_upsert_counts_unchanged_duplicates_as_not_updated(db):
+    db.on('INSERT INTO Airports', rowcount=2, info='Records: 3  Duplicates: 2  Warnings: 0')
+    rows = [{'code': code, 'name': code.lower()} for code in ('AAA', 'BBB', 'CCC')]
+    assert Airport.bulk_upsert(rows, unique_fields=['code']) == (1, 0)
+
+
+def test_bulk_upsert_validates_fields(db):
+    with pytest.raises(ValueError):
+        Airport.bulk_upsert([{'name': 'a'}], unique_fields=['code'])
+    with pytest.raises(Exception, match='Wrong field'):
+        Airport.bulk_upsert([{'code': 'a', 'wrong': 1}], unique_fields=['code'])
+    with pytest.raises(ValueError, match='not unique'):
+        Airport.bulk_upsert([{'code': 'a', 'city': 'c'}], unique_fields=['city'])
+    assert not db.queries()
+
+
+def test_bulk_create_returns_ids_of_inserted_rows(db):
+    db.on('auto_increment_increment', rows=[(1,)])
+    db.on('INSERT INTO Airports', lastrowid=10)
+    db.on('INSERT INTO Airports', lastrowid=12)
+    rows = [{'code': c, 'name': c, 'city': 'c', 'country': 'c'} for c in ('A', 'B', 'C')]
+    airports = Airport.bulk_create(*rows, batch_size=2)
+    assert [a.id for a in airports] == [10, 11, 12]
+    assert [a.code for a in airports] == ['A', 'B', 'C']
+    assert len(db.queries('INSERT')) == 2 and not db.queries('FROM Airports')
+
+
+def test_bulk_create_ids_follow_auto_increment_step(db):
+    db.on('auto_increment_increment', rows=[(3,)])
+    db.on('INSERT INTO Airports', lastrowid=4)
+    rows = [{'code': c, 'name': c, 'city': 'c', 'country': 'c'} for c in ('A', 'B', 'C')]
+    assert [a.id for a in Airport.bulk_create(*rows)] == [4, 7, 10]
+
+
+def test_bulk_create_returns_given_ids(db):
+    rows = [{'id': i, 'code': c, 'name': c, 'city': 'c', 'country': 'c'} for i, c in ((7, 'A'), (3, 'B'))]
+    airports = Airport.bulk_create(*rows)
+    assert [a.id for a in airports] == [7, 3] and [a.code for a in airports] == ['A', 'B']
+    assert db.queries() == db.queries('INSERT')  # No auto increment step lookup
+
+
+def test_bulk_create_batches_are_bounded_by_values_size(db, monkeypatch):
+    monkeypatch.setattr(mdl, 'INSERT_BATCH_BYTES', 10)
+    rows = [{'code': c, 'name': c * 4, 'city': 'c', 'country': 'c'} for c in ('A', 'B', 'C')]
+    Airport.bulk_create(*rows, return_instances=False)  # 7 characters per row
+    assert [len(params) for sql, params in db.log if sql.startswith('INSERT')] == [4, 4, 4]
+    monkeypatch.setattr(mdl, 'INSERT_BATCH_BYTES', 14)
+    db.on('INSERT INTO Airports', info='Records: 2  Duplicates: 0  Warnings: 0')
+    Airport.bulk_upsert(rows, unique_fields=['code'])
+    assert [len(params) for sql, params in db.log if sql.startswith('INSERT')][3:] == [8, 4]
+
+
+def test_bulk_create_selects_database_defaults_by_ids(db):
+    db.on('auto_increment_increment', rows=[(1,)])
+    db.on('INSERT INTO Flights', lastrowid=1)
+    flights = Flight.bulk_create({'airline': 1}, {'airline': 2}, fetch_defaults=True)
+    db.on('FROM Flights', rows=[row(Flight, id=1, airline=1, currency='USD'), row(Flight, id=2, airline=2)])
+    assert [f.currency for f in flights] == ['USD', None]
+    assert db.log[-1][1] == (1, 2)
+
+
+def test_bulk_create_without_instances_skips_increment_lookup(db):
+    assert Airport.bulk_create({'code': 'A', 'name': 'A'}, {'code': 'B', 'name': 'B'}, return_instances=False) is None
+    assert db.queries() == [db.queries('INSERT')[0]]
+
+
+def test_create_builds_instance_from_lastrowid(db):
+    db.on('INSERT INTO Airports', lastrowid=42)
+    airport = Airport.create(name='a', code='A', city='c', country='c')
+    assert (airport.id, airport.code) == (42, 'A')
+    assert db.queries() == db.queries('INSERT')  # Row is not selected back
+
+
+def test_create_selects_database_defaults_by_id(db):
+    db.on('INSERT INTO Flights', lastrowid=5)
+    db.on('FROM Flights', rows=[row(Flight, id=5, airline=1, currency='USD')])
+    flight = Flight.create(fetch_defaults=True, airline=1)
+    assert (flight.id, flight.currency) == (5, 'USD')
+    (_, params), = [(sql, params) for sql, params in db.log if 'FROM Flights' in sql]
+    assert params[0] == 5  # Primary key lookup
+
+
+def test_create_does_not_fetch_defaults_unless_asked(db):
+    flight = Flight.create(airline=1)  # Omitted columns are left None
+    assert flight.currency is None and db.queries() == db.queries('INSERT')
+    db.on('auto_increment_increment', rows=[(1,)])
+    flights = Flight.bulk_create({'airline': 1}, {'airline': 2})
+    assert [f.currency for f in flights] == [None, None]
+    assert not db.queries('FROM Flights')
+
+
+def airports(db, count: int) -> list:
+    db.on('FROM Airports', rows=[row(Airport, id=i, name=f'n{i}', code=f'c{i}') for i in range(1, count + 1)])
+    return list(Airport.filter())
+
+
+def test_bulk_update_writes_batches_of_case_statements(db):
+    items = airports(db, 3)
+    for airport in items:
+        airport.city = f'city{airport.id}'
+    db.on('UPDATE Airports', rowcount=2)
+    db.on('UPDATE Airports', rowcount=1)
+    assert Airport.bulk_update(items, ['city'], batch_size=2) == 3
+    first, second = [(sql, params) for sql, params in db.log if sql.startswith('UPDATE')]
+    assert 'city = CASE id WHEN %s THEN %s WHEN %s THEN %s END WHERE id IN (%s, %s)' in first[0]
+    assert first[1] == (1, 'city1', 2, 'city2', 1, 2) and second[1] == (3, 'city3', 3)
+    assert not any(airport.dirty_fields for airport in items)
+
+
+def test_bulk_update_validates_arguments(db):
+    items = airports(db, 1)
+    with pytest.raises(TypeError):
+        Flight.bulk_update(items, ['currency'])
+    with pytest.raises(ValueError):
+        Airport.bulk_update(items, [])
+    with pytest.raises(Exception, match='Wrong field'):
+        Airport.bulk_update(items, ['id'])
+    assert not db.queries('UPDATE')
+
+
+def test_save_writes_only_changed_columns(db):
+    airport, = airports(db, 1)
+    airport.save()
+    assert not db.queries('UPDATE')  # Nothing changed
+    airport.city = 'x'
+    assert airport.dirty_fields == ['city']
+    airport.save()
+    (sql, params), = [(sql, params) for sql, params in db.log if sql.startswith('UPDATE')]
+    assert 'SET Airports.city = %s WHERE' in sql and params == ('x', 1)
+    assert airport.dirty_fields == []
+    airport.save()
+    assert len(db.queries('UPDATE')) == 1
+
+
+def test_save_update_fields_are_written_regardless_of_changes(db):
+    airport, = airports(db, 1)
+    airport.save(update_fields=['name'])
+    assert db.log[-2][1] == ('n1', 1)
+    with pytest.raises(Exception, match='Wrong field'):
+        airport.save(update_fields=['id'])
+
+
+def test_foreign_key_assignment_is_tracked_by_id(db):
+    db.on('FROM Tickets', rows=[row(Ticket, id=1, baggage=0, flight=7, type='economy')])
+    ticket, = Ticket.filter()
+    ticket.flight  # Wrapping raw id does not make field dirty
+    assert ticket.dirty_fields == []
+    ticket.flight = 8
+    assert ticket.dirty_fields == ['flight']
+
+
+def plan_row(plan, **values) -> tuple:  # Row in plan column order, values keyed by '<path>__<name>'
+    return tuple(values.get(f'{path}__{name}' if path else name) for path, name in plan.columns)
+
+
+def test_hydration_plan_builds_nested_select_related_rows(db):
+    queryset = Order.filter().select_related('ticket__flight')
+    plan = qr.prepare_query(*queryset.as_subquery())[0].plan
+    assert plan is qr.prepare_query(*Order.filter().select_related('ticket__flight').as_subquery())[0].plan
+    assert [path for path, *_ in plan.instances] == ['', 'ticket', 'ticket__flight']
+    db.on('FROM Orders', rows=[
+        plan_row(plan, id=1, state='created', ticket=2, ticket__id=2, ticket__flight=3,
+                 ticket__flight__id=3, ticket__flight__currency='USD'),
+        plan_row(plan, id=2, state='closed', ticket=4, ticket__id=4)  # LEFT JOIN found no flight
+    ])
+    first, second = queryset
+    assert first.ticket.flight.currency == 'USD' and first.state == 'created'
+    assert second.ticket.id == 4 and second.ticket.flight.load() is None
+    assert len(db.queries()) == 1
+
+
+def test_hydration_plan_keeps_annotated_columns(db):
+    plan = qr.HydrationPlan(Airport, [('', 'id'), ('', 'code'), (None, 'total')])
+    airport = mdl.ModelInstance.hydrate(plan, (1, 'A', 10))
+    assert (airport.id, airport.code, airport.total) == (1, 'A', 10)
+    assert airport.dirty_fields == []
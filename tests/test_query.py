@@ -0,0 +1,105 @@
+import pytest
+from conftest import row
+from orm import query as qr
+from orm.expressions import OuterRef
+from applications.airline.models import Airport, Flight
+from applications.booking.models import Ticket
+
+
+@pytest.fixture(autouse=True)
+def compiled_queries():
+    qr.compiled_queries.clear()
+    yield qr.compiled_queries
+    qr.compiled_queries.maxsize = 512
+
+
+def sql(queryset) -> tuple:
+    model, query = queryset.as_subquery()
+    return qr.assemble_query(model, query)
+
+
+def test_same_shape_is_compiled_once(compiled_queries):
+    first_sql, first_params = sql(Airport.filter(code='A', city='x'))
+    second_sql, second_params = sql(Airport.filter(code='B', city='y'))
+    assert first_sql == second_sql
+    assert sorted(first_params) == ['A', 'x'] and sorted(second_params) == ['B', 'y']
+    assert compiled_queries.stats['misses'] == 1 and compiled_queries.stats['hits'] == 1
+
+
+def test_different_shapes_are_compiled_separately(compiled_queries):
+    sql(Airport.filter(code='A'))
+    sql(Airport.filter(code__in=['A', 'B']))
+    sql(Airport.filter(code='A').order_by('name'))
+    sql(Flight.filter(id=1))
+    assert compiled_queries.stats['misses'] == 4
+    in_sql, params = sql(Airport.filter(code__in=['A', 'B', 'C']))  # List length is bound with values
+    assert compiled_queries.stats['misses'] == 4
+    assert in_sql.count('%s') == 3 and tuple(params) == ('A', 'B', 'C')
+
+
+def test_compiled_queries_are_bounded(compiled_queries):
+    compiled_queries.maxsize = 2
+    for name in ('name', 'code', 'city'):
+        sql(Airport.filter(**{name: 'x'}))
+    assert compiled_queries.stats['size'] == 2
+    sql(Airport.filter(name='x'))  # Least recently used shape was evicted
+    assert compiled_queries.stats['misses'] == 4
+
+
+def test_like_values_are_escaped():
+    sql_text, params = sql(Airport.filter(name__contains='50%_off'))
+    assert tuple(params) == ('%50\\%\\_off%',)
+
+
+def test_queryset_in_lookup_compiles_into_subquery(db):
+    list(Ticket.filter(flight__in=Flight.filter(currency='USD')))
+    (sql, params), = [(sql, params) for sql, params in db.log if 'FROM Tickets' in sql]
+    assert 'WHERE Tickets00.flight IN (SELECT Flights00.id FROM Flights AS Flights00 WHERE ' in sql
+    assert params == ('USD',) and len(db.queries()) == 1  # Subquery is not executed by itself
+
+
+def test_sliced_subquery_is_wrapped_into_derived_table(db):
+    list(Ticket.filter(flight__in=Flight.filter(currency='USD')[:5]))
+    (sql, params), = [(sql, params) for sql, params in db.log if 'FROM Tickets' in sql]
+    assert 'IN (SELECT Flights00.id FROM (SELECT Flights00.id FROM Flights' in sql and params == ('USD', 5)
+
+
+def test_exists_references_outer_row(db):
+    list(Flight.filter(qr.Exists(Ticket.filter(flight=OuterRef('id'), type='business'))))
+    sql, params = db.log[-1]
+    assert 'WHERE EXISTS (SELECT Tickets00.id FROM Tickets AS Tickets00 WHERE (Tickets00.flight = Flights00.id)' in sql
+    assert params == ('business',)
+
+
+def test_subquery_must_select_one_field(db):
+    with pytest.raises(ValueError):
+        sql(Ticket.filter(flight__in=Flight.filter().values('id', 'currency')))
+
+
+@pytest.fixture
+def in_lists():
+    yield qr.configure_in_lists
+    qr.configure_in_lists()
+
+
+def test_long_in_list_is_split_into_chunks(db, in_lists):
+    in_lists(2, 'chunk')
+    db.on('FROM Airports', rows=lambda sql, params: [row(Airport, id=id) for id in params], times=None)
+    assert [a.id for a in Airport.filter(id__in=[1, 2, 2, 3, 4, 5])] == [1, 2, 3, 4, 5]
+    assert [params for sql, params in db.log] == [(1, 2), (3, 4), (5,)]
+
+
+def test_ordered_query_uses_temporary_table(db, in_lists):
+    in_lists(2, 'chunk')  # Chunks results could not be merged keeping the order
+    list(Airport.filter(id__in=[1, 2, 3]).order_by('name'))
+    create, insert, select, drop = db.log
+    assert create[0].startswith('CREATE TEMPORARY TABLE orm_in_') and insert[1] == (1, 2, 3)
+    assert 'Airports00.id IN (SELECT id FROM orm_in_' in select[0] and select[1] == ()
+    assert drop[0].startswith('DROP TEMPORARY TABLE IF EXISTS orm_in_')
+
+
+def test_in_list_policy_is_validated(in_lists):
+    with pytest.raises(ValueError):
+        in_lists(0)
+    with pytest.raises(ValueError):
+        in_lists(10, 'unknown')
@@ -0,0 +1,36 @@
+from orm import schema as sch, model as mdl
+from applications.airline.models import Airport, Route
+
+
+def test_tables_are_listed_once_per_process(db):
+    sch.registry.reset()
+    db.on('SHOW TABLES', rows=[('Airports',)])
+    list(Airport.filter())
+    list(Airport.filter())
+    Airport.get(id=1)
+    assert len(db.queries('SHOW TABLES')) == 1
+    assert not db.queries('CREATE TABLE')
+
+
+def test_missing_table_is_created_once(db):
+    sch.registry.reset()
+    db.on('SHOW TABLES', rows=[('Planes',)])
+    list(Route.filter())
+    list(Route.filter())
+    assert [sql.split()[5] for sql in db.queries('CREATE TABLE')] == ['Airports', 'Routes']
+    assert sch.registry.known('Routes')
+
+
+def test_create_all_verifies_every_model(db):
+    sch.registry.reset()
+    db.on('SHOW TABLES', rows=[])
+    mdl.Model.create_all()
+    assert len(db.queries('SHOW TABLES')) == 1
+    assert {'Airports', 'Flights', 'Tickets', 'Orders', 'Users'} <= sch.registry.tables
+
+
+def test_dropped_table_is_verified_again(db):
+    Airport.drop()
+    assert not sch.registry.known('Airports')
+    list(Airport.filter())
+    assert db.queries('CREATE TABLE IF NOT EXISTS Airports')
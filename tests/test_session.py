@@ -0,0 +1,55 @@
+from conftest import row
+from orm import connection as cn, session as ses
+from applications.airline.models import Airport, Flight
+from applications.booking.models import Ticket
+
+
+def test_session_returns_same_instance_for_same_row(db):
+    with ses.session() as identity:
+        db.on('FROM Tickets', rows=[row(Ticket, id=1, flight=7, type='economy')], times=2)
+        first, = Ticket.filter()
+        second, = Ticket.filter(type='economy')
+        assert first is second and (Ticket, 1) in identity
+    assert ses.current() is None
+
+
+def test_session_skips_select_of_known_rows(db):
+    with ses.session():
+        db.on('FROM Flights', rows=[row(Flight, id=7, currency='USD')])
+        flight, = Flight.filter()
+        db.on('FROM Tickets', rows=[row(Ticket, id=1, flight=7, type='economy')])
+        ticket, = Ticket.filter()
+        assert ticket.flight.load() is flight
+        assert len(db.queries('FROM Flights')) == 1
+
+
+def test_deleted_row_is_forgotten(db):
+    with ses.session() as identity:
+        db.on('FROM Tickets', rows=[row(Ticket, id=1, flight=7, type='economy')])
+        ticket, = Ticket.filter()
+        ticket.delete()
+        assert (Ticket, 1) not in identity
+
+
+def test_atomic_block_with_identity_map(db):
+    with cn.atomic(identity_map=True):
+        assert ses.current() is not None
+    assert ses.current() is None
+
+
+def test_upsert_refreshes_session_rows(db):
+    with ses.session():
+        db.on('FROM Airports', rows=[row(Airport, id=1, name='Old', code='AAA', city='c', country='c')])
+        before, = Airport.filter()
+        Airport.bulk_upsert([{'code': 'AAA', 'name': 'New'}], unique_fields=['code'])
+        db.on('FROM Airports', rows=[row(Airport, id=1, name='New', code='AAA', city='c', country='c')])
+        after, = Airport.filter()
+        assert after is not before and after.name == 'New'
+
+
+def test_drop_forgets_session_rows(db):
+    with ses.session() as identity:
+        db.on('FROM Airports', rows=[row(Airport, id=1, name='a', code='AAA', city='c', country='c')])
+        list(Airport.filter())
+        Airport.drop()
+        assert (Airport, 1) not in identity